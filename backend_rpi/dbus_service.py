@@ -1,5 +1,8 @@
 #!/usr/bin/python
 """Receiver related functionality."""
+import logging
+import os
+
 import dbus
 import dbus.service
 import dbus.glib
@@ -15,11 +18,18 @@ SERVICE_IFACE = 'food.fhth.TestInterface'
 # SERVICE_DOMAIN = 'sub.domain.tld'
 SERVICE_DOMAIN = 'food.fhth'
 
+# 레벨은 환경변수 FHTH_LOG_LEVEL (기본 INFO). 인자는 lazy formatting 으로 넘김
+logging.basicConfig(level=os.environ.get('FHTH_LOG_LEVEL', 'INFO').upper(),
+                    format='%(levelname).1s %(name)s: %(message)s')
+log = logging.getLogger('dbus_service')
+
+# address 가 빈 문자열이면 모든 급식기
 def amount_changed_cb(iface, changed_props, invalidated_props):
-    print(changed_props)
+    log.info("amount changed: %s (%s)", changed_props.get('amount'),
+             changed_props.get('address') or 'all')
 
-def action_activated_cb():
-    print("action callback")
+def action_activated_cb(address=''):
+    log.info("action activated (%s)", address or 'all')
 
 class Test(dbus.service.Object):
     """Reciever test class."""
@@ -37,52 +47,46 @@ class Test(dbus.service.Object):
     #     print("foo method activated")
     #     return 'Foo'
 
-    @dbus.service.method(SERVICE_IFACE)
-    def activate_action(self):
-        print("action method activated")
-        self.ActionActivated()
+    @dbus.service.method(SERVICE_IFACE, in_signature='s')
+    def activate_action(self, address):
+        log.debug("activate_action called: %s", address)
+        self.ActionActivated(address)
         return 'action'
 
-    @dbus.service.method(SERVICE_IFACE, in_signature='s')
-    def set_amount(self, amount):
-        print("amount method activated")
-        print(amount)
-        self.AmountChanged(SERVICE_IFACE, {'amount': amount}, [])
+    @dbus.service.method(SERVICE_IFACE, in_signature='ss')
+    def set_amount(self, address, amount):
+        log.debug("set_amount called: %s %s", address, amount)
+        self.AmountChanged(SERVICE_IFACE, {'amount': amount, 'address': address}, [])
         return 'amount'
 
     @dbus.service.signal(SERVICE_IFACE,signature='sa{sv}as')
     def AmountChanged(self, interface, changed, invalidated):
-        print(changed)
-        print(changed['amount'])
+        pass
 
-    @dbus.service.signal(SERVICE_IFACE)
-    def ActionActivated(self):
-        print("action signal")
+    @dbus.service.signal(SERVICE_IFACE, signature='s')
+    def ActionActivated(self, address):
+        pass
 
 
 def catchall_handler(*args, **kwargs):
     """Catch all handler.
 
     Catch and print information about all singals.
+    Only at DEBUG level, so the arguments are not even formatted at INFO.
     """
-    print('---- Caught signal ----')
-    print('%s:%s\n' % (kwargs['dbus_interface'], kwargs['member']))
-
-    print('Arguments:')
-    for arg in args:
-        print('* %s' % str(arg))
-
-    print("\n")
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+    log.debug('signal %s:%s %s', kwargs['dbus_interface'], kwargs['member'],
+              ', '.join(str(arg) for arg in args))
 
 
 def quit_handler():
     """Signal handler for quitting the receiver."""
-    print('Quitting....')
+    log.info('Quitting....')
     loop.quit()
 
 def test_handler(iface, changed_props, invalidated_props):
-    print("test function")
-    print(changed_props)
+    log.debug("test handler: %s", changed_props)
 
 loop = GObject.MainLoop()
 
@@ -3,6 +3,8 @@ var express = require("express");
 // var bus = DBus.getBus("session");
 var router = express.Router();
 const axios = require("axios");
+// 게이트웨이가 올리는 이벤트에는 ADDR(BLE 주소)가 있지만 여기서는 아직 기기를 구분하지 않음
+// 상태는 급식기/급수기 하나씩만 들고 module_id 2(급식), 1(급수)로만 올림
 var left = 0
 var drink = false
 var iseaten = false
@@ -12,13 +14,13 @@ router.get("/", function (req, res, next) {
   res.send("HELLO JBJ");
 });
 
-//set_amount 제어
+//set_amount 제어 (body.address 가 없으면 모든 급식기)
 router.post("/feedcontrol", async function (req, res, next) {
   bus.getInterface("food.fhth","/fhth/food/Test", "food.fhth.TestInterface", function(err, iface) {
     if(err){
       console.log(err)
     }
-    iface.set_amount(req.body.payload)
+    iface.set_amount(req.body.address || "", req.body.payload)
     console.log("success")
     res.send(req.body)
   })
@@ -37,13 +39,13 @@ router.post("/control", async function (req, res, next) {
 });
 
 
-//밥주기 예약 및 밥 주기
+//밥주기 예약 및 밥 주기 (body.address 가 없으면 모든 급식기)
 router.post("/servefood", async function (req, res, next) {
   bus.getInterface("food.fhth","/fhth/food/Test", "food.fhth.TestInterface", function(err, iface) {
     if(err){
       console.log(err)
     }
-    iface.activate_action()
+    iface.activate_action(req.body.address || "")
     console.log("success")
     res.send("success")
   })
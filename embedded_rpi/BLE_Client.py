@@ -8,17 +8,107 @@ try:
   from gi.repository import GLib
 except ImportError:
   import gobject as GObject
+import os
 import sys
-import threading
-import requests
+import signal
+import collections
+import time
 from datetime import datetime
-import rpi_motor
+import motor_proc
+import uploader
+import batcher
+import spool
+import gatt_decoder
+import gatt_index
+import feeder
+import scheduler
+import write_queue
+import logs
+import metrics
+import notify_trace
+import alerts
+import event_bus
+from device_supervisor import DISCOVERING, CONNECTING, RESOLVING, SUBSCRIBED, LOST
+
+log = logs.get_logger('BLE_Client')
+
+# 같은 줄에서 계속 찍히는 로그 제한 (호출 위치별)
+LOG_NOTIFY_SAMPLE = logs.sample(100)
+LOG_SIGNAL_SAMPLE = logs.sample(100)
+
+# GET http://<METRICS_HOST>:METRICS_PORT/metrics (Prometheus text 형식)
+# 기본은 localhost 에서만. 다른 기기에서 scrape 하려면 FHTH_METRICS_HOST=0.0.0.0
+METRICS_HOST = os.environ.get('FHTH_METRICS_HOST', '127.0.0.1')
+METRICS_PORT = 9105
+# notify rate 계산 주기(초)
+METRICS_TICK = 10
+
+NOTIFY_COUNT = metrics.REGISTRY.counter(
+    'fhth_notify_total', 'GATT notifications received', ('uuid', 'name'), rate=True)
+NOTIFY_DECODE = metrics.REGISTRY.histogram(
+    'fhth_notify_decode_seconds', 'notify value decode time', ('name',))
+NOTIFY_CALLBACK = metrics.REGISTRY.histogram(
+    'fhth_notify_callback_seconds', 'notify handler time', ('name',))
+DBUS_METHOD = metrics.REGISTRY.histogram(
+    'fhth_dbus_method_seconds', 'D-Bus method / command handling time',
+    ('service', 'method'))
 
-bus = None
 mainloop = None
-motor = None
+stopping = False        # SIGINT/SIGTERM 받음. 메인 루프가 끝나면 재연결하지 않고 종료
+motor_process = None    # motor_proc.py (I2C 와 motor.fhth D-Bus 서비스는 모터 프로세스에서)
+http_client = None
+upload_queue = None     # HTTP bridge 를 끄면 None
+events = None           # event_bus.EventBus (같은 Pi 안의 소비자는 여기서 바로 받음)
+
+# BlueZ D-Bus 호출과 기기별 타이머(write 재시도, notify echo, 재연결)는 전부 이 객체를 거침
+# main() 은 DbusBackend(GLib + dbus-python), aio_gateway 는 aio_gateway.Backend(asyncio + dbus-next)
+backend = None
+
+# 모터 프로세스 설정 (motor_proc.py). 우선순위는 SCHED_FIFO 1~99
+MOTOR_CHANNEL = 2
+MOTOR_PRIORITY = 50
+
+# 예전 HTTP 업로드(localhost:8079)도 같이 할지. 로컬 소비자가 모두 event bus 로 옮기면 0 으로 끔
+HTTP_BRIDGE = os.environ.get('FHTH_HTTP_BRIDGE', '1') != '0'
+
+# 실행 중에 생기는 파일(spool)을 두는 곳. 기본은 스크립트 옆 (.gitignore 에 등록)
+# Pi 에서는 FHTH_STATE_DIR=/var/lib/fhth 처럼 소스 트리 밖으로 뺌
+STATE_DIR = os.environ.get('FHTH_STATE_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+# 서버가 죽어 있는 동안의 이벤트를 쌓아두는 spool 파일
+SPOOL_PATH = os.path.join(STATE_DIR, 'upload_spool.db')
+SPOOL_MAX_ROWS = 50000
+# 종료할 때 큐에 남은 이벤트/알림을 spool 로 옮기며 기다리는 최대 시간(초)
+UPLOAD_STOP_TIMEOUT = 5.0
+
+# 설정하면 받은 notify 를 모두 이 파일에 녹화함 (testcodes/trace_replay.py 로 재생)
+TRACE_ENV = 'FHTH_TRACE'
+notify_tracer = None
+
+# 급식 스케줄러 (GLib 메인 루프 타이머 하나 + 힙)
+feeding_scheduler = None
+
+# 급식 계획: address 가 None 이면 모든 급식기
+#  interval: 반복 주기(초), delay: 첫 실행까지(초, 없으면 interval)
+#  amount: 급식량 문자열(None 이면 amount 는 안 씀), catchup: scheduler.CATCHUP_*
+# 예) {'address': None, 'interval': 8 * 3600, 'amount': '100'}
+FEEDING_PLANS = []
+
+# write-without-response 로 보낸 write 가 notify echo 로 확인될 때까지 기다리는 시간(초)
+# food_distributor.ino 는 action 을 다음 loop(최대 1초 뒤)에서 읽고 hardware_action() 이 끝나야 '0' 을 notify 함
+# hardware_action 은 servo360(약 1.1초)을 무게가 찰 때까지 반복한 뒤 servo180(약 4.6초)
+# 양에 따라 수십 초 걸리므로 넉넉하게 잡음. 지나도 재시도는 안 하고 '확인 안 됨' 으로 끝냄
+ECHO_TIMEOUT = 60.0
+
+# 남은 사료 양 batching 설정 (10초 또는 100개 단위로 묶어서 보냄)
+FOOD_LEFT_WINDOW = 10
+FOOD_LEFT_MAX_EVENTS = 100
+FOOD_LEFT_MODE = batcher.MODE_LAST
+FOOD_LEFT_EMPTY = 0
 
 BLUEZ_SERVICE_NAME = 'org.bluez'
+# 설정하면 system bus 대신 이 주소의 버스에서 BlueZ 를 찾음 (testcodes/bluez_sim.py)
+BLUEZ_BUS_ENV = 'FHTH_BLUEZ_BUS'
 DBUS_OM_IFACE =      'org.freedesktop.DBus.ObjectManager'
 DBUS_PROP_IFACE =    'org.freedesktop.DBus.Properties'
 
@@ -36,28 +126,38 @@ DRINK_SVC_UUID = '00002230-0000-1000-8000-00805f9b34fb'
 DRINK_CHR_DRINK_UUID = '00002231-0000-1000-8000-00805f9b34fb'
 DRINK_CHR_WATER_UUID = '00002232-0000-1000-8000-00805f9b34fb'
 
-food_device = None
-food_service = None
-food_left_chrc = None
-food_eaten_chrc = None
-food_amount_chrc = None
-food_action_chrc = None
-
-drink_device = None
-drink_service = None
-drink_drink_chrc = None
-drink_water_chrc = None
-
-EATEN_CHANGED_TRG = False
-FOOD_EATEN = True
-FOOD_LEFT = 0
-WATER_LACK = False
-
-# index: SVC number
-uuid_list = [FOOD_SVC_UUID, DRINK_SVC_UUID]
-service_list = [food_service, drink_service]
-device_list = [food_device, drink_device]
-dev_name_list = ["FHTH_FOOD","FHTH_DRINK"]
+# characteristic 별 노이즈 필터 설정 (sensor_filter.SensorFilter 인자)
+# 남은 사료 양은 초음파 거리값이라 1~2 단위로 계속 흔들림
+FILTER_CONFIG = {
+    FOOD_CHR_LEFT_UUID: {'median': 5, 'deadband': 3, 'hysteresis': 2,
+                         'min_interval': 5, 'max_interval': 300},
+}
+
+# 먹는 중 여부 debounce (eaten_state.EatenStateMachine 인자, 초)
+# 먹기 시작은 5초, 먹기 끝은 15초 동안 같은 값이 유지돼야 상태가 바뀜 (notify 는 1초 간격)
+EATEN_CONFIG = {'on_delay': 5, 'off_delay': 15}
+
+# 물 부족 알림 (alerts.Alert 인자, 초)
+# 물 부족 notify 는 1초마다 오지만 서버에는 처음 한 번 + 5분마다 다시 알림만 보냄
+WATER_ALERT_CONFIG = {'reminder': 300}
+
+# 기기 종류: (종류, 이름 prefix, 광고 서비스 UUID)
+# 이름이 prefix 로 시작하거나(FHTH_FOOD, FHTH_FOOD_2 ...) 서비스 UUID 를 광고하면 해당 종류
+DEVICE_KINDS = (
+    (feeder.FOOD, 'FHTH_FOOD', FOOD_SVC_UUID),
+    (feeder.DRINK, 'FHTH_DRINK', DRINK_SVC_UUID),
+)
+SERVICE_UUIDS = {FOOD_SVC_UUID, DRINK_SVC_UUID}
+
+# 연결한 기기들. 이벤트 처리는 기기/UUID 에 묶인 콜백에서 바로 하므로 기기 수와 상관없이 O(1)
+feeders = {}            # BLE 주소 -> feeder.Feeder
+feeder_paths = {}       # 기기 경로 -> feeder.Feeder
+chrc_owner = {}         # chrc 경로 -> (feeder.Feeder, UUID)
+
+CONNECT_TIMEOUT = 15    # 기기별 Connect 타임아웃(초)
+
+# BlueZ 객체 인덱스. 시작할 때 한 번 load 하고 InterfacesAdded/Removed 로 갱신
+object_index = gatt_index.ObjectIndex()
 
 def get_timestamp():
     timestamp = datetime.now()
@@ -78,514 +178,758 @@ FOOD_SERVICE_PATH = '/fhth/food/Test'
 FOOD_SERVICE_IFACE = 'food.fhth.TestInterface'
 FOOD_SERVICE_DOMAIN = 'food.fhth'
 
-MOTOR_SERVICE_PATH = '/fhth/motor/Test'
-MOTOR_SERVICE_IFACE = 'motor.fhth.TestInterface'
-MOTOR_SERVICE_DOMAIN = 'motor.fhth'
-
-def dbus_test(amount):
-    print(type(amount), "amount: ", amount)
+DBUS_INVALID_ARGS = 'org.freedesktop.DBus.Error.InvalidArgs'
 
+# address 가 빈 문자열이면 모든 급식기 (add_feeding 과 같음)
 def amount_changed_cb(iface, changed_props, invalidated_props):
-    print(changed_props)
-    dbus_test(changed_props['amount'])
-    write_food_amount(changed_props['amount'])
-
-def action_activated_cb():
-    print("action callback")
-    if food_action_chrc is not None:
-        write_food_action()
-
-def cmd_handler(iface, changed_props, invalidated_props):
-    print("cmd handler")
-    print(changed_props['cmd'])
-    try:
-        if changed_props['cmd'] == 'go':
-            motor.go()
-        elif changed_props['cmd'] == 'stop':
-            motor.stop()
-        elif changed_props['cmd'] == 'back':
-            motor.back()
-        elif changed_props['cmd'] == 'left':
-            motor.left()
-        elif changed_props['cmd'] == 'right':
-            motor.right()
-        elif changed_props['cmd'] == 'middle':
-            motor.middle()
-    except Exception as e:
-        print(e)
+    address = str(changed_props.get('address', '')) or None
+    log.info("amount changed: %s (%s)", changed_props['amount'], address or 'all')
+    with DBUS_METHOD.labels('WebCommService', 'AmountChanged').time():
+        for f in food_targets(address):
+            if FOOD_CHR_AMOUNT_UUID in f.chrcs:
+                write_food_amount(f, changed_props['amount'])
+
+def action_activated_cb(address=''):
+    address = str(address) or None
+    log.info("action activated (%s)", address or 'all')
+    with DBUS_METHOD.labels('WebCommService', 'ActionActivated').time():
+        for f in food_targets(address):
+            if FOOD_CHR_ACTION_UUID in f.chrcs:
+                write_food_action(f)
 
 
 class WebCommService(dbus.service.Object):
     def __init__(self, bus_name, object_path):
         dbus.service.Object.__init__(self, bus_name, object_path)
 
-    @dbus.service.method(FOOD_SERVICE_IFACE)
-    def activate_action(self):
-        print("action method activated")
-        self.ActionActivated()
+    # address 가 빈 문자열이면 모든 급식기
+    @dbus.service.method(FOOD_SERVICE_IFACE, in_signature='s')
+    def activate_action(self, address):
+        log.debug("activate_action called: %s", address)
+        with DBUS_METHOD.labels('WebCommService', 'activate_action').time():
+            self.ActionActivated(address)
         return 'action'
 
-    @dbus.service.method(FOOD_SERVICE_IFACE, in_signature='s')
-    def set_amount(self, amount):
-        print("amount method activated")
-        print(amount)
-        self.AmountChanged(FOOD_SERVICE_IFACE, {'amount': amount}, [])
+    # 급식 예약: address 가 빈 문자열이면 모든 급식기. 예약 id 리턴
+    @dbus.service.method(FOOD_SERVICE_IFACE, in_signature='sds', out_signature='u')
+    def add_feeding(self, address, interval, amount):
+        log.info("add feeding %s every %s s amount %s", address, interval, amount)
+        with DBUS_METHOD.labels('WebCommService', 'add_feeding').time():
+            try:
+                return add_feeding_plan({'address': str(address) or None,
+                                         'interval': float(interval),
+                                         'amount': str(amount) or None})
+            except ValueError as e:
+                raise dbus.exceptions.DBusException(str(e), name=DBUS_INVALID_ARGS)
+
+    @dbus.service.method(FOOD_SERVICE_IFACE, in_signature='u')
+    def cancel_feeding(self, job_id):
+        log.info("cancel feeding %d", job_id)
+        with DBUS_METHOD.labels('WebCommService', 'cancel_feeding').time():
+            feeding_scheduler.cancel(int(job_id))
+
+    @dbus.service.method(FOOD_SERVICE_IFACE, in_signature='ss')
+    def set_amount(self, address, amount):
+        log.debug("set_amount called: %s %s", address, amount)
+        with DBUS_METHOD.labels('WebCommService', 'set_amount').time():
+            self.AmountChanged(FOOD_SERVICE_IFACE,
+                               {'amount': amount, 'address': address}, [])
         return 'amount'
 
     @dbus.service.signal(FOOD_SERVICE_IFACE,signature='sa{sv}as')
     def AmountChanged(self, interface, changed, invalidated):
-        print(changed)
-        print(changed['amount'])
-
-    @dbus.service.signal(FOOD_SERVICE_IFACE)
-    def ActionActivated(self):
-        print("action signal")
-
-class MotorService(dbus.service.Object):
-    def __init__(self, bus_name, object_path):
-        """Initialize the DBUS service object."""
-        dbus.service.Object.__init__(self, bus_name, object_path)
-
-    @dbus.service.method(MOTOR_SERVICE_IFACE, in_signature='s')
-    def activate_motor(self, cmd):
-        print("motor command input")
-        print(cmd)
-        self.MotorCommand(MOTOR_SERVICE_IFACE, {'cmd': cmd}, [])
-        return 'motor'
-
-    @dbus.service.signal(MOTOR_SERVICE_IFACE,signature='sa{sv}as')
-    def MotorCommand(self, interface, changed, invalidated):
-        print(changed)
-        print(changed['cmd'])
+        pass
 
+    @dbus.service.signal(FOOD_SERVICE_IFACE, signature='s')
+    def ActionActivated(self, address):
+        pass
 
 def catchall_handler(*args, **kwargs):
     """Catch all handler.
 
     Catch and print information about all singals.
+    Only at DEBUG level, so the arguments are not even formatted at INFO.
     """
-    print('---- Caught signal ----')
-    print('%s:%s\n' % (kwargs['dbus_interface'], kwargs['member']))
-
-    print('Arguments:')
-    for arg in args:
-        print('* %s' % str(arg))
-
-    print("\n")
+    if not log.isEnabledFor(logs.DEBUG):
+        return
+    log.debug('signal %s:%s %s', kwargs['dbus_interface'], kwargs['member'],
+              ', '.join(str(arg) for arg in args), extra=LOG_SIGNAL_SAMPLE)
 
 
 # ===================================================
 
-def post_data(data, api):
-    PORT = 3000
-    url = 'http://localhost:{PORT}/{API}'.format(PORT=PORT, API=api)
-    try:
-        res = requests.post(url, json=data, headers={})
-        print("Server status: ", res.status_code)
-    except Exception as e:
-        print("Server errors: ", e)
-
-def xor(condition1, condition2):
-    if condition1:
-        return (not condition2)
-    else:
-        return condition2
+# 실제 전송은 upload_queue 워커 스레드에서 함. 콜백은 큐에 넣고 바로 리턴
+# urgent: 알림. 밀린 일반 이벤트 뒤에 줄 서지 않고 우선 lane 으로 바로 보냄
+def post_data(data, api, urgent=False):
+    if upload_queue is not None:
+        upload_queue.put(data, api, urgent)
+
+# 로컬 event bus 로 보냄. 구독자가 없으면 인코딩도 안 하고 바로 리턴
+def publish(topic, f, *values):
+    if events is not None:
+        events.publish(topic, f.address, *values)
+
+def make_food_left_sender(f):
+    def send(data):
+        data['ADDR'] = f.address
+        post_data(data, 'pet/foodleft')
+    return send
+
+def food_feeders():
+    return [f for f in feeders.values() if f.kind == feeder.FOOD]
+
+# address 가 None 이면 연결된 모든 급식기, 아니면 그 급식기 하나 (없거나 급식기가 아니면 빈 목록)
+def food_targets(address):
+    if address is None:
+        return food_feeders()
+    f = feeders.get(address)
+    if f is None or f.kind != feeder.FOOD:
+        log.warning("no food feeder %s", address)
+        return []
+    return [f]
+
+# 상태 변화(먹음, 물 부족 등)를 보내기 전에 그 기기에 모아둔 남은 양도 먼저 보냄
+def flush_batches(f):
+    if f.batcher is not None:
+        f.batcher.flush()
+
+def poll_batches():
+    for f in feeders.values():
+        if f.batcher is not None:
+            f.batcher.poll()
+    return True
+
+# scrape 할 때 호출되는 게이지 값들 (메트릭 HTTP 스레드에서 읽기만 함)
+def upload_samples():
+    if upload_queue is None:
+        return []
+    samples = [(('queue',), upload_queue.depth())]
+    if upload_queue.spool is not None:
+        samples.append((('spool',), len(upload_queue.spool)))
+    return samples
+
+DEVICE_STATES = (DISCOVERING, CONNECTING, RESOLVING, SUBSCRIBED, LOST)
+
+def device_state_samples():
+    for f in list(feeders.values()):
+        current = f.supervisor.state
+        for state in DEVICE_STATES:
+            yield (f.address, f.name, f.kind, state), int(state == current)
+
+metrics.REGISTRY.gauge_func('fhth_upload_pending', 'events waiting to be uploaded',
+                            upload_samples, ('where',))
+metrics.REGISTRY.gauge_func('fhth_device_state', 'device connection state (1 = current)',
+                            device_state_samples, ('address', 'name', 'kind', 'state'))
+
+def print_stats():
+    if notify_tracer is not None:
+        notify_tracer.flush()
+        log.info("trace: %d events", notify_tracer.events)
+    if upload_queue is not None:
+        log.info("upload stats: %s", upload_queue.stats())
+    if events is not None:
+        log.info("event bus stats: %s", events.stats())
+    log.info("scheduler stats: %s", feeding_scheduler.stats())
+    for f in feeders.values():
+        log.info("device stats: %s %s", f, f.stats())
+    return True
 
 # callbacks
-def generic_error_cb(error):
-    print('D-Bus call failed: ' + str(error))
-    mainloop.quit()
+# 새 BlueZ 객체가 생겼을 때 (기기 발견, 연결 후 서비스/char resolve)
+# 전체를 다시 GetManagedObjects 하지 않고 들어온 객체만 처리함
+def interfaces_added_cb(object_path, interfaces):
+    path = str(object_path)
+    object_index.add(path, interfaces)
+
+    if DEVICE_IFACE in interfaces:
+        connect_device(path, interfaces[DEVICE_IFACE])
+
+    # 연결된 기기의 서비스/char 만 처리. 연결 전이면 connect reply 때 처리됨
+    f = feeder_paths.get(device_of(path))
+    if f is None or f.supervisor.state not in (RESOLVING, SUBSCRIBED):
+        return
+
+    if GATT_SERVICE_IFACE in interfaces:
+        process_service(f, path, object_index.children(path, GATT_CHRC_IFACE))
+    if GATT_CHRC_IFACE in interfaces:
+        svc_props = object_index.props(object_index.parent(path),
+                                       GATT_SERVICE_IFACE)
+        if svc_props is not None and svc_props['UUID'] in SERVICE_UUIDS:
+            process_chrc(f, path, svc_props['UUID'])
+
+    # 새로 등록된 char 가 있으면 바로 구독
+    for chrc_path in [path] + object_index.children(path, GATT_CHRC_IFACE):
+        owner = chrc_owner.get(chrc_path)
+        if owner is not None:
+            subscribe_chrc(*owner)
 
 # 연결 끊겼을 때 remove callback
 def interfaces_removed_cb(object_path, interfaces):
-    print("interfaces removed callback")
-    print(object_path)
-    print(interfaces)
+    log.debug("interfaces removed: %s %s", object_path, list(interfaces))
+    path = str(object_path)
+    object_index.remove(path, interfaces)
+
+    # 기기 자체가 사라지면 다시 발견(InterfacesAdded)될 때까지 기다림
+    f = feeder_paths.get(path)
+    if f is not None and DEVICE_IFACE in interfaces:
+        f.unsubscribe()
+        cancel_reconnect(f)
+        f.supervisor.set_state(DISCOVERING)
+
+    # 사라진 char 는 등록/구독 해제
+    if GATT_CHRC_IFACE in interfaces:
+        owner = chrc_owner.pop(path, None)
+        if owner is not None:
+            f, uuid = owner
+            f.chrcs.pop(uuid, None)
+            match = f.notify_matches.pop(uuid, None)
+            if match is not None:
+                match.remove()
 
 # registration callbacks
-def food_left_start_notify_cb():
-    print('FOOD-LEFT notifications enabled')
-
-def food_eaten_start_notify_cb():
-    print('FOOD-EATEN notifications enabled')
-
-def food_amount_start_notify_cb():
-    print('FOOD-AMOUNT notifications enabled')
-
-def food_action_start_notify_cb():
-    print('FOOD-ACTION notifications enabled')
-
-def drink_drink_start_notify_cb():
-    print('DRINK-DRINK notifications enabled')
-
-def drink_water_start_notify_cb():
-    print('DRINK-WATER notifications enabled')
-
-# write callback (제대로 write 됐는지 확인용)
-def write_cb():
-    print("Write complete")
+def make_start_notify_cb(f, name):
+    def start_notify_cb():
+        log.info("%s %s notifications enabled", f.name, name)
+        if f.supervisor.state == RESOLVING:
+            f.supervisor.set_state(SUBSCRIBED)
+    return start_notify_cb
+
+def make_start_notify_error_cb(f, name):
+    def start_notify_error_cb(error):
+        log.warning("%s %s notifications failed: %s", f.name, name, error)
+        device_lost(f)
+    return start_notify_error_cb
+
+# write 는 기기별 write_queue 로 보냄: 한 번에 하나씩, 실패하면 backoff 후 재시도
+# 완료/실패는 메인 루프를 멈추지 않고 write_done_cb 에서 결과만 출력
+#
+# CHRC_TABLE 의 write_type 이 'command' 인 char 는 write-without-response 로 보냄
+# (응답 기다리는 연결 이벤트 왕복이 없음). BlueZ reply 는 보낼 큐에 넣었다는 뜻일 뿐이라
+# 그 char 의 notify echo 가 와야 완료로 봄
+#  - WriteValue 자체가 실패하면 실패. CHRC_TABLE 의 retry 가 True 인 char 만 write_queue 가 재시도
+#    (NoReply 나 연결 끊김은 기기에 이미 갔을 수 있음. 급식 명령은 두 번 가면 사료가 두 번 나옴)
+#  - ECHO_TIMEOUT 안에 echo 가 안 오면 write_queue.Unconfirmed 로 끝냄 (재시도 안 함)
+# 아래 경우는 일반(request) write 로 보냄
+#  - char Flags 에 write-without-response 가 없음 (지금 펌웨어는 PROPERTY_WRITE 만 선언)
+#  - notify 구독이 안 돼서 echo 를 받을 수 없음
+def use_write_command(f, uuid):
+    if CHRC_TABLE[uuid].write_type != 'command' or uuid not in f.notify_matches:
+        return False
+    return 'write-without-response' in f.chrcs[uuid][1].get('Flags', ())
+
+def issue_write(f, uuid, value, reply_handler, error_handler):
+    chrc = f.chrcs[uuid][0]
+    if use_write_command(f, uuid):
+        backend.write_value(chrc, value, True, lambda: None,
+                            lambda error: resolve_echo(f, uuid, error))
+        expect_echo(f, uuid, reply_handler, error_handler)
+        return
+    backend.write_value(chrc, value, False, reply_handler, error_handler)
+
+def expect_echo(f, uuid, reply_handler, error_handler):
+    source = backend.timeout_add(int(ECHO_TIMEOUT * 1000), echo_timeout, f, uuid)
+    f.echoes[uuid] = (reply_handler, error_handler, source)
+
+def echo_timeout(f, uuid):
+    pending = f.echoes.pop(uuid, None)
+    if pending is not None:
+        f.late_echoes[uuid] = time.monotonic()
+        pending[1](write_queue.Unconfirmed('no notify echo in %.0f s' % ECHO_TIMEOUT))
+    return False
+
+# notify echo 가 오면 error=None, WriteValue 자체가 실패하면 error 로 끝냄
+def resolve_echo(f, uuid, error=None):
+    pending = f.echoes.pop(uuid, None)
+    if pending is None:
+        timed_out = f.late_echoes.pop(uuid, None)
+        if timed_out is not None and error is None:
+            log.warning("%s %s notify echo came %.1f s after the write was reported unconfirmed",
+                        f.name, CHRC_TABLE[uuid].name, time.monotonic() - timed_out)
+        return
+    reply_handler, error_handler, source = pending
+    backend.source_remove(source)
+    if error is None:
+        reply_handler()
+    else:
+        error_handler(error)
+
+def make_write_queue(f):
+    return write_queue.WriteQueue(f.name,
+                                  lambda *args: issue_write(f, *args),
+                                  lambda *args: backend.timeout_add(*args))
+
+def make_write_done_cb(f, uuid):
+    name = CHRC_TABLE[uuid].name
+    def write_done_cb(req):
+        if isinstance(req.error, write_queue.Unconfirmed):
+            log.warning("%s %s write unconfirmed (not retried): %s", f.name, name, req.error)
+        elif req.error is not None and not req.retry:
+            log.error("%s %s write failed (not retried): %s", f.name, name, req.error)
+        elif req.error is not None:
+            log.error("%s %s write failed after %d attempts: %s",
+                      f.name, name, req.attempts, req.error)
+        else:
+            log.info("%s %s write complete (%.3f s, %d attempts)",
+                     f.name, name, req.latency, req.attempts)
+    return write_done_cb
+
+# callback(req) 는 write 가 끝나면 호출됨 (req.error 가 None 이면 성공)
+def write_chrc(f, uuid, value, callback=None):
+    entry = CHRC_TABLE[uuid]
+    req = f.writes.submit(uuid, value, coalesce=entry.coalesce, retry=entry.retry,
+                          callback=make_write_done_cb(f, uuid))
+    if callback is not None:
+        req.add_done_callback(callback)
+    return req
 
 ## write 함수는 AWS->RPi Backend 에서 값을 받아서 write해야 되는 상황
 # 항상 True('1') 값만 보내 하드웨어 동작하게 함
-def write_food_action():
-    global FOOD_EATEN
-    # 테스트용 코드: 먹었든 먹지 않았든 일단 write 되는 것 확인용
-    # print("write")
-    # str_value = bytes('1'.encode())
-    # food_action_chrc[0].WriteValue(str_value, {}, reply_handler=write_cb,
-    #                                  error_handler=generic_error_cb,
-    #                                  dbus_interface=GATT_CHRC_IFACE)
-
+def write_food_action(f, callback=None):
     # FOOD를 먹었을 경우에만 새로 급식
-    if FOOD_EATEN:
-        print("write")
-        str_value = bytes('1'.encode())
-        food_action_chrc[0].WriteValue(str_value, {}, reply_handler=write_cb,
-                                         error_handler=generic_error_cb,
-                                         dbus_interface=GATT_CHRC_IFACE)
-        FOOD_EATEN = False
-
-def write_food_amount(amount):
-
-    print("write")
+    if f.food_eaten:
+        log.debug("%s write action", f.name)
+        f.food_eaten = False
+        return write_chrc(f, FOOD_CHR_ACTION_UUID, bytes('1'.encode()), callback)
+
+# 아직 안 보낸 amount write 가 있으면 값만 바뀜 (마지막 값이 이김)
+def write_food_amount(f, amount, callback=None):
+    log.debug("%s write amount %s", f.name, amount)
     # write는 string으로 보냄
-    # str_value = bytes(str(amount).encode())
-    str_value = bytes(amount.encode())
-    food_amount_chrc[0].WriteValue(str_value, {}, reply_handler=write_cb,
-                                     error_handler=generic_error_cb,
-                                     dbus_interface=GATT_CHRC_IFACE)
+    return write_chrc(f, FOOD_CHR_AMOUNT_UUID, bytes(amount.encode()), callback)
 
 
 # notify callbacks
-# 음식 먹었는지 여부 notify 오면 해당 값 전역 변수에 저장
-# 나중에 action 값 쓸 때 해당 변수가 True 일 때만 action 보냄
-def food_eaten_changed_cb(iface, changed_props, invalidated_props):
-    global FOOD_EATEN, EATEN_CHANGED_TRG
-    print("eaten notify callback")
-    if iface != GATT_CHRC_IFACE:
-        return
-
-    if not len(changed_props):
-        return
-
-    value = changed_props.get('Value', None)
-    if not value:
-        return
-
-    print("decoded value: %s" % [bytes([v]).decode() for v in value])
-    strr = [bytes([v]).decode() for v in value]
-    CUR_STATE = None
-
-    if strr[0] == '0':
-        CUR_STATE = False
-    elif strr[0] == '1':
-        CUR_STATE = True
-
-    # if CUR_STATE != None:
-    #     if xor(FOOD_EATEN, CUR_STATE):
-    #         if not FOOD_EATEN:
-    #             FOOD_EATEN = CUR_STATE
-    #         timestamp = get_timestamp()
-    #         data = {'EATEN': FOOD_EATEN, 'DATE': timestamp}
-    #         post_data(data,'pet/foodeat')
-    # print("FOOD:",FOOD_EATEN)
-
-    if CUR_STATE != None:
-        if xor(EATEN_CHANGED_TRG, CUR_STATE):
-            timestamp = get_timestamp()
-            data = {'EATEN': CUR_STATE, 'DATE': timestamp}
-            post_data(data,'pet/foodeat')
-            if EATEN_CHANGED_TRG:
-                EATEN_CHANGED_TRG = False
-            else:
-                EATEN_CHANGED_TRG = True
-                if not FOOD_EATEN:
-                    FOOD_EATEN = CUR_STATE
-
-    print("FOOD:",FOOD_EATEN)
-
-# 남은 음식 양 notify 올 때마다 바로 POST
-# int가 아니라 uint8 4바이트가 와서 일단 맨 앞 인덱스만 POST하게 해 둠
-def food_left_changed_cb(iface, changed_props, invalidated_props):
-    print("left notify callback")
-    if iface != GATT_CHRC_IFACE:
-        return
-
-    if not len(changed_props):
+# PropertiesChanged 시그널을 받아서 CHRC_TABLE 의 디코더로 값을 한 번만 디코딩하고
+# 디코딩된 파이썬 값을 handler(기기, 값) 로 넘겨줌
+def make_notify_cb(f, uuid):
+    entry = CHRC_TABLE[uuid]
+    decoder = entry.decoder
+    handler = entry.handler
+    # 메트릭 자식은 미리 받아 둠 (콜백에서는 락/dict 조회 없음)
+    count = NOTIFY_COUNT.labels(uuid, entry.name).inc
+    decode_time = NOTIFY_DECODE.labels(entry.name).observe
+    callback_time = NOTIFY_CALLBACK.labels(entry.name).observe
+    perf_counter = time.perf_counter
+    chrc = f.chrcs.get(uuid)
+    chrc_path = str(chrc[0].object_path) if chrc is not None else f.path
+
+    def notify_cb(iface, changed_props, invalidated_props):
+        if iface != GATT_CHRC_IFACE:
+            return
+
+        if not len(changed_props):
+            return
+
+        value = changed_props.get('Value', None)
+        if not value:
+            return
+
+        if notify_tracer is not None:
+            notify_tracer.record(chrc_path, uuid, value)
+
+        count()
+
+        if uuid in f.echoes or uuid in f.late_echoes:
+            resolve_echo(f, uuid)
+
+        start = perf_counter()
+        decoded = decoder(value)
+        decoded_at = perf_counter()
+        decode_time(decoded_at - start)
+        log.debug("%s %s: %s", f.name, entry.name, decoded, extra=LOG_NOTIFY_SAMPLE)
+        if decoded is None:
+            return
+        handler(f, decoded)
+        callback_time(perf_counter() - decoded_at)
+    return notify_cb
+
+# 음식 먹었는지 여부 notify 는 기기별 상태 머신으로 debounce 해서 진짜 바뀔 때만 POST
+# 먹기 시작하면 food_eaten 을 True 로: 나중에 action 값 쓸 때 해당 변수가 True 일 때만 action 보냄
+def food_eaten_changed_cb(f, eating):
+    transition = f.eaten_state.update(eating)
+    if transition is None:
         return
-
-    value = changed_props.get('Value', None)
-    if not value:
+    timestamp = get_timestamp()
+    data = {'EATEN': transition.state, 'DATE': timestamp, 'ADDR': f.address,
+            'DWELL': round(transition.dwell, 1)}
+    flush_batches(f)
+    publish(event_bus.FOOD_EATEN, f, transition.state, transition.dwell)
+    post_data(data, 'pet/foodeat')
+    if transition.state:
+        f.food_eaten = True
+    log.info("%s eaten %s -> %s after %.1f s", f.name, transition.previous,
+             transition.state, transition.dwell)
+
+# 남은 음식 양 notify는 batcher에 모아서 윈도우 단위로 POST
+# 그릇이 비었으면(FOOD_LEFT_EMPTY) 바로 보냄
+def food_left_changed_cb(f, left):
+    filtered = f.filters.update(FOOD_CHR_LEFT_UUID, left)
+    # 빈 그릇 판단은 median 값으로 (초음파 값이 한 번 0 으로 튀는 걸로 비었다/채워졌다 보내지 않게)
+    level = f.filters.current(FOOD_CHR_LEFT_UUID, left)
+    empty = level <= FOOD_LEFT_EMPTY
+    # 빈 그릇이 되거나 다시 채워진 건 deadband/min_interval 과 상관없이 바로 보냄
+    if empty != f.food_empty:
+        f.food_empty = empty
+        filtered = level
+    if filtered is None:
         return
-
-    print("decoded value: %s" % [bytes([v]).decode() for v in value])
-    strr = [bytes([v]).decode() for v in value]
-
-    left = "".join(strr)
-    print(left)
+    # 로컬 소비자는 batch 를 기다리지 않고 필터 통과한 값을 바로 받음
+    publish(event_bus.FOOD_LEFT, f, filtered)
     timestamp = get_timestamp()
-    data = {"LEFT": left, 'DATE': timestamp}
-    post_data(data, 'pet/foodleft')
+    f.batcher.add(filtered, timestamp, urgent=empty)
 
 # notify test
-def food_amount_changed_cb(iface, changed_props, invalidated_props):
-    print("amount notify callback")
-    if iface != GATT_CHRC_IFACE:
-        return
-
-    if not len(changed_props):
-        return
-
-    value = changed_props.get('Value', None)
-    if not value:
-        return
-
-    print("decoded value: %s" % [bytes([v]).decode() for v in value])
-    strr = [bytes([v]).decode() for v in value]
+def food_amount_changed_cb(f, amount):
+    log.debug("%s amount notify: %s", f.name, amount)
 
 # notify test
-def food_action_changed_cb(iface, changed_props, invalidated_props):
-    print("action notify callback")
-    if iface != GATT_CHRC_IFACE:
-        return
-
-    if not len(changed_props):
-        return
-
-    value = changed_props.get('Value', None)
-    if not value:
-        return
-
-    print("decoded value: %s" % [bytes([v]).decode() for v in value])
-    strr = [bytes([v]).decode() for v in value]
+def food_action_changed_cb(f, action):
+    log.debug("%s action notify: %s", f.name, action)
 
 
 # 마셨는지 notify 올 때마다 POST
-def drink_drink_changed_cb(iface, changed_props, invalidated_props):
-    print("drink notify callback")
-    if iface != GATT_CHRC_IFACE:
-        return
-
-    if not len(changed_props):
-        return
-
-    value = changed_props.get('Value', None)
-    if not value:
-        return
-
-    print("decoded value: %s" % [bytes([v]).decode() for v in value])
-    strr = [bytes([v]).decode() for v in value]
-    # 마셨을 때만 post
-    if strr[0] == '0':
+def drink_drink_changed_cb(f, drink):
+    # 마셨을 때만 post ('0')
+    if drink is False:
         timestamp = get_timestamp()
-        data = {'DRINK': True, 'DATE': timestamp}
-        post_data(data)
-
-# 물 부족 신호가 오면 계속 알림
-# 물 안 부족할 때는 계속 보낼 필요가 없으므로 바뀔 때 한번만 보냄
-def drink_water_changed_cb(iface, changed_props, invalidated_props):
-    global WATER_LACK
-    print("water notify callback")
-    if iface != GATT_CHRC_IFACE:
-        return
-
-    if not len(changed_props):
-        return
-
-    value = changed_props.get('Value', None)
-    if not value:
-        return
-
-    print("decoded value: %s" % [bytes([v]).decode() for v in value])
-    strr = [bytes([v]).decode() for v in value]
-    timestamp = get_timestamp()
-
-    if strr[0] == '0':
-        WATER_LACK = True
-        data = {'WATER_LACK': True, 'DATE': timestamp}
-        post_data(data)
-    else:
-        if WATER_LACK:
-            WATER_LACK = False
-            data = {'WATER_LACK': False, 'DATE': timestamp}
-            post_data(data)
+        data = {'DRINK': True, 'DATE': timestamp, 'ADDR': f.address}
+        publish(event_bus.DRINK_DRINK, f)
+        post_data(data, 'pet/waterdrink')
+
+# 물 부족 신호는 부족한 동안 notify 마다 계속 옴
+# 처음 부족해졌을 때 + WATER_ALERT_CONFIG 주기마다 다시 알리고, 해결되면 한 번 보냄
+# 알림은 우선 lane 으로 보내서 밀린 남은 사료 양 업로드 뒤에 줄 서지 않음
+def drink_water_changed_cb(f, water):
+    if water is False:
+        kind = f.water_alert.raise_()
+        if kind is None:
+            return
+        data = {'WATER_LACK': True, 'DATE': get_timestamp(), 'ADDR': f.address}
+        if kind == alerts.NEW:
+            flush_batches(f)
+            log.info("%s water lack", f.name)
+        else:
+            data['REMINDER'] = f.water_alert.reminders
+        publish(event_bus.DRINK_WATER, f, True, f.water_alert.reminders)
+        post_data(data, 'pet/waterlack', urgent=True)
+    elif f.water_alert.clear():
+        log.info("%s water refilled", f.name)
+        data = {'WATER_LACK': False, 'DATE': get_timestamp(), 'ADDR': f.address}
+        flush_batches(f)
+        publish(event_bus.DRINK_WATER, f, False, 0)
+        post_data(data, 'pet/waterlack', urgent=True)
 
 # 값 임시로 읽는 콜백. 쓸 일은 없고 그냥 값 제대로 읽어오는지 테스트용
 def temp_cb(value):
-    print("chrc reading callback")
-    print("decode: %s" % [bytes([v]).decode() for v in value])
-
-
-def start_client():
-    print("start client")
-    if food_left_chrc is not None:
-
-        # test reading
-        food_left_chrc[0].ReadValue({}, reply_handler=temp_cb,
-                                        error_handler=generic_error_cb,
-                                        dbus_interface=GATT_CHRC_IFACE)
-
-        food_eaten_chrc[0].ReadValue({}, reply_handler=temp_cb,
-                                        error_handler=generic_error_cb,
-                                        dbus_interface=GATT_CHRC_IFACE)
-        food_amount_chrc[0].ReadValue({}, reply_handler=temp_cb,
-                                        error_handler=generic_error_cb,
-                                        dbus_interface=GATT_CHRC_IFACE)
-        food_action_chrc[0].ReadValue({}, reply_handler=temp_cb,
-                                        error_handler=generic_error_cb,
-                                        dbus_interface=GATT_CHRC_IFACE)
-
-
-        # Listen to PropertiesChanged signals
-        food_left_prop_iface = dbus.Interface(food_left_chrc[0], DBUS_PROP_IFACE)
-        food_left_prop_iface.connect_to_signal("PropertiesChanged",
-                                              food_left_changed_cb)
-
-        food_eaten_prop_iface = dbus.Interface(food_eaten_chrc[0], DBUS_PROP_IFACE)
-        food_eaten_prop_iface.connect_to_signal("PropertiesChanged",
-                                              food_eaten_changed_cb)
-
-        food_amount_prop_iface = dbus.Interface(food_amount_chrc[0], DBUS_PROP_IFACE)
-        food_amount_prop_iface.connect_to_signal("PropertiesChanged",
-                                              food_amount_changed_cb)
-
-        food_action_prop_iface = dbus.Interface(food_action_chrc[0], DBUS_PROP_IFACE)
-        food_action_prop_iface.connect_to_signal("PropertiesChanged",
-                                              food_action_changed_cb)
-
-        # Subscribe to notifications.
-        food_left_chrc[0].StartNotify(reply_handler=food_left_start_notify_cb,
-                                     error_handler=generic_error_cb,
-                                     dbus_interface=GATT_CHRC_IFACE)
-
-        food_eaten_chrc[0].StartNotify(reply_handler=food_eaten_start_notify_cb,
-                                     error_handler=generic_error_cb,
-                                     dbus_interface=GATT_CHRC_IFACE)
-
-        food_amount_chrc[0].StartNotify(reply_handler=food_amount_start_notify_cb,
-                                     error_handler=generic_error_cb,
-                                     dbus_interface=GATT_CHRC_IFACE)
-
-        food_action_chrc[0].StartNotify(reply_handler=food_action_start_notify_cb,
-                                     error_handler=generic_error_cb,
-                                     dbus_interface=GATT_CHRC_IFACE)
-
-    else:
-        print("no food chrc")
-
-    if drink_drink_chrc is not None:
+    log.debug("chrc read: %s", gatt_decoder.ascii_str(value))
+
+
+# characteristic 테이블
+# UUID -> (서비스 UUID, 이름, notify 핸들러, notify 구독 여부, 값 디코더, write 합치기, write 방식, write 재시도)
+# 새 센서 characteristic 은 여기에 한 줄만 추가하면 찾기/구독/디스패치가 다 됨
+# coalesce: 아직 안 보낸 write 를 새 값으로 덮어씀 (설정값처럼 마지막 값만 의미 있는 char)
+# write_type: None 이면 응답 있는 write, 'command' 면 write-without-response + notify echo 로 확인 (char Flags 에 있을 때만)
+# retry: WriteValue 에러 때 다시 보낼지. 두 번 가면 안 되는 명령(ACTION)은 False
+Chrc = collections.namedtuple('Chrc', 'service name handler notify decoder coalesce write_type retry',
+                              defaults=(False, None, True))
+
+CHRC_TABLE = {
+    FOOD_CHR_LEFT_UUID:   Chrc(FOOD_SVC_UUID, 'FOOD-LEFT', food_left_changed_cb, True, gatt_decoder.ascii_int),
+    FOOD_CHR_EATEN_UUID:  Chrc(FOOD_SVC_UUID, 'FOOD-EATEN', food_eaten_changed_cb, True, gatt_decoder.flag),
+    FOOD_CHR_AMOUNT_UUID: Chrc(FOOD_SVC_UUID, 'FOOD-AMOUNT', food_amount_changed_cb, True, gatt_decoder.ascii_int, True),
+    FOOD_CHR_ACTION_UUID: Chrc(FOOD_SVC_UUID, 'FOOD-ACTION', food_action_changed_cb, True, gatt_decoder.flag, False, 'command', False),
+    DRINK_CHR_DRINK_UUID: Chrc(DRINK_SVC_UUID, 'DRINK-DRINK', drink_drink_changed_cb, True, gatt_decoder.flag),
+    DRINK_CHR_WATER_UUID: Chrc(DRINK_SVC_UUID, 'DRINK-WATER', drink_water_changed_cb, True, gatt_decoder.flag),
+}
+
+
+def subscribe_chrc(f, uuid):
+    entry = CHRC_TABLE[uuid]
+    if not entry.notify or uuid in f.notify_matches:
+        return
+    f.notify_matches[uuid] = backend.subscribe(f.chrcs[uuid][0], make_notify_cb(f, uuid),
+                                               make_start_notify_cb(f, entry.name),
+                                               make_start_notify_error_cb(f, entry.name))
+
+# 연결된 기기 하나의 서비스/char 를 등록하고 notify 구독
+# 서비스/char props 는 object_index 에 이미 있으므로 D-Bus 왕복 없음
+def start_device(f):
+    log.info("start device: %s", f)
+    setup_start = time.monotonic()
+    f.chrcs.clear()
+    for svc_path in object_index.children(f.path, GATT_SERVICE_IFACE):
+        chrc_paths = object_index.children(svc_path, GATT_CHRC_IFACE)
+        process_service(f, svc_path, chrc_paths)
+
+    for uuid in list(f.chrcs):
+        subscribe_chrc(f, uuid)
+    log.info("%s service setup time: %.1f ms", f.name,
+             (time.monotonic() - setup_start) * 1000)
+
+# 예약된 급식 실행. address 가 None 이면 연결된 모든 급식기
+def feed(address, amount):
+    for f in food_targets(address):
+        if amount is not None and FOOD_CHR_AMOUNT_UUID in f.chrcs:
+            write_food_amount(f, amount)
+        if FOOD_CHR_ACTION_UUID in f.chrcs:
+            write_food_action(f)
+
+def add_feeding_plan(plan):
+    interval = plan['interval']
+    return feeding_scheduler.add(feed, plan.get('address'), plan.get('amount'),
+                                 delay=plan.get('delay', interval),
+                                 interval=interval,
+                                 catchup=plan.get('catchup', scheduler.CATCHUP_ONCE))
+
+
+# props 는 GetManagedObjects / InterfacesAdded 로 이미 받은 값을 object_index 에서 꺼내 씀
+# 인덱스에 없을 때만 backend 로 직접 물어봄 (D-Bus 왕복 1회). 못 가져오면 None
+def get_props(obj, path, iface):
+    props = object_index.props(path, iface)
+    if props is None:
+        props = backend.get_all(obj, iface)
+    return props
+
+
+def process_chrc(f, chrc_path, svc_uuid):
+    chrc_props = object_index.props(chrc_path, GATT_CHRC_IFACE)
+    if chrc_props is None:
+        chrc_props = get_props(backend.get_object(chrc_path), chrc_path, GATT_CHRC_IFACE)
+        if chrc_props is None:
+            return False
 
-        drink_drink_prop_iface = dbus.Interface(drink_drink_chrc[0], DBUS_PROP_IFACE)
-        drink_drink_prop_iface.connect_to_signal("PropertiesChanged",
-                                              drink_drink_changed_cb)
+    uuid = chrc_props['UUID']
 
-        drink_water_prop_iface = dbus.Interface(drink_water_chrc[0], DBUS_PROP_IFACE)
-        drink_water_prop_iface.connect_to_signal("PropertiesChanged",
-                                             drink_water_changed_cb)
+    # 테이블에 있고 서비스가 맞는 char 만 등록
+    entry = CHRC_TABLE.get(uuid)
+    if entry is None or entry.service != svc_uuid:
+        log.debug("unrecognized characteristic: %s", uuid)
+        return False
 
-        drink_drink_chrc[0].StartNotify(reply_handler=drink_drink_start_notify_cb,
-                                     error_handler=generic_error_cb,
-                                     dbus_interface=GATT_CHRC_IFACE)
-        drink_water_chrc[0].StartNotify(reply_handler=drink_water_start_notify_cb,
-                                    error_handler=generic_error_cb,
-                                    dbus_interface=GATT_CHRC_IFACE)
+    chrc = backend.get_object(chrc_path)
+    f.chrcs[uuid] = (chrc, chrc_props)
+    chrc_owner[str(chrc_path)] = (f, uuid)
+    log.debug("%s %s: %s", f.name, entry.name, chrc_path)
+    return True
 
-    else:
-        print("no drink chrc")
 
-def temp_write_timer():
-    print("write activate")
-    if food_left_chrc is not None:
-        write_food_action()
-    else:
-        print("why Noneeeeee")
-    timer = threading.Timer(30, temp_write_timer)
-    timer.start()
+def process_service(f, service_path, chrc_paths):
+    service = backend.get_object(service_path)
+    service_props = get_props(service, service_path, GATT_SERVICE_IFACE)
+    if service_props is None:
+        return False
 
+    uuid = service_props['UUID']
+    if uuid not in SERVICE_UUIDS:
+        return False
 
-def process_chrc(chrc_path, svc_no):
-    chrc = bus.get_object(BLUEZ_SERVICE_NAME, chrc_path)
-    chrc_props = chrc.GetAll(GATT_CHRC_IFACE,
-                             dbus_interface=DBUS_PROP_IFACE)
+    log.info("%s service found: %s", f.name, service_path)
 
-    uuid = chrc_props['UUID']
-    print(uuid, svc_no)
-
-    # 서비스 인덱스에 따라 char 등록
-    if svc_no == 0:
-        if uuid == FOOD_CHR_LEFT_UUID:
-            global food_left_chrc
-            food_left_chrc = (chrc, chrc_props)
-            print(food_left_chrc)
-        elif uuid == FOOD_CHR_EATEN_UUID:
-            global food_eaten_chrc
-            food_eaten_chrc = (chrc, chrc_props)
-            print(food_eaten_chrc)
-        elif uuid == FOOD_CHR_AMOUNT_UUID:
-            global food_amount_chrc
-            food_amount_chrc = (chrc, chrc_props)
-            print(food_amount_chrc)
-        elif uuid == FOOD_CHR_ACTION_UUID:
-            global food_action_chrc
-            food_action_chrc = (chrc, chrc_props)
-            print(food_action_chrc)
-        else:
-            print('Unrecognized characteristic: ' + uuid)
-    elif svc_no == 1:
-        if uuid == DRINK_CHR_DRINK_UUID:
-            global drink_drink_chrc
-            drink_drink_chrc = (chrc, chrc_props)
-            print(drink_drink_chrc)
-        elif uuid == DRINK_CHR_WATER_UUID:
-            global drink_water_chrc
-            drink_water_chrc = (chrc, chrc_props)
-            print(drink_water_chrc)
-        else:
-            print('Unrecognized characteristic: ' + uuid)
+    # Process the characteristics.
+    for chrc_path in chrc_paths:
+        process_chrc(f, chrc_path, uuid)
 
+    f.services[uuid] = (service, service_props, service_path)
     return True
 
 
-def process_service(service_path, chrc_paths):
-    service = bus.get_object(BLUEZ_SERVICE_NAME, service_path)
-    service_props = service.GetAll(GATT_SERVICE_IFACE,
-                                   dbus_interface=DBUS_PROP_IFACE)
+# /org/bluez/hci0/dev_XX/service000c/char000d -> /org/bluez/hci0/dev_XX
+def device_of(path):
+    return '/'.join(path.split('/')[:5])
+
+# 이름 prefix 나 광고하는 서비스 UUID 로 기기 종류 판단. 우리 기기가 아니면 None
+def match_device(dd):
+    name = str(dd.get("Name", ""))
+    uuids = [str(u) for u in dd.get("UUIDs", [])]
+    for kind, prefix, svc_uuid in DEVICE_KINDS:
+        if name.startswith(prefix) or svc_uuid in uuids:
+            return kind
+    return None
+
+def add_feeder(address, path, name, kind, clock=time.monotonic):
+    f = feeder.Feeder(address, path, name, kind, FILTER_CONFIG, EATEN_CONFIG,
+                      WATER_ALERT_CONFIG, clock=clock)
+    f.writes = make_write_queue(f)
+    if kind == feeder.FOOD:
+        f.batcher = batcher.WindowBatcher(make_food_left_sender(f), 'LEFT',
+                                          window=FOOD_LEFT_WINDOW,
+                                          max_events=FOOD_LEFT_MAX_EVENTS,
+                                          mode=FOOD_LEFT_MODE, clock=clock)
+    feeders[address] = f
+    feeder_paths[path] = f
+    return f
+
+# 기기별로 비동기 Connect. 느리거나 범위 밖인 기기가 다른 기기 연결을 막지 않음
+# 연결되면 그 기기만 바로 서비스 등록/구독 시작
+def connect_device(path, dd):
+    kind = match_device(dd)
+    if kind is None:
+        return
 
-    uuid = service_props['UUID']
-    service_number = -1
+    address = str(dd.get("Address", path))
+    name = str(dd.get("Name", address))
+    f = feeders.get(address)
+    if f is None:
+        f = add_feeder(address, path, name, kind)
+    sup = f.supervisor
+    if sup.state in (CONNECTING, RESOLVING, SUBSCRIBED) or sup.retry_source:
+        return
 
-    for idx, svc in enumerate(uuid_list):
-        if uuid == svc:
-            service_number = idx
+    sup.set_state(CONNECTING)
+    backend.connect(f, lambda: device_connected_cb(f),
+                    lambda error: device_connect_error_cb(f, error))
+    log.info("%s %s connecting...", name, address)
 
-    if service_number < 0:
-        return False
+def device_connected_cb(f):
+    log.info("%s connected", f.name)
+    f.supervisor.set_state(RESOLVING)
+    start_device(f)
 
-    print(f'Service found: {service_number}'+ service_path)
+def device_connect_error_cb(f, error):
+    log.warning("%s connect failed: %s", f.name, error)
+    device_lost(f)
 
-    # Process the characteristics.
-    for chrc_path in chrc_paths:
-        process_chrc(chrc_path, service_number)
+# Device1 의 Connected 가 False 로 바뀌면 끊긴 것으로 처리
+def device_props_changed_cb(iface, changed_props, invalidated_props, path=None):
+    if iface != DEVICE_IFACE:
+        return
+    if 'Connected' in changed_props and not changed_props['Connected']:
+        f = feeder_paths.get(str(path))
+        if f is not None:
+            device_lost(f)
+
+def device_lost(f):
+    sup = f.supervisor
+    if sup.state in (LOST, DISCOVERING):
+        return
+    sup.set_state(LOST)
+    f.unsubscribe()
+    schedule_reconnect(f)
 
-    service_list[service_number] = (service, service_props, service_path)
-    print(service_number, service_list[service_number])
+def schedule_reconnect(f):
+    sup = f.supervisor
+    if sup.retry_source:
+        return
+    delay = sup.retry_delay()
+    log.info("%s reconnect in %.1f s", f.name, delay)
+    sup.retry_source = backend.timeout_add(int(delay * 1000), reconnect_device, f)
+
+def cancel_reconnect(f):
+    sup = f.supervisor
+    if sup.retry_source:
+        backend.source_remove(sup.retry_source)
+        sup.retry_source = None
+
+def reconnect_device(f):
+    f.supervisor.retry_source = None
+    dd = object_index.props(f.path, DEVICE_IFACE)
+    if dd is None:
+        f.supervisor.set_state(DISCOVERING)
+    else:
+        connect_device(f.path, dd)
+    # GLib 타이머 한 번만 실행
+    return False
+
+
+# GLib 메인 루프 + dbus-python backend
+class DbusBackend:
+    def __init__(self, bus):
+        self.bus = bus
+
+    def timeout_add(self, ms, fn, *args):
+        return GLib.timeout_add(ms, fn, *args)
+
+    def source_remove(self, source):
+        GLib.source_remove(source)
+
+    # introspect=False: 프록시 만들 때 Introspect 호출(왕복)을 하지 않음
+    def get_object(self, path):
+        return self.bus.get_object(BLUEZ_SERVICE_NAME, path, introspect=False)
+
+    def get_all(self, obj, iface):
+        return obj.GetAll(iface, dbus_interface=DBUS_PROP_IFACE)
+
+    # PropertiesChanged match + StartNotify. 리턴한 match 는 f.notify_matches 에 들어감 (remove() 만 씀)
+    def subscribe(self, chrc, notify_cb, reply_handler, error_handler):
+        prop_iface = dbus.Interface(chrc, DBUS_PROP_IFACE)
+        match = prop_iface.connect_to_signal("PropertiesChanged", notify_cb)
+        chrc.StartNotify(reply_handler=reply_handler, error_handler=error_handler,
+                         dbus_interface=GATT_CHRC_IFACE)
+        return match
+
+    # command=True 면 write-without-response
+    def write_value(self, chrc, value, command, reply_handler, error_handler):
+        chrc.WriteValue(value, {'type': 'command'} if command else {},
+                        reply_handler=reply_handler, error_handler=error_handler,
+                        dbus_interface=GATT_CHRC_IFACE)
+
+    def connect(self, f, reply_handler, error_handler):
+        if f.props_match is None:
+            f.props_match = self.bus.add_signal_receiver(
+                device_props_changed_cb, dbus_interface=DBUS_PROP_IFACE,
+                signal_name='PropertiesChanged', bus_name=BLUEZ_SERVICE_NAME,
+                path=f.path, path_keyword='path')
+        f.device = dbus.Interface(self.get_object(f.path), DEVICE_IFACE)
+        f.device.Connect(reply_handler=reply_handler, error_handler=error_handler,
+                         timeout=CONNECT_TIMEOUT)
+
+
+def bluez_bus():
+    address = os.environ.get(BLUEZ_BUS_ENV)
+    if address:
+        return dbus.bus.BusConnection(address)
+    return dbus.SystemBus()
+
+# BlueZ 객체 추가/삭제 시그널 등록 + 전체 객체 스냅샷은 시작할 때 한 번만
+def watch_bluez():
+    om = dbus.Interface(backend.bus.get_object(BLUEZ_SERVICE_NAME, '/'), DBUS_OM_IFACE)
+    om.connect_to_signal('InterfacesAdded', interfaces_added_cb)
+    om.connect_to_signal('InterfacesRemoved', interfaces_removed_cb)
+
+    log.info("getting objects...")
+    object_index.load(om.GetManagedObjects())
+
+# find device (연결은 비동기로 동시에 진행됨)
+def connect_devices():
+    log.info("finding devices...")
+    for path in object_index.find(DEVICE_IFACE):
+        connect_device(path, object_index.props(path, DEVICE_IFACE))
+
+# SIGINT/SIGTERM: 메인 루프를 멈추고 종료 (systemd stop 포함)
+def request_stop():
+    global stopping
+    log.info("stop requested")
+    stopping = True
+    mainloop.quit()
     return True
 
-
 def main():
+    logs.setup()
     # Set up the main loop.
     DBusGMainLoop(set_as_default=True)
-    global bus, motor
-    bus = dbus.SystemBus()
-    motor = rpi_motor.MotorControl(2)
+    global backend, motor_process, http_client, upload_queue, events, notify_tracer
+    backend = DbusBackend(bluez_bus())
+    # 모터는 별도 프로세스에서 실시간 우선순위로 돌고, 웹의 motor.fhth 호출도 그 프로세스가 직접 받음
+    motor_process = motor_proc.start(MOTOR_CHANNEL, MOTOR_PRIORITY)
+    # 로컬 소비자용 event bus. HTTP 업로드는 HTTP_BRIDGE 일 때만 같이 함
+    events = event_bus.EventBus()
+    events.start()
+    os.makedirs(STATE_DIR, exist_ok=True)
+    if HTTP_BRIDGE:
+        # 모든 업로더가 같은 keep-alive 커넥션 풀을 사용 (spool 전송 + 알림 우선 lane)
+        http_client = uploader.HttpClient(pool_size=2)
+        upload_spool = spool.Spool(SPOOL_PATH, max_rows=SPOOL_MAX_ROWS)
+        upload_queue = uploader.UploadQueue(http_client, spool=upload_spool)
+    trace_path = os.environ.get(TRACE_ENV)
+    if trace_path:
+        notify_tracer = notify_trace.TraceWriter(trace_path)
+        log.info("recording notifies to %s", trace_path)
 
     # ==============================================================
     sebus = dbus.SessionBus()
     web_bus_name = dbus.service.BusName(FOOD_SERVICE_DOMAIN, bus=sebus)
-    motor_bus_name = dbus.service.BusName(MOTOR_SERVICE_DOMAIN, bus=sebus)
 
     webComm = WebCommService(web_bus_name, FOOD_SERVICE_PATH)
-    motorSvc = MotorService(motor_bus_name, MOTOR_SERVICE_PATH)
 
     sebus.add_signal_receiver(catchall_handler,
                             interface_keyword='dbus_interface',
@@ -596,78 +940,61 @@ def main():
     sebus.add_signal_receiver(action_activated_cb,
                             dbus_interface=FOOD_SERVICE_IFACE,
                             signal_name='ActionActivated')
-    sebus.add_signal_receiver(cmd_handler,
-                            dbus_interface=MOTOR_SERVICE_IFACE,
-                            signal_name='MotorCommand')
 
 # ==============================================================
 
     global mainloop
     mainloop = GLib.MainLoop()
+    GLib.timeout_add_seconds(60, print_stats)
+    GLib.timeout_add_seconds(1, poll_batches)
+    GLib.timeout_add_seconds(METRICS_TICK, metrics.REGISTRY.tick)
+    try:
+        metrics.MetricsServer(host=METRICS_HOST, port=METRICS_PORT).start()
+    except OSError as e:
+        log.warning("metrics endpoint disabled: %s", e)
 
-    while True:
-        om = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, '/'), DBUS_OM_IFACE)
-        om.connect_to_signal('InterfacesRemoved', interfaces_removed_cb)
+    global feeding_scheduler
+    feeding_scheduler = scheduler.Scheduler(backend.timeout_add, backend.source_remove)
+    for plan in FEEDING_PLANS:
+        add_feeding_plan(plan)
 
-        print('Getting objects...')
-        objects = om.GetManagedObjects()
-        chrcs = []
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signum, request_stop)
 
-        # find device
-        print("Finding Devices...")
-        for path, interfaces in objects.items():
-            dd = interfaces.get(DEVICE_IFACE)
-            if dd is None:
-                continue
-            try:
-                for idx, dev_name in enumerate(dev_name_list):
-                    print(dd["Address"], dd["Name"])
-                    if str(dd["Name"]) == dev_name:
-                        device_list[idx] = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, path), DEVICE_IFACE)
-                        print(device_list[idx])
-                        device_list[idx].Connect()
-                        print(f"device {idx} Connect!!")
-            except Exception as e:
-                print("error: ",e)
-                continue
-
-
-        # List characteristics found
-        print("Finding Services...")
-        for path, interfaces in objects.items():
-            if GATT_CHRC_IFACE not in interfaces.keys():
-                continue
-            chrcs.append(path)
-
-        # List sevices found
-        for path, interfaces in objects.items():
-            if GATT_SERVICE_IFACE not in interfaces.keys():
-                continue
-
-            chrc_paths = [d for d in chrcs if d.startswith(path + "/")]
-            print(chrc_paths)
-
-            if process_service(path, chrc_paths):
-                continue
-
-        for idx, svc in enumerate(service_list):
-            if svc:
-                print(f"service exist: {idx}")
+    watch_bluez()
+
+    while not stopping:
+        connect_devices()
 
         try:
-            start_client()
-            # temp_write_timer()
+            # 테스트용: 30초마다 모든 급식기 급식
+            # feeding_scheduler.add(feed, None, None, interval=30)
             # write_food_amount(300)
             # write_food_action()
 
             mainloop.run()
         except KeyboardInterrupt:
-            print("keyboard")
+            log.info("keyboard interrupt")
+            request_stop()
         finally:
-            for idx, dev in enumerate(device_list):
-                if dev:
-                    print(f"device {idx} Disconnect!!")
-                    dev.Disconnect()
+            # 아직 commit 안 된 spool 내용 디스크에 기록
+            if upload_queue is not None:
+                upload_queue.spool.sync()
+            if notify_tracer is not None:
+                notify_tracer.flush()
+            # 다시 연결하면 처음부터 구독하도록 시그널 match 정리
+            for f in feeders.values():
+                f.unsubscribe()
+                cancel_reconnect(f)
+                f.supervisor.set_state(DISCOVERING)
+                if f.device is not None:
+                    log.info("%s disconnect", f.name)
+                    f.device.Disconnect()
+
+    # 큐에 남은 이벤트/알림은 spool 로 (못 보낸 알림은 다음 실행 때 제일 먼저 나감)
+    if upload_queue is not None:
+        upload_queue.stop(UPLOAD_STOP_TIMEOUT)
+    events.stop()
 
 
 if __name__ == '__main__':
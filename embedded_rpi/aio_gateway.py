@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# BLE_Client 를 asyncio 이벤트 루프 하나에서 돌리는 런타임
+# GLib 메인 루프 + dbus-python + 업로드 워커 스레드 대신
+#  - D-Bus: dbus-next (asyncio). BlueZ 호출(Connect, StartNotify, WriteValue, GetManagedObjects)은
+#    모두 코루틴이라 기기가 많아도 한 스레드에서 동시에 진행됨
+#  - 업로드: aio_uploader.AsyncUploadQueue (코루틴)
+#  - 타이머(스케줄러, write 재시도, echo, 재연결, batch poll): asyncio 루프 타이머
+# 기기/char 처리 로직(CHRC_TABLE, notify 핸들러, 필터, 상태 머신, 연결 상태 관리)은
+# BLE_Client 것을 그대로 쓰고 D-Bus/타이머 호출만 BLE_Client.backend 에 Backend 를 넣어서 바꿈
+#  - BlueZ 시그널은 match 하나(sender=org.bluez)로 받아서 경로로 바로 디스패치
+#    (char 마다 signal receiver 를 따로 만들지 않음)
+#  - 프록시 객체/Introspect 없이 Message 로 바로 호출
+# 선택 의존성: pip3 install dbus-next (BLE_Client.py 만 쓸 때는 필요 없음)
+# 사용법: python3 aio_gateway.py   (BLE_Client.py 대신 실행)
+import asyncio
+import itertools
+import os
+import signal
+
+from dbus_next import BusType, Message, MessageType, Variant
+from dbus_next.aio import MessageBus
+from dbus_next.errors import DBusError
+from dbus_next.service import ServiceInterface, method, signal as dbus_signal
+
+import BLE_Client as gw
+import aio_uploader
+import event_bus
+import logs
+import metrics
+import motor_proc
+import notify_trace
+import scheduler
+import spool
+from device_supervisor import DISCOVERING
+
+log = logs.get_logger('aio_gateway')
+
+DBUS_SERVICE = 'org.freedesktop.DBus'
+DBUS_PATH = '/org/freedesktop/DBus'
+NO_REPLY = 'org.freedesktop.DBus.Error.NoReply'
+
+bus = None          # BlueZ 가 있는 버스
+session_bus = None  # WebComm 서비스
+tasks = set()
+
+# char 경로 -> notify 콜백. PropertiesChanged 시그널을 경로로 바로 찾음
+notify_handlers = {}
+
+
+# GLib.timeout_add / source_remove 와 같은 모양의 asyncio 타이머
+# fn 이 True 를 리턴하면 같은 간격으로 다시 실행 (GLib 과 같음)
+class LoopTimers:
+    def __init__(self, loop):
+        self.loop = loop
+        self.handles = {}
+        self.ids = itertools.count(1)
+
+    def add(self, ms, fn, *args):
+        source = next(self.ids)
+        self._arm(source, ms, fn, args)
+        return source
+
+    def remove(self, source):
+        handle = self.handles.pop(source, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _arm(self, source, ms, fn, args):
+        self.handles[source] = self.loop.call_later(ms / 1000, self._fire,
+                                                    source, ms, fn, args)
+
+    def _fire(self, source, ms, fn, args):
+        if fn(*args):
+            self._arm(source, ms, fn, args)
+        else:
+            self.handles.pop(source, None)
+
+
+# 코루틴을 백그라운드로 돌림. 참조를 들고 있어야 중간에 GC 되지 않음
+def spawn(coro):
+    task = asyncio.ensure_future(coro)
+    tasks.add(task)
+    task.add_done_callback(task_done)
+    return task
+
+def task_done(task):
+    tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        log.error("task failed: %r", task.exception(), exc_info=task.exception())
+
+
+async def call(path, iface, member, signature='', body=(), timeout=None):
+    msg = Message(destination=gw.BLUEZ_SERVICE_NAME, path=path, interface=iface,
+                  member=member, signature=signature, body=list(body))
+    try:
+        reply = await asyncio.wait_for(bus.call(msg), timeout)
+    except asyncio.TimeoutError:
+        raise DBusError(NO_REPLY, f'{member} timed out after {timeout} s')
+    if reply.message_type == MessageType.ERROR:
+        raise DBusError(reply.error_name, reply.body[0] if reply.body else '')
+    return reply.body
+
+async def add_match(connection, rule):
+    await connection.call(Message(destination=DBUS_SERVICE, path=DBUS_PATH,
+                                  interface=DBUS_SERVICE, member='AddMatch',
+                                  signature='s', body=[rule]))
+
+
+# dbus-next 는 a{sv} 값을 Variant 로 줌. BLE_Client 쪽은 값만 씀
+def unwrap(props):
+    return {name: v.value for name, v in props.items()}
+
+def unwrap_interfaces(interfaces):
+    return {iface: unwrap(props) for iface, props in interfaces.items()}
+
+
+# BLE_Client 가 f.chrcs / f.services 에 넣는 프록시 대신. 경로만 들고 있음
+class ObjectRef:
+    __slots__ = ('object_path',)
+
+    def __init__(self, path):
+        self.object_path = path
+
+# f.notify_matches 에 들어가는 값 (BLE_Client 는 remove() 만 부름)
+class NotifyMatch:
+    __slots__ = ('path',)
+
+    def __init__(self, path, cb):
+        self.path = path
+        notify_handlers[path] = cb
+
+    def remove(self):
+        notify_handlers.pop(self.path, None)
+
+
+def bluez_signal(msg):
+    if msg.message_type != MessageType.SIGNAL:
+        return
+    member = msg.member
+    if member == 'PropertiesChanged':
+        iface, changed, invalidated = msg.body
+        cb = notify_handlers.get(msg.path)
+        if cb is not None:
+            cb(iface, unwrap(changed), invalidated)
+        elif msg.path in gw.feeder_paths:
+            gw.device_props_changed_cb(iface, unwrap(changed), invalidated,
+                                       path=msg.path)
+    elif member == 'InterfacesAdded':
+        path, interfaces = msg.body
+        gw.interfaces_added_cb(path, unwrap_interfaces(interfaces))
+    elif member == 'InterfacesRemoved':
+        gw.interfaces_removed_cb(*msg.body)
+
+
+# ===================================================
+# BLE_Client.backend (BLE_Client.DbusBackend 와 같은 메서드)
+# 호출은 코루틴으로 띄우고 결과는 BLE_Client 가 넘긴 reply/error 핸들러로 알려줌
+
+class Backend:
+    def __init__(self, timers):
+        self.timers = timers
+
+    def timeout_add(self, ms, fn, *args):
+        return self.timers.add(ms, fn, *args)
+
+    def source_remove(self, source):
+        self.timers.remove(source)
+
+    # 프록시 대신 경로만 들고 있는 ObjectRef
+    def get_object(self, path):
+        return ObjectRef(path)
+
+    # 코루틴이 아닌 곳에서 불리므로 기다릴 수 없음. object_index 에 없는 객체는
+    # InterfacesAdded 로 들어올 때 interfaces_added_cb 에서 다시 처리됨
+    def get_all(self, obj, iface):
+        log.warning("%s %s not in object index", obj.object_path, iface)
+        return None
+
+    def subscribe(self, chrc, notify_cb, reply_handler, error_handler):
+        match = NotifyMatch(chrc.object_path, notify_cb)
+        spawn(self._start_notify(chrc.object_path, reply_handler, error_handler))
+        return match
+
+    async def _start_notify(self, path, reply_handler, error_handler):
+        try:
+            await call(path, gw.GATT_CHRC_IFACE, 'StartNotify')
+        except DBusError as e:
+            error_handler(e.text)
+            return
+        reply_handler()
+
+    def write_value(self, chrc, value, command, reply_handler, error_handler):
+        options = {'type': Variant('s', 'command')} if command else {}
+        spawn(self._write_value(chrc.object_path, value, options, reply_handler, error_handler))
+
+    async def _write_value(self, path, value, options, reply_handler, error_handler):
+        try:
+            await call(path, gw.GATT_CHRC_IFACE, 'WriteValue', 'aya{sv}',
+                       [bytes(value), options])
+        except DBusError as e:
+            error_handler(e.text)
+            return
+        reply_handler()
+
+    # 기기 PropertiesChanged 는 bluez_signal 에서 경로로 바로 받으므로 match 를 따로 안 만듦
+    def connect(self, f, reply_handler, error_handler):
+        spawn(self._connect(f.path, reply_handler, error_handler))
+
+    async def _connect(self, path, reply_handler, error_handler):
+        try:
+            await call(path, gw.DEVICE_IFACE, 'Connect', timeout=gw.CONNECT_TIMEOUT)
+        except DBusError as e:
+            error_handler(e.text)
+            return
+        reply_handler()
+
+
+async def disconnect(f):
+    try:
+        await call(f.path, gw.DEVICE_IFACE, 'Disconnect', timeout=gw.CONNECT_TIMEOUT)
+    except DBusError as e:
+        log.warning("%s disconnect failed: %s", f.name, e.text)
+
+
+async def connect_bus(address=None):
+    if address is None:
+        address = os.environ.get(gw.BLUEZ_BUS_ENV)
+    if address:
+        return await MessageBus(bus_address=address).connect()
+    return await MessageBus(bus_type=BusType.SYSTEM).connect()
+
+# BlueZ 시그널 match + 전체 객체 스냅샷은 시작할 때 한 번만
+async def watch_bluez():
+    bus.add_message_handler(bluez_signal)
+    await add_match(bus, f"type='signal',sender='{gw.BLUEZ_SERVICE_NAME}'")
+
+    log.info("getting objects...")
+    objects = (await call('/', gw.DBUS_OM_IFACE, 'GetManagedObjects'))[0]
+    gw.object_index.load({path: unwrap_interfaces(interfaces)
+                          for path, interfaces in objects.items()})
+
+
+# ===================================================
+# WebComm 서비스 (BLE_Client.WebCommService 와 같은 메서드, 시그널)
+# motor.fhth 서비스는 모터 프로세스(motor_proc.py)가 들고 있음
+# 메서드는 시그널만 보내고, 처리는 시그널을 받아서 함 (GLib 버전과 같음)
+
+class WebCommInterface(ServiceInterface):
+    def __init__(self):
+        super().__init__(gw.FOOD_SERVICE_IFACE)
+
+    @method()
+    def activate_action(self, address: 's') -> 's':
+        log.debug("activate_action called: %s", address)
+        with gw.DBUS_METHOD.labels('WebCommService', 'activate_action').time():
+            self.ActionActivated(address)
+        return 'action'
+
+    @method()
+    def add_feeding(self, address: 's', interval: 'd', amount: 's') -> 'u':
+        log.info("add feeding %s every %s s amount %s", address, interval, amount)
+        with gw.DBUS_METHOD.labels('WebCommService', 'add_feeding').time():
+            try:
+                return gw.add_feeding_plan({'address': address or None,
+                                            'interval': interval,
+                                            'amount': amount or None})
+            except ValueError as e:
+                raise DBusError(gw.DBUS_INVALID_ARGS, str(e))
+
+    @method()
+    def cancel_feeding(self, job_id: 'u'):
+        log.info("cancel feeding %d", job_id)
+        with gw.DBUS_METHOD.labels('WebCommService', 'cancel_feeding').time():
+            gw.feeding_scheduler.cancel(job_id)
+
+    @method()
+    def set_amount(self, address: 's', amount: 's') -> 's':
+        log.debug("set_amount called: %s %s", address, amount)
+        with gw.DBUS_METHOD.labels('WebCommService', 'set_amount').time():
+            self.AmountChanged(gw.FOOD_SERVICE_IFACE,
+                               {'amount': Variant('s', amount),
+                                'address': Variant('s', address)}, [])
+        return 'amount'
+
+    @dbus_signal()
+    def AmountChanged(self, interface, changed, invalidated) -> 'sa{sv}as':
+        return [interface, changed, invalidated]
+
+    @dbus_signal()
+    def ActionActivated(self, address) -> 's':
+        return address
+
+
+def session_signal(msg):
+    if msg.message_type != MessageType.SIGNAL:
+        return
+    gw.catchall_handler(*msg.body, dbus_interface=msg.interface, member=msg.member)
+    if msg.interface == gw.FOOD_SERVICE_IFACE:
+        if msg.member == 'AmountChanged':
+            iface, changed, invalidated = msg.body
+            gw.amount_changed_cb(iface, unwrap(changed), invalidated)
+        elif msg.member == 'ActionActivated':
+            gw.action_activated_cb(*msg.body)
+
+async def export_services():
+    global session_bus
+    session_bus = await MessageBus().connect()
+    session_bus.export(gw.FOOD_SERVICE_PATH, WebCommInterface())
+    await session_bus.request_name(gw.FOOD_SERVICE_DOMAIN)
+    session_bus.add_message_handler(session_signal)
+    await add_match(session_bus, f"type='signal',interface='{gw.FOOD_SERVICE_IFACE}'")
+
+
+async def run():
+    global bus
+    loop = asyncio.get_running_loop()
+    timers = LoopTimers(loop)
+    gw.backend = Backend(timers)
+
+    bus = await connect_bus()
+    gw.motor_process = motor_proc.start(gw.MOTOR_CHANNEL, gw.MOTOR_PRIORITY)
+    # event bus 는 publish 가 블록되지 않으므로 루프 스레드에서 그대로 씀
+    gw.events = event_bus.EventBus()
+    gw.events.start()
+    os.makedirs(gw.STATE_DIR, exist_ok=True)
+    if gw.HTTP_BRIDGE:
+        upload_spool = spool.Spool(gw.SPOOL_PATH, max_rows=gw.SPOOL_MAX_ROWS)
+        # spool 전송 + 알림 우선 lane
+        gw.upload_queue = aio_uploader.AsyncUploadQueue(
+            aio_uploader.AsyncHttpClient(pool_size=2), spool=upload_spool)
+        gw.upload_queue.start()
+    trace_path = os.environ.get(gw.TRACE_ENV)
+    if trace_path:
+        gw.notify_tracer = notify_trace.TraceWriter(trace_path)
+        log.info("recording notifies to %s", trace_path)
+
+    await export_services()
+
+    timers.add(60 * 1000, gw.print_stats)
+    timers.add(1000, gw.poll_batches)
+    timers.add(gw.METRICS_TICK * 1000, metrics.REGISTRY.tick)
+    try:
+        metrics.MetricsServer(host=gw.METRICS_HOST, port=gw.METRICS_PORT).start()
+    except OSError as e:
+        log.warning("metrics endpoint disabled: %s", e)
+
+    gw.feeding_scheduler = scheduler.Scheduler(timers.add, timers.remove)
+    for plan in gw.FEEDING_PLANS:
+        gw.add_feeding_plan(plan)
+
+    stopping = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    await watch_bluez()
+    gw.connect_devices()
+    try:
+        await stopping.wait()
+        log.info("stopping")
+    finally:
+        if gw.notify_tracer is not None:
+            gw.notify_tracer.flush()
+        for f in gw.feeders.values():
+            f.unsubscribe()
+            gw.cancel_reconnect(f)
+            connected = f.supervisor.state != DISCOVERING
+            f.supervisor.set_state(DISCOVERING)
+            if connected:
+                log.info("%s disconnect", f.name)
+                await disconnect(f)
+        # 남은 이벤트는 spool 에 기록하고 종료
+        if gw.upload_queue is not None:
+            await gw.upload_queue.stop()
+        gw.events.stop()
+
+
+def main():
+    logs.setup()
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+# uploader.UploadQueue 의 asyncio 버전 (aio_gateway 에서 사용)
+# 워커 스레드 대신 같은 이벤트 루프 위의 코루틴이 HTTP POST 를 함
+# 성공 판정, 재시도/버림/spool, backoff, 통계는 uploader.UploadPolicy 를 그대로 씀
+# 여기에는 asyncio 큐/태스크와 HTTP 클라이언트만 있음
+#  - put() 은 콜백에서 바로 호출. 블록되지 않고 큐가 가득 차면 가장 오래된 이벤트를 버림
+#  - SQLite(spool) 작업은 스레드 하나에서 돌려서 디스크 I/O 가 루프를 막지 않게 함
+import asyncio
+import concurrent.futures
+import json
+import time
+
+from uploader import UPLOAD_PORT, UploadPolicy
+
+
+class HttpError(Exception):
+    pass
+
+
+# keep-alive 커넥션 풀을 쓰는 최소한의 HTTP/1.1 클라이언트 (JSON POST 만)
+class AsyncHttpClient:
+    def __init__(self, host='localhost', port=UPLOAD_PORT, pool_size=4,
+                 connect_timeout=2.0, read_timeout=5.0):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle = []          # (reader, writer)
+
+    async def _connect(self):
+        if self.idle:
+            return self.idle.pop()
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.connect_timeout)
+
+    def _release(self, conn, keep_alive):
+        if keep_alive and len(self.idle) < self.pool_size:
+            self.idle.append(conn)
+        else:
+            conn[1].close()
+
+    async def post(self, api, data):
+        body = json.dumps(data).encode()
+        head = (f'POST /{api} HTTP/1.1\r\n'
+                f'Host: {self.host}:{self.port}\r\n'
+                'Content-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                'Connection: keep-alive\r\n\r\n').encode()
+        conn = await self._connect()
+        try:
+            conn[1].write(head + body)
+            status, keep_alive = await asyncio.wait_for(
+                self._read_response(conn[0]), self.read_timeout)
+        except BaseException:
+            conn[1].close()
+            raise
+        self._release(conn, keep_alive)
+        return status
+
+    async def _read_response(self, reader):
+        line = await reader.readline()
+        if not line:
+            raise HttpError('connection closed')
+        parts = line.split(None, 2)
+        if len(parts) < 2:
+            raise HttpError(f'bad status line: {line!r}')
+        status = int(parts[1])
+
+        length = 0
+        chunked = False
+        keep_alive = parts[0] == b'HTTP/1.1'
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.partition(b':')
+            name = name.strip().lower()
+            value = value.strip().lower()
+            if name == b'content-length':
+                length = int(value)
+            elif name == b'transfer-encoding':
+                chunked = value == b'chunked'
+            elif name == b'connection':
+                keep_alive = value == b'keep-alive'
+
+        # 응답 body 는 쓰지 않음. 커넥션을 다시 쓰려고 읽어서 버리기만 함
+        if chunked:
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif length:
+            await reader.readexactly(length)
+        return status, keep_alive
+
+    def close(self):
+        for reader, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+
+class AsyncUploadQueue(UploadPolicy):
+    def __init__(self, client=None, spool=None, maxsize=256, workers=2,
+                 replay_batch=50, replay_rate=20, max_backoff=60,
+                 urgent_maxsize=64):
+        if spool is not None:
+            # 순서 유지를 위해 spool 에 쓰는 워커는 하나만
+            workers = 1
+        if client is None:
+            client = AsyncHttpClient(pool_size=workers + 1)
+        UploadPolicy.__init__(self, client, spool, replay_batch, replay_rate, max_backoff)
+        self.q = asyncio.Queue(maxsize)
+        self.urgent = asyncio.Queue(urgent_maxsize)
+        self.n_workers = workers
+        self.wakeup = asyncio.Event()
+        self.stopped = asyncio.Event()
+        self.disk = concurrent.futures.ThreadPoolExecutor(
+            1, thread_name_prefix='uploader-spool') if spool is not None else None
+        self.tasks = []
+
+    # 이벤트 루프 안에서 호출
+    def start(self):
+        for i in range(self.n_workers):
+            self.tasks.append(asyncio.create_task(self._worker()))
+        self.tasks.append(asyncio.create_task(self._urgent_worker()))
+        if self.spool is not None:
+            self.tasks.append(asyncio.create_task(self._spool_sender()))
+
+    def put(self, data, api, urgent=False):
+        q = self.urgent if urgent else self.q
+        if q.full():
+            q.get_nowait()
+            q.task_done()
+            self._count('overflow')
+        q.put_nowait((data, api))
+        self._count('enqueued')
+
+    async def join(self):
+        await self.urgent.join()
+        await self.q.join()
+
+    async def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        # 큐에 남은 알림/일반 이벤트가 spool 에 기록될 때까지 기다림 (spool 이 없으면 알림은 한 번씩 더 보내봄)
+        await self.urgent.join()
+        if self.spool is not None:
+            await self.q.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.spool is not None:
+            await self._disk(self.spool.close)
+            self.disk.shutdown()
+        self.client.close()
+
+    def _disk(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.disk, fn, *args)
+
+    async def _send(self, data, api):
+        start = time.perf_counter()
+        try:
+            status = await self.client.post(api, data)
+        except Exception:
+            self._send_failed(api)
+            raise
+        return self._sent(api, start, status)
+
+    async def _worker(self):
+        while True:
+            data, api = await self.q.get()
+            try:
+                if self.spool is not None:
+                    await self._disk(self.spool.append, api, data)
+                    self.wakeup.set()
+                    continue
+                try:
+                    self._bulk_done(await self._send(data, api))
+                except Exception as e:
+                    self._bulk_done(None, e)
+            finally:
+                self.q.task_done()
+
+    async def _urgent_worker(self):
+        if self.spool is not None:
+            await self._urgent_spool_worker()
+            return
+        while True:
+            data, api = await self.urgent.get()
+            try:
+                backoff = 1
+                while True:
+                    try:
+                        self._urgent_done(await self._send(data, api))
+                        break
+                    except Exception as e:
+                        self._urgent_failed(e)
+                    if await self._wait(self.stopped, backoff):
+                        self._count('dropped')
+                        break
+                    backoff = self._next_backoff(backoff)
+            finally:
+                self.urgent.task_done()
+
+    # uploader.UploadQueue._urgent_spool_worker 와 같음
+    async def _urgent_spool_worker(self):
+        retry_at = 0 if self.spool.urgent_rows else None
+        while True:
+            timeout = None if retry_at is None else max(0.0, retry_at - time.monotonic())
+            try:
+                data, api = await asyncio.wait_for(self.urgent.get(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                try:
+                    await self._disk(self.spool.append, api, data, True)
+                finally:
+                    self.urgent.task_done()
+                if retry_at is None:
+                    retry_at = 0
+            if retry_at is not None and time.monotonic() >= retry_at:
+                retry_at = self._urgent_next(await self._send_urgent_rows())
+
+    async def _send_urgent_rows(self):
+        while True:
+            rows = await self._disk(self.spool.peek, self.replay_batch, True)
+            if not rows:
+                return True
+            for rid, api, data in rows:
+                try:
+                    status = await self._send(data, api)
+                except Exception as e:
+                    self._urgent_failed(e)
+                    return False
+                await self._disk(self.spool.ack, rid, True)
+                self._urgent_done(status)
+
+    # event 가 set 되면 True, timeout 이 지나면 False
+    @staticmethod
+    async def _wait(event, timeout):
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _spool_sender(self):
+        backoff = 1
+        while not self.stopped.is_set():
+            rows = await self._disk(self.spool.peek, self.replay_batch)
+            self._replay_rows(rows)
+            if not rows:
+                await self._disk(self.spool.sync)
+                await self._wait(self.wakeup, 1)
+                self.wakeup.clear()
+                continue
+
+            acked = None
+            failed = False
+            for rid, api, data in rows:
+                if self.stopped.is_set():
+                    break
+                try:
+                    status = await self._send(data, api)
+                except Exception as e:
+                    self._replay_failed(e)
+                    failed = True
+                    break
+                acked = rid
+                delay = self._replay_sent(status)
+                if delay:
+                    await asyncio.sleep(delay)
+
+            if acked is not None:
+                await self._disk(self.spool.ack, acked)
+
+            if failed:
+                await self._wait(self.stopped, backoff)
+                backoff = self._next_backoff(backoff)
+            else:
+                backoff = 1
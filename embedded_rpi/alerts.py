@@ -0,0 +1,64 @@
+# 반복해서 들어오는 알림 신호(물 부족 등) 중복 제거
+# 센서는 문제가 있는 동안 notify 마다 같은 신호를 계속 보내지만 서버에는
+#  - 처음 켜질 때 NEW 한 번
+#  - 켜진 채로 reminder 초가 지날 때마다 REMINDER 한 번
+#  - 꺼질 때 clear() 가 True 한 번
+# 만 보내고 나머지는 suppressed 로 세기만 함
+# reminder = 0 이면 다시 알리지 않음
+import time
+
+NEW = 'new'
+REMINDER = 'reminder'
+
+
+class Alert:
+    def __init__(self, reminder=300.0, clock=time.monotonic):
+        self.reminder = reminder
+        self.clock = clock
+
+        self.active = False
+        self.since = None           # 켜진 시각
+        self.last_sent = None       # 마지막으로 NEW/REMINDER 를 보낸 시각
+        self.reminders = 0          # 이번에 켜진 뒤 보낸 REMINDER 수
+
+        self.raised = 0
+        self.cleared = 0
+        self.suppressed = 0
+
+    # 신호가 들어올 때마다 호출. 보내야 하면 NEW / REMINDER, 아니면 None
+    def raise_(self, now=None):
+        if now is None:
+            now = self.clock()
+        if not self.active:
+            self.active = True
+            self.since = now
+            self.last_sent = now
+            self.reminders = 0
+            self.raised += 1
+            return NEW
+        if self.reminder and now - self.last_sent >= self.reminder:
+            self.last_sent = now
+            self.reminders += 1
+            return REMINDER
+        self.suppressed += 1
+        return None
+
+    # 신호가 꺼졌을 때 호출. 켜져 있었으면 True (해제를 알려야 함)
+    def clear(self):
+        if not self.active:
+            return False
+        self.active = False
+        self.cleared += 1
+        return True
+
+    # 켜진 뒤 지난 시간(초). 꺼져 있으면 None
+    def duration(self, now=None):
+        if not self.active:
+            return None
+        return (self.clock() if now is None else now) - self.since
+
+    def stats(self):
+        return {'active': self.active,
+                'raised': self.raised,
+                'cleared': self.cleared,
+                'suppressed': self.suppressed}
@@ -0,0 +1,64 @@
+# 센서 값을 시간/개수 윈도우로 묶어서 한 번에 보내는 batching 단계
+# 윈도우 안에서는 마지막 값만 (mode='minmax' 이면 min/max/last) 남기고
+# 윈도우가 끝나면 payload 하나로 send() 호출
+import time
+
+MODE_LAST = 'last'
+MODE_MINMAX = 'minmax'
+
+
+class WindowBatcher:
+    def __init__(self, send, key, window=10.0, max_events=100, mode=MODE_LAST,
+                 clock=time.monotonic):
+        if mode not in (MODE_LAST, MODE_MINMAX):
+            raise ValueError('unknown batch mode: ' + str(mode))
+        self.send = send
+        self.key = key
+        self.window = window
+        self.max_events = max_events
+        self.mode = mode
+        self.clock = clock
+        self._reset()
+
+    def _reset(self):
+        self.started = None
+        self.count = 0
+        self.last = None
+        self.last_date = None
+        self.min = None
+        self.max = None
+
+    # urgent=True 면 윈도우를 기다리지 않고 바로 flush (빈 그릇 같은 상태 변화)
+    def add(self, value, date, urgent=False):
+        if self.started is None:
+            self.started = self.clock()
+        self.count += 1
+        self.last = value
+        self.last_date = date
+        if self.mode == MODE_MINMAX:
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+        if urgent or self.count >= self.max_events:
+            self.flush()
+
+    # GLib.timeout_add 로 주기적으로 호출. 윈도우 시간이 지났으면 flush
+    # GLib 타이머가 계속 돌도록 항상 True 리턴
+    def poll(self):
+        if self.started is not None and \
+                self.clock() - self.started >= self.window:
+            self.flush()
+        return True
+
+    def flush(self):
+        if not self.count:
+            return
+        payload = {self.key: self.last, 'DATE': self.last_date,
+                   'COUNT': self.count}
+        if self.mode == MODE_MINMAX:
+            payload['MIN'] = self.min
+            payload['MAX'] = self.max
+        self._reset()
+        self.send(payload)
@@ -1,10 +1,15 @@
 import io
 import picamera
-import logging
 import socketserver
 from threading import Condition
 from http import server
 
+import logs
+
+log = logs.get_logger('camera_stream')
+# 클라이언트가 끊길 때마다 찍히므로 10초에 1번만
+LOG_CLIENT_RATE = logs.rate(1, 10)
+
 PAGE="""\
 <html>
 <head>
@@ -66,17 +71,22 @@ class StreamingHandler(server.BaseHTTPRequestHandler):
                     self.wfile.write(frame)
                     self.wfile.write(b'\r\n')
             except Exception as e:
-                logging.warning(
+                log.warning(
                     'Removed streaming client %s: %s',
-                    self.client_address, str(e))
+                    self.client_address, e, extra=LOG_CLIENT_RATE)
         else:
             self.send_error(404)
             self.end_headers()
 
+    # BaseHTTPRequestHandler 는 요청마다 stderr 로 access log 를 찍음 -> DEBUG 로 내림
+    def log_message(self, format, *args):
+        log.debug("%s - " + format, self.address_string(), *args)
+
 class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
     allow_reuse_address = True
     daemon_threads = True
 
+logs.setup()
 with picamera.PiCamera(resolution='640x480', framerate=24) as camera:
     output = StreamingOutput()
     camera.start_recording(output, format='mjpeg')
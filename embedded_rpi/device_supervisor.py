@@ -0,0 +1,109 @@
+# 기기별 연결 상태 머신 + 재연결 backoff
+# discovering -> connecting -> resolving -> subscribed -> lost -> connecting ...
+# 연결이 끊기면 프로세스 재시작 없이 그 기기만 다시 연결/구독함
+# 재연결에 걸린 시간과 끊김(flap) 횟수를 통계로 남기고 메트릭으로도 내보냄
+import collections
+import random
+import time
+
+import logs
+import metrics
+
+log = logs.get_logger('device_supervisor')
+
+# 초 단위. 바로 붙는 경우(1초 안) ~ backoff 최대값(60초)을 몇 번 넘기는 경우까지
+RECONNECT_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+DEVICE_FLAPS = metrics.REGISTRY.counter(
+    'fhth_device_flaps_total', 'connections lost while subscribed', ('address', 'name'))
+DEVICE_RECONNECTS = metrics.REGISTRY.counter(
+    'fhth_device_reconnects_total', 'reconnects back to subscribed after a loss',
+    ('address', 'name'))
+RECONNECT_LATENCY = metrics.REGISTRY.histogram(
+    'fhth_device_reconnect_seconds', 'time from connection loss to subscribed again',
+    ('address', 'name'), buckets=RECONNECT_BUCKETS)
+
+DISCOVERING = 'discovering'
+CONNECTING = 'connecting'
+RESOLVING = 'resolving'
+SUBSCRIBED = 'subscribed'
+LOST = 'lost'
+
+
+# 지수 backoff. 실제 대기 시간은 [delay * (1 - jitter), delay] 사이에서 랜덤
+class Backoff:
+    def __init__(self, base=1.0, cap=60.0, jitter=0.5, rand=random.random):
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+        self.rand = rand
+        self.attempt = 0
+
+    def next(self):
+        delay = min(self.cap, self.base * (2 ** self.attempt))
+        self.attempt += 1
+        return delay * (1 - self.jitter * self.rand())
+
+    def reset(self):
+        self.attempt = 0
+
+
+class DeviceSupervisor:
+    def __init__(self, path, name, backoff=None, clock=time.monotonic, address=None):
+        self.path = path
+        self.name = name
+        self.backoff = backoff if backoff is not None else Backoff()
+        self.clock = clock
+
+        self.state = DISCOVERING
+        self.since = clock()
+        self.retry_source = None    # 재연결 예약된 GLib 타이머 id
+
+        self.flaps = 0              # subscribed 상태에서 끊긴 횟수
+        self.reconnects = 0         # 끊긴 뒤 다시 subscribed 까지 간 횟수
+        self.attempts = 0           # Connect 시도 횟수
+        self.lost_at = None
+        self.reconnect_latency = collections.deque(maxlen=32)
+
+        labels = (address or path, name)
+        self.flap_inc = DEVICE_FLAPS.labels(*labels).inc
+        self.reconnect_inc = DEVICE_RECONNECTS.labels(*labels).inc
+        self.observe_reconnect = RECONNECT_LATENCY.labels(*labels).observe
+
+    def set_state(self, state):
+        if state == self.state:
+            return
+        now = self.clock()
+        log.info("%s %s: %s -> %s", self.name, self.path, self.state, state)
+
+        if state == CONNECTING:
+            self.attempts += 1
+        elif state == SUBSCRIBED:
+            self.backoff.reset()
+            if self.lost_at is not None:
+                self.reconnects += 1
+                self.reconnect_inc()
+                self.reconnect_latency.append(now - self.lost_at)
+                self.observe_reconnect(now - self.lost_at)
+                self.lost_at = None
+        elif state == LOST:
+            if self.state == SUBSCRIBED:
+                self.flaps += 1
+                self.flap_inc()
+            if self.lost_at is None:
+                self.lost_at = now
+
+        self.state = state
+        self.since = now
+
+    def retry_delay(self):
+        return self.backoff.next()
+
+    def stats(self):
+        latency = list(self.reconnect_latency)
+        return {'state': self.state,
+                'attempts': self.attempts,
+                'flaps': self.flaps,
+                'reconnects': self.reconnects,
+                'last_reconnect_latency': latency[-1] if latency else None,
+                'max_reconnect_latency': max(latency) if latency else None}
@@ -0,0 +1,62 @@
+# 먹는 중(EATEN '1') / 안 먹는 중('0') 상태 머신
+# 센서 값이 깜빡거려도(1초 간격 notify 가 1~2번 튐) 상태가 바뀐 걸로 보지 않게 시간으로 debounce
+#  - 새 값이 on_delay(먹기 시작) / off_delay(먹기 끝) 초 동안 계속 유지돼야 상태가 바뀜
+#  - 시작/끝 delay 를 다르게 둬서 hysteresis: 잠깐 고개를 든 건 끝난 걸로 안 봄
+#  - 진짜 바뀔 때만 Transition 하나를 리턴 (바뀐 시각 = 새 값이 처음 나온 시각, dwell = 이전 상태 유지 시간)
+# on_delay = off_delay = 0 이면 예전처럼 값이 바뀔 때마다 바로 전이
+import collections
+import time
+
+Transition = collections.namedtuple('Transition', 'state previous at dwell')
+
+
+class EatenStateMachine:
+    def __init__(self, on_delay=5.0, off_delay=15.0, initial=False,
+                 clock=time.monotonic):
+        self.on_delay = on_delay
+        self.off_delay = off_delay
+        self.clock = clock
+
+        self.state = initial
+        self.since = None           # 현재 상태가 시작된 시각
+        self.candidate = None       # 바뀌려고 하는 값
+        self.candidate_at = None
+
+        self.samples = 0
+        self.transitions = 0
+        self.glitches = 0           # delay 안에 원래 값으로 돌아와서 무시한 변화
+
+    # 상태가 바뀌었으면 Transition, 아니면 None
+    def update(self, value, now=None):
+        if now is None:
+            now = self.clock()
+        self.samples += 1
+        if self.since is None:
+            self.since = now
+
+        if value == self.state:
+            if self.candidate is not None:
+                self.glitches += 1
+                self.candidate = None
+            return None
+
+        if self.candidate is None:
+            self.candidate = value
+            self.candidate_at = now
+        delay = self.on_delay if value else self.off_delay
+        if now - self.candidate_at < delay:
+            return None
+
+        transition = Transition(value, self.state, self.candidate_at,
+                                self.candidate_at - self.since)
+        self.state = value
+        self.since = self.candidate_at
+        self.candidate = None
+        self.transitions += 1
+        return transition
+
+    def stats(self):
+        return {'state': self.state,
+                'samples': self.samples,
+                'transitions': self.transitions,
+                'glitches': self.glitches}
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# 로컬 이벤트 버스 (Unix domain stream 소켓)
+# 예전에는 이벤트마다 Python -> HTTP(Node, localhost:3000) -> HTTP(8079) 로 JSON 을 두 번 직렬화했음
+# 같은 Pi 안의 소비자는 이 소켓에 붙어서 필요한 토픽만 바로 받음
+#  - frame: 길이(uint32) + payload. payload 첫 바이트가 토픽 id (0 = 구독 요청)
+#  - 이벤트 payload: 토픽 id, 시각(epoch 초, double), 기기 주소(MAC 6 바이트) + 토픽별 고정 struct
+#  - 게이트웨이(BLE_Client)가 서버. 구독자가 없는 토픽은 인코딩도 하지 않음
+#  - publish 는 절대 블록되지 않음. 느린 구독자는 max_pending 바이트까지 쌓고 넘으면 그 구독자 것만 버림
+#  - 구독: 'food.left' 처럼 정확히, 'food.*' 처럼 prefix, '' 나 '*' 는 전부
+# 사용법 (이벤트 출력): python3 event_bus.py [토픽 ...]
+import collections
+import os
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+
+import logs
+
+log = logs.get_logger('event_bus')
+
+SOCKET_ENV = 'FHTH_EVENT_BUS'
+EVENT_BUS_PATH = os.environ.get(SOCKET_ENV, '/tmp/fhth_events.sock')
+
+FRAME = struct.Struct('<I')
+HEADER = struct.Struct('<Bd6s')
+SUBSCRIBE = 0
+NO_ADDRESS = bytes(6)
+
+Topic = collections.namedtuple('Topic', 'id name body fields')
+Event = collections.namedtuple('Event', 'topic ts address values')
+
+FOOD_LEFT = Topic(1, 'food.left', struct.Struct('<f'), ('left',))
+FOOD_EATEN = Topic(2, 'food.eaten', struct.Struct('<?f'), ('eaten', 'dwell'))
+DRINK_DRINK = Topic(3, 'drink.drink', struct.Struct(''), ())
+DRINK_WATER = Topic(4, 'drink.water', struct.Struct('<?H'), ('lack', 'reminder'))
+
+TOPICS = {t.name: t for t in (FOOD_LEFT, FOOD_EATEN, DRINK_DRINK, DRINK_WATER)}
+TOPIC_IDS = {t.id: t for t in TOPICS.values()}
+
+
+def matches(pattern, name):
+    if pattern in ('', '*'):
+        return True
+    if pattern.endswith('*'):
+        return name.startswith(pattern[:-1])
+    return pattern == name
+
+
+def pack_address(address):
+    try:
+        mac = bytes.fromhex(address.replace(':', ''))
+    except ValueError:
+        return NO_ADDRESS
+    return mac if len(mac) == 6 else NO_ADDRESS
+
+
+def encode(topic, address, values, ts=None):
+    payload = HEADER.pack(topic.id, time.time() if ts is None else ts, address) + \
+        topic.body.pack(*values)
+    return FRAME.pack(len(payload)) + payload
+
+
+def decode(payload):
+    topic = TOPIC_IDS.get(payload[0])
+    if topic is None:
+        return None
+    tid, ts, mac = HEADER.unpack_from(payload)
+    values = topic.body.unpack_from(payload, HEADER.size)
+    return Event(topic.name, ts, mac.hex(':').upper(), dict(zip(topic.fields, values)))
+
+
+class Subscription:
+    def __init__(self, conn):
+        self.conn = conn
+        self.inbuf = bytearray()
+        self.pending = bytearray()
+        self.topics = set()
+        self.events = selectors.EVENT_READ
+        self.closed = False
+        self.dropped = 0
+
+
+class EventBus:
+    def __init__(self, path=EVENT_BUS_PATH, max_pending=1 << 20):
+        self.path = path
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.subscriptions = []
+        self.by_topic = {tid: [] for tid in TOPIC_IDS}
+        self.addresses = {}
+        self.sel = None
+        self.sock = None
+        self.thread = None
+        self.stopped = False
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_w.setblocking(False)
+
+        self.published = 0      # 구독자가 있어서 인코딩한 이벤트
+        self.delivered = 0      # 구독자별로 보낸 frame
+        self.dropped = 0        # 느린 구독자 때문에 버린 frame
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(8)
+        self.sock.setblocking(False)
+        self.sel = selectors.DefaultSelector()
+        self.sel.register(self.sock, selectors.EVENT_READ)
+        self.sel.register(self.wake_r, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self._serve, name='event-bus', daemon=True)
+        self.thread.start()
+        log.info("event bus on %s", self.path)
+
+    def has_subscribers(self, topic):
+        return bool(self.by_topic[topic.id])
+
+    # 콜백(메인 루프)에서 호출. 구독자가 없으면 아무것도 안 함
+    def publish(self, topic, address, *values, ts=None):
+        subs = self.by_topic[topic.id]
+        if not subs:
+            return
+        mac = self.addresses.get(address)
+        if mac is None:
+            mac = self.addresses[address] = pack_address(address)
+        frame = encode(topic, mac, values, ts)
+        wake = False
+        with self.lock:
+            self.published += 1
+            # 보내다 끊긴 구독자는 _close 에서 by_topic 목록에서 빠지므로 복사본으로 돎
+            for sub in list(subs):
+                wake |= self._send(sub, frame)
+        if wake:
+            try:
+                self.wake_w.send(b'\0')
+            except OSError:
+                pass
+
+    # 커널 버퍼가 차서 처음으로 pending 이 생기면 True (서버 스레드가 쓰기 대기를 걸어야 함)
+    def _send(self, sub, frame):
+        if sub.closed:
+            return False
+        if sub.pending:
+            if len(sub.pending) + len(frame) > self.max_pending:
+                sub.dropped += 1
+                self.dropped += 1
+            else:
+                sub.pending += frame
+                self.delivered += 1
+            return False
+        try:
+            sent = sub.conn.send(frame)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._close(sub)
+            return False
+        self.delivered += 1
+        if sent < len(frame):
+            sub.pending += frame[sent:]
+            return True
+        return False
+
+    # lock 잡은 상태에서 호출. 소켓 정리는 서버 스레드가 함
+    def _close(self, sub):
+        sub.closed = True
+        for tid in sub.topics:
+            self.by_topic[tid].remove(sub)
+        sub.topics.clear()
+
+    def _serve(self):
+        while not self.stopped:
+            self._update_interest()
+            for key, mask in self.sel.select(1.0):
+                if key.fileobj is self.sock:
+                    self._accept()
+                elif key.fileobj is self.wake_r:
+                    try:
+                        self.wake_r.recv(4096)
+                    except OSError:
+                        pass
+                else:
+                    sub = key.data
+                    if mask & selectors.EVENT_READ:
+                        self._read(sub)
+                    if mask & selectors.EVENT_WRITE:
+                        self._flush(sub)
+
+    def _update_interest(self):
+        with self.lock:
+            subs = list(self.subscriptions)
+        for sub in subs:
+            if sub.closed:
+                self.sel.unregister(sub.conn)
+                sub.conn.close()
+                with self.lock:
+                    self.subscriptions.remove(sub)
+                log.info("subscriber left (%d dropped)", sub.dropped)
+                continue
+            events = selectors.EVENT_READ
+            if sub.pending:
+                events |= selectors.EVENT_WRITE
+            if events != sub.events:
+                self.sel.modify(sub.conn, events, sub)
+                sub.events = events
+
+    def _accept(self):
+        try:
+            conn, addr = self.sock.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        sub = Subscription(conn)
+        self.sel.register(conn, sub.events, sub)
+        with self.lock:
+            self.subscriptions.append(sub)
+        log.info("subscriber connected")
+
+    def _read(self, sub):
+        try:
+            data = sub.conn.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        with self.lock:
+            if not data:
+                self._close(sub)
+                return
+            sub.inbuf += data
+            while len(sub.inbuf) >= FRAME.size:
+                n = FRAME.unpack_from(sub.inbuf)[0]
+                if len(sub.inbuf) < FRAME.size + n:
+                    break
+                payload = bytes(sub.inbuf[FRAME.size:FRAME.size + n])
+                del sub.inbuf[:FRAME.size + n]
+                if payload[:1] == bytes([SUBSCRIBE]):
+                    self._subscribe(sub, payload[1:].decode(errors='replace'))
+
+    def _subscribe(self, sub, pattern):
+        for topic in TOPICS.values():
+            if matches(pattern, topic.name) and topic.id not in sub.topics:
+                sub.topics.add(topic.id)
+                self.by_topic[topic.id].append(sub)
+        log.info("subscribe %r -> %s", pattern,
+                 sorted(TOPIC_IDS[tid].name for tid in sub.topics))
+
+    def _flush(self, sub):
+        with self.lock:
+            if not sub.pending or sub.closed:
+                return
+            try:
+                sent = sub.conn.send(sub.pending)
+            except BlockingIOError:
+                return
+            except OSError:
+                self._close(sub)
+                return
+            del sub.pending[:sent]
+
+    def stats(self):
+        with self.lock:
+            return {'subscribers': len(self.subscriptions),
+                    'published': self.published,
+                    'delivered': self.delivered,
+                    'dropped': self.dropped,
+                    'pending': sum(len(s.pending) for s in self.subscriptions)}
+
+    def stop(self):
+        self.stopped = True
+        try:
+            self.wake_w.send(b'\0')
+        except OSError:
+            pass
+        if self.thread is not None:
+            self.thread.join()
+        for sub in self.subscriptions:
+            sub.conn.close()
+        self.sock.close()
+        self.sel.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+# 구독 클라이언트. for event in Subscriber(['food.*']): ...
+class Subscriber:
+    def __init__(self, topics=('*',), path=EVENT_BUS_PATH):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.buf = bytearray()
+        self.pos = 0
+        for pattern in topics:
+            self.subscribe(pattern)
+
+    def subscribe(self, pattern):
+        payload = bytes([SUBSCRIBE]) + pattern.encode()
+        self.sock.sendall(FRAME.pack(len(payload)) + payload)
+
+    # 다음 payload (bytes). 연결이 끊기면 None
+    def recv_payload(self):
+        while True:
+            avail = len(self.buf) - self.pos
+            if avail >= FRAME.size:
+                n = FRAME.unpack_from(self.buf, self.pos)[0]
+                if avail >= FRAME.size + n:
+                    start = self.pos + FRAME.size
+                    self.pos = start + n
+                    return bytes(self.buf[start:self.pos])
+            if self.pos:
+                del self.buf[:self.pos]
+                self.pos = 0
+            data = self.sock.recv(65536)
+            if not data:
+                return None
+            self.buf += data
+
+    def recv(self):
+        while True:
+            payload = self.recv_payload()
+            if payload is None:
+                return None
+            event = decode(payload)
+            if event is not None:
+                return event
+
+    def __iter__(self):
+        while True:
+            event = self.recv()
+            if event is None:
+                return
+            yield event
+
+    def close(self):
+        self.sock.close()
+
+
+def main():
+    logs.setup()
+    topics = sys.argv[1:] or ['*']
+    try:
+        for event in Subscriber(topics):
+            print(f"{event.ts:.3f} {event.topic} {event.address} {event.values}", flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# 급식기(food) / 급수기(drink) 한 대의 상태
+# BLE 주소를 키로 기기마다 하나씩 만들어서 전역 변수 대신 여기에 상태를 둠
+# (Pi 하나에 급식기/급수기가 여러 대 붙어도 기기별로 따로 동작)
+import time
+import alerts
+import sensor_filter
+import eaten_state
+import device_supervisor
+
+FOOD = 'food'
+DRINK = 'drink'
+
+
+# clock: 필터/debounce/알림/재연결 통계가 쓰는 시계 (trace 재생 때는 가짜 시계)
+class Feeder:
+    def __init__(self, address, path, name, kind, filter_config=None,
+                 eaten_config=None, alert_config=None, clock=time.monotonic):
+        self.address = address
+        self.path = path
+        self.name = name
+        self.kind = kind
+        self.supervisor = device_supervisor.DeviceSupervisor(path, name, clock=clock,
+                                                             address=address)
+
+        self.device = None          # org.bluez.Device1 인터페이스
+        self.props_match = None     # Device1 PropertiesChanged 시그널 match
+        self.services = {}          # 서비스 UUID -> (service 객체, props, 경로)
+        self.chrcs = {}             # char UUID -> (chrc 객체, props)
+        self.notify_matches = {}    # char UUID -> PropertiesChanged 시그널 match
+        self.writes = None          # WriteValue 큐 (write_queue.WriteQueue)
+        self.echoes = {}            # char UUID -> (reply, error, timeout source) command write 의 notify echo 대기
+        self.late_echoes = {}       # char UUID -> echo 타임아웃 시각 (늦게 온 echo 를 로그로 남김)
+
+        self.filters = sensor_filter.FilterBank(filter_config or {}, clock=clock)
+        self.batcher = None         # food: 남은 사료 양 batching
+
+        # food 상태
+        self.eaten_state = eaten_state.EatenStateMachine(clock=clock, **(eaten_config or {}))
+        self.food_eaten = True
+        self.food_empty = False
+
+        # drink 상태: 물 부족 알림 (alerts.Alert)
+        self.water_alert = alerts.Alert(clock=clock, **(alert_config or {}))
+
+    # notify 구독 해제 (재연결하면 다시 구독)
+    def unsubscribe(self):
+        for match in self.notify_matches.values():
+            match.remove()
+        self.notify_matches.clear()
+
+    def stats(self):
+        stats = self.supervisor.stats()
+        stats['filters'] = self.filters.stats()
+        if self.kind == FOOD:
+            stats['eaten'] = self.eaten_state.stats()
+        else:
+            stats['water_alert'] = self.water_alert.stats()
+        if self.writes is not None:
+            stats['writes'] = self.writes.stats()
+        return stats
+
+    def __repr__(self):
+        return f"<Feeder {self.kind} {self.name} {self.address}>"
@@ -0,0 +1,42 @@
+# GATT characteristic 값 디코더
+# PropertiesChanged 로 오는 Value 는 dbus.Array(dbus.Byte) 이고 dbus.Byte 는 int 라서
+# 바이트마다 bytes/str 을 만들지 않고 bytes() 한 번 변환(또는 변환 없이)으로 바로 값을 얻음
+# 디코딩 실패 시 None 리턴
+import struct
+
+ASCII_0 = 0x30
+ASCII_1 = 0x31
+
+
+# ESP32 가 setValue("42") 처럼 보내는 ASCII 숫자 -> int
+def ascii_int(value):
+    try:
+        return int(bytes(value))
+    except ValueError:
+        return None
+
+
+# '1' -> True, '0' -> False, 그 외 None (첫 바이트만 봄, 변환 없음)
+def flag(value):
+    first = value[0]
+    if first == ASCII_1:
+        return True
+    if first == ASCII_0:
+        return False
+    return None
+
+
+def ascii_str(value):
+    return bytes(value).decode(errors='replace')
+
+
+# struct 포맷으로 묶인 값 디코더 생성. 예) packed('<hH')
+def packed(fmt):
+    s = struct.Struct(fmt)
+
+    def decode(value):
+        try:
+            return s.unpack(bytes(value))
+        except struct.error:
+            return None
+    return decode
@@ -0,0 +1,67 @@
+# BlueZ ObjectManager 객체들을 경로 트리로 들고 있는 인덱스
+# 시작할 때 GetManagedObjects 스냅샷 한 번만 load 하고
+# 그 뒤로는 InterfacesAdded / InterfacesRemoved 시그널로 조금씩 갱신함
+#  - find(iface): 해당 인터페이스를 가진 경로들
+#  - children(path, iface): path 바로 아래 자식 중 iface 를 가진 경로들
+#    (서비스 아래 characteristic 찾을 때 startswith 전체 스캔 대신 사용)
+import collections
+
+
+class ObjectIndex:
+    def __init__(self):
+        self.objects = {}                                   # path -> {iface: props}
+        self.by_iface = collections.defaultdict(set)        # iface -> {path}
+        self.tree = collections.defaultdict(set)            # parent path -> {child path}
+
+    @staticmethod
+    def parent(path):
+        return path.rsplit('/', 1)[0] or '/'
+
+    def load(self, managed_objects):
+        for path, interfaces in managed_objects.items():
+            self.add(path, interfaces)
+
+    def add(self, path, interfaces):
+        path = str(path)
+        ifaces = self.objects.get(path)
+        if ifaces is None:
+            ifaces = self.objects[path] = {}
+            self.tree[self.parent(path)].add(path)
+        for iface, props in interfaces.items():
+            iface = str(iface)
+            ifaces[iface] = props
+            self.by_iface[iface].add(path)
+
+    def remove(self, path, interfaces):
+        path = str(path)
+        ifaces = self.objects.get(path)
+        if ifaces is None:
+            return
+        for iface in interfaces:
+            iface = str(iface)
+            ifaces.pop(iface, None)
+            self.by_iface[iface].discard(path)
+        if not ifaces:
+            del self.objects[path]
+            parent = self.parent(path)
+            self.tree[parent].discard(path)
+            if not self.tree[parent]:
+                del self.tree[parent]
+
+    def find(self, iface):
+        return list(self.by_iface.get(iface, ()))
+
+    def children(self, path, iface=None):
+        kids = self.tree.get(str(path), ())
+        if iface is None:
+            return list(kids)
+        return [p for p in kids if iface in self.objects[p]]
+
+    def props(self, path, iface):
+        return self.objects.get(str(path), {}).get(iface)
+
+    def __contains__(self, path):
+        return str(path) in self.objects
+
+    def __len__(self):
+        return len(self.objects)
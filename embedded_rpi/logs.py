@@ -0,0 +1,96 @@
+# 로그 설정 (표준 logging 위에 얇게)
+#  - 레벨: 환경변수 FHTH_LOG_LEVEL (기본 INFO). journald 에서 볼 수 있게 stderr 로 한 줄씩
+#  - lazy formatting: log.debug("... %s", value) 처럼 인자로 넘기면 레벨이 꺼져 있을 때 문자열을 만들지 않음
+#    인자 자체를 만드는 게 비싸면 if log.isEnabledFor(logs.DEBUG): 로 감쌈
+#  - 호출 위치별 제한: extra 로 넘기면 그 위치(파일, 줄)마다 따로 적용
+#      extra=logs.rate(1, 10)  10초에 1번까지
+#      extra=logs.sample(100)  100번에 1번
+#    버려진 개수는 다음에 찍힐 때 "[+N suppressed]" 로 붙음
+#    dict 는 모듈 전역에서 한 번만 만들어 두고 재사용 (호출마다 할당하지 않게)
+import logging
+import os
+import sys
+import time
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+FORMAT = '%(levelname).1s %(name)s: %(message)s'
+
+
+def rate(count, per):
+    return {'log_rate': (count, per)}
+
+
+def sample(every):
+    return {'log_sample': every}
+
+
+class CallSite:
+    def __init__(self):
+        self.tokens = None
+        self.stamp = 0.0
+        self.seen = 0
+        self.suppressed = 0
+
+
+# 호출 위치마다 token bucket(rate) 또는 N번에 1번(sample) 으로 거름
+class CallSiteFilter(logging.Filter):
+    def __init__(self, clock=time.monotonic):
+        super().__init__()
+        self.clock = clock
+        self.sites = {}
+
+    def filter(self, record):
+        limit = getattr(record, 'log_rate', None)
+        every = getattr(record, 'log_sample', None)
+        if limit is None and every is None:
+            return True
+
+        key = (record.pathname, record.lineno)
+        site = self.sites.get(key)
+        if site is None:
+            site = self.sites[key] = CallSite()
+
+        if every is not None:
+            site.seen += 1
+            allow = site.seen % every == 1 or every == 1
+        else:
+            count, per = limit
+            now = self.clock()
+            if site.tokens is None:
+                site.tokens = float(count)
+            else:
+                site.tokens = min(count, site.tokens + (now - site.stamp) * count / per)
+            site.stamp = now
+            allow = site.tokens >= 1
+            if allow:
+                site.tokens -= 1
+
+        if not allow:
+            site.suppressed += 1
+            return False
+        if site.suppressed:
+            record.msg = '%s [+%d suppressed]' % (record.msg, site.suppressed)
+            site.suppressed = 0
+        return True
+
+
+def setup(level=None, stream=None):
+    if level is None:
+        level = os.environ.get('FHTH_LOG_LEVEL', 'INFO')
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    handler.addFilter(CallSiteFilter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    return root
+
+
+def get_logger(name):
+    return logging.getLogger(name)
@@ -0,0 +1,343 @@
+# Prometheus text 형식으로 내보내는 간단한 메트릭 레지스트리 + HTTP 엔드포인트
+# 운영 중에도 켜 둘 수 있게 hot path 에서는 락을 잡지 않음
+#  - Counter / Histogram: 스레드마다 자기 shard(리스트)에만 씀. 읽을 때(scrape) 합침
+#  - Gauge: 값 대입만 함. gauge_func 은 scrape 할 때 함수를 불러서 값을 얻음
+# label 이 있는 메트릭은 .labels(...) 로 자식을 한 번 받아 두고 계속 씀 (hot path 에서 dict 조회 안 하게)
+#
+# 사용 예)
+#   NOTIFY = metrics.REGISTRY.counter('fhth_notify_total', 'notify 수', ('uuid',), rate=True)
+#   inc = NOTIFY.labels(uuid).inc
+#   inc()
+import bisect
+import threading
+import time
+from http import server
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 초 단위. BLE 콜백(수십 us) ~ HTTP 업로드(수백 ms) 까지
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=None):
+    pairs = ['%s="%s"' % (n, escape(v)) for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append('%s="%s"' % extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class CounterChild:
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.shards_lock = threading.Lock()
+        self.last_value = 0
+        self.last_time = None
+        self.rate = 0.0
+
+    # 스레드별 shard: [개수]
+    def _new_shard(self):
+        shard = [0]
+        with self.shards_lock:
+            self.shards.append(shard)
+        self.local.shard = shard
+        return shard
+
+    def inc(self, amount=1):
+        try:
+            shard = self.local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        shard[0] += amount
+
+    @property
+    def value(self):
+        return sum(shard[0] for shard in list(self.shards))
+
+
+class GaugeChild:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Timer:
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.local = threading.local()
+        self.shards = []
+        self.shards_lock = threading.Lock()
+
+    # 스레드별 shard: [bucket 별 개수..., +Inf 개수, 합계]
+    def _new_shard(self):
+        shard = [0] * (len(self.buckets) + 1) + [0.0]
+        with self.shards_lock:
+            self.shards.append(shard)
+        self.local.shard = shard
+        return shard
+
+    def observe(self, value):
+        try:
+            shard = self.local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def time(self):
+        return Timer(self)
+
+    def snapshot(self):
+        n = len(self.buckets) + 1
+        counts = [0] * n
+        total = 0.0
+        for shard in list(self.shards):
+            for i in range(n):
+                counts[i] += shard[i]
+            total += shard[-1]
+        return counts, total
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    # 자식 생성만 락을 잡음 (처음 한 번)
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = self.children[values] = self._new_child()
+        return child
+
+    def header(self):
+        return ['# HELP %s %s' % (self.name, self.help),
+                '# TYPE %s %s' % (self.name, self.kind)]
+
+    def collect(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=(), rate=False):
+        super().__init__(name, help, labels)
+        self.rate = rate
+
+    def _new_child(self):
+        return CounterChild()
+
+    # rate=True 인 카운터는 tick() 사이 초당 증가량을 <이름>_rate 게이지로 같이 내보냄
+    def tick(self, now):
+        for child in list(self.children.values()):
+            value = child.value
+            if child.last_time is not None and now > child.last_time:
+                child.rate = (value - child.last_value) / (now - child.last_time)
+            child.last_value = value
+            child.last_time = now
+
+    def collect(self):
+        lines = self.header()
+        items = list(self.children.items())
+        for values, child in items:
+            lines.append('%s%s %d' % (self.name,
+                                      format_labels(self.label_names, values),
+                                      child.value))
+        if self.rate:
+            base = self.name[:-len('_total')] if self.name.endswith('_total') else self.name
+            lines.append('# HELP %s_rate %s (per second)' % (base, self.help))
+            lines.append('# TYPE %s_rate gauge' % base)
+            for values, child in items:
+                lines.append('%s_rate%s %s' % (base,
+                                               format_labels(self.label_names, values),
+                                               format_value(round(child.rate, 3))))
+        return lines
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return GaugeChild()
+
+    def collect(self):
+        lines = self.header()
+        for values, child in list(self.children.items()):
+            lines.append('%s%s %s' % (self.name,
+                                      format_labels(self.label_names, values),
+                                      format_value(child.value)))
+        return lines
+
+
+# scrape 할 때 fn() 을 호출. fn 은 (label 값 튜플, 값) 들을 리턴
+class GaugeFunc(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help, fn, labels=()):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def collect(self):
+        lines = self.header()
+        for values, value in self.fn():
+            lines.append('%s%s %s' % (self.name,
+                                      format_labels(self.label_names, values),
+                                      format_value(value)))
+        return lines
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def collect(self):
+        lines = self.header()
+        for values, child in list(self.children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (
+                    self.name,
+                    format_labels(self.label_names, values, ('le', format_value(float(bound)))),
+                    cumulative))
+            labels = format_labels(self.label_names, values)
+            lines.append('%s_sum%s %s' % (self.name, labels, format_value(total)))
+            lines.append('%s_count%s %d' % (self.name, labels, cumulative))
+        return lines
+
+
+class Registry:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError('duplicate metric: ' + metric.name)
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=(), rate=False):
+        return self._register(Counter(name, help, labels, rate))
+
+    def gauge(self, name, help, labels=()):
+        return self._register(Gauge(name, help, labels))
+
+    def gauge_func(self, name, help, fn, labels=()):
+        return self._register(GaugeFunc(name, help, fn, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def unregister(self, name):
+        with self.lock:
+            self.metrics.pop(name, None)
+
+    # rate 계산용. 메인 루프 타이머에서 주기적으로 호출 (GLib 타이머용으로 True 리턴)
+    def tick(self):
+        now = self.clock()
+        for metric in list(self.metrics.values()):
+            if isinstance(metric, Counter) and metric.rate:
+                metric.tick(now)
+        return True
+
+    def expose(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:
+                lines.append('# %s collect failed: %s' % (metric.name, escape(e)))
+        return '\n'.join(lines) + '\n'
+
+
+# 모듈들이 같이 쓰는 기본 레지스트리
+REGISTRY = Registry()
+
+
+class MetricsHandler(server.BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.expose().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # 요청마다 stderr 에 찍지 않음
+    def log_message(self, format, *args):
+        pass
+
+
+# GET /metrics 를 백그라운드 스레드에서 처리
+class MetricsServer:
+    # 기본은 Pi 안에서만 보임. 다른 기기에서 scrape 하려면 host='0.0.0.0'
+    def __init__(self, registry=REGISTRY, host='127.0.0.1', port=9105):
+        handler = type('Handler', (MetricsHandler,), {'registry': registry})
+        self.httpd = server.ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       name='metrics', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
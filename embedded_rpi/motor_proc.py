@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# 모터 제어 전용 프로세스
+# BLE notify 처리/업로드와 같은 메인 루프에서 I2C 를 쓰면 텔레메트리가 몰릴 때 주행 명령이 같이 밀림
+# 그래서 MotorControl(I2C) 은 이 프로세스만 들고, 명령은 Unix datagram 소켓으로 받음
+#  - 명령 하나 = 고정 길이 binary datagram 하나 (연결, 파싱, 직렬화 비용 없음)
+#  - 가능하면 SCHED_FIFO 실시간 우선순위로 실행 (root 또는 CAP_SYS_NICE 필요, 안 되면 nice 만 올림)
+#  - 보내는 쪽(MotorClient)은 절대 블록되지 않음. 서버가 없거나 소켓 버퍼가 차 있으면 버리고 셈
+#  - FLAG_REPLY 가 붙은 명령에는 (받은 시각, I2C 끝난 시각) 을 돌려줌 (지연 측정용, CLOCK_MONOTONIC)
+#  - --parent 로 띄우면 부모(게이트웨이)가 죽을 때 같이 종료
+#  - 웹(backend_rpi /control)이 부르는 motor.fhth 세션 버스 서비스도 이 프로세스가 들고 있음
+#    D-Bus 는 보통 우선순위 스레드에서 받아서 소켓으로 서버 루프에 넘기므로 게이트웨이 루프를 안 거침
+# 게이트웨이(BLE_Client / aio_gateway)는 start() 로 띄우기만 함
+# 다른 로컬 프로세스도 같은 소켓으로 바로 명령을 보낼 수 있음
+# 사용법: python3 motor_proc.py [--channel 2] [--priority 50] [--socket 경로] [--dry-run] [--no-dbus]
+import argparse
+import itertools
+import os
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import dbus
+import dbus.service
+from dbus.mainloop.glib import DBusGMainLoop
+from gi.repository import GLib
+
+import logs
+
+log = logs.get_logger('motor_proc')
+LOG_DROP_RATE = logs.rate(1, 10)
+
+SOCKET_ENV = 'FHTH_MOTOR_SOCKET'
+MOTOR_SOCKET = os.environ.get(SOCKET_ENV, '/tmp/fhth_motor.sock')
+
+# op, flags, value(-1 = 기본값), seq, 보낸 시각
+COMMAND = struct.Struct('<BBhId')
+# seq, 받은 시각, I2C 끝난 시각
+REPLY = struct.Struct('<Idd')
+FLAG_REPLY = 0x01
+
+OPS = ('go', 'stop', 'back', 'left', 'right', 'middle')
+OP_CODES = {name: code for code, name in enumerate(OPS)}
+
+PARENT_CHECK = 1.0      # 부모 프로세스 확인 주기(초)
+
+MOTOR_SERVICE_PATH = '/fhth/motor/Test'
+MOTOR_SERVICE_IFACE = 'motor.fhth.TestInterface'
+MOTOR_SERVICE_DOMAIN = 'motor.fhth'
+
+DBUS_INVALID_ARGS = 'org.freedesktop.DBus.Error.InvalidArgs'
+DBUS_FAILED = 'org.freedesktop.DBus.Error.Failed'
+DBUS_REPLY_TIMEOUT = 1.0    # activate_motor 가 I2C 끝나기를 기다리는 최대 시간(초)
+
+
+# 실제 I2C 없이 명령만 받음 (테스트용). i2c_time 만큼 버스를 쓰는 것처럼 기다림
+class DryRunMotor:
+    def __init__(self, i2c_time=0.001):
+        self.i2c_time = i2c_time
+
+    def _write(self, *args):
+        time.sleep(self.i2c_time)
+
+    go = back = stop = left = right = middle = _write
+
+
+def set_realtime(priority):
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        log.info("SCHED_FIFO priority %d", priority)
+        return True
+    except (AttributeError, OSError) as e:
+        log.warning("SCHED_FIFO not allowed (%s), raising nice instead", e)
+    try:
+        os.nice(-10)
+    except OSError:
+        pass
+    return False
+
+
+class MotorServer:
+    def __init__(self, motor, path=MOTOR_SOCKET, parent=None):
+        self.motor = motor
+        self.path = path
+        self.parent = parent
+
+        if os.path.exists(path):
+            os.unlink(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(path)
+        self.sock.settimeout(PARENT_CHECK)
+
+        self.received = 0
+        self.bad = 0
+        self.errors = 0
+
+    def serve_forever(self):
+        log.info("motor server on %s", self.path)
+        try:
+            while True:
+                try:
+                    data, addr = self.sock.recvfrom(COMMAND.size + 1)
+                except socket.timeout:
+                    if self.parent is not None and os.getppid() != self.parent:
+                        log.info("parent exited")
+                        return
+                    continue
+                self.handle(data, addr, time.monotonic())
+        finally:
+            self.close()
+
+    def handle(self, data, addr, received):
+        if len(data) != COMMAND.size:
+            self.bad += 1
+            return
+        op, flags, value, seq, sent = COMMAND.unpack(data)
+        if op >= len(OPS):
+            self.bad += 1
+            return
+        self.received += 1
+        fn = getattr(self.motor, OPS[op])
+        try:
+            if value < 0:
+                fn()
+            else:
+                fn(value)
+        except Exception as e:
+            self.errors += 1
+            log.error("motor %s failed: %s", OPS[op], e)
+        if flags & FLAG_REPLY and addr:
+            try:
+                self.sock.sendto(REPLY.pack(seq, received, time.monotonic()), addr)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {'received': self.received, 'bad': self.bad, 'errors': self.errors}
+
+    def close(self):
+        log.info("motor server stats: %s", self.stats())
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+# rpi_motor.MotorControl 과 같은 메서드. 호출하면 datagram 하나만 보내고 바로 리턴
+class MotorClient:
+    def __init__(self, path=MOTOR_SOCKET, reply=False):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.flags = 0
+        if reply:
+            # 주소 없이 bind 하면 커널이 abstract 주소를 붙여줌 (reply 받을 곳)
+            self.sock.bind('')
+            self.flags = FLAG_REPLY
+        self.seqs = itertools.count(1)
+        self.sent = 0
+        self.dropped = 0
+
+    def send(self, op, value=-1):
+        seq = next(self.seqs) & 0xffffffff
+        try:
+            self.sock.sendto(COMMAND.pack(OP_CODES[op], self.flags, value, seq,
+                                          time.monotonic()), self.path)
+        except OSError as e:
+            # 서버 없음(FileNotFound, ConnectionRefused) 또는 소켓 버퍼 가득(BlockingIO)
+            self.dropped += 1
+            log.warning("motor %s dropped: %s", op, e, extra=LOG_DROP_RATE)
+            return None
+        self.sent += 1
+        return seq
+
+    # (seq, 받은 시각, I2C 끝난 시각). timeout 안에 없으면 None
+    def read_reply(self, timeout=None):
+        if not select.select([self.sock], [], [], timeout)[0]:
+            return None
+        return REPLY.unpack(self.sock.recv(REPLY.size))
+
+    def go(self, speed=100):
+        return self.send('go', speed)
+
+    def back(self, speed=100):
+        return self.send('back', speed)
+
+    def stop(self):
+        return self.send('stop')
+
+    def left(self, value=300):
+        return self.send('left', value)
+
+    def right(self, value=430):
+        return self.send('right', value)
+
+    def middle(self):
+        return self.send('middle')
+
+    def stats(self):
+        return {'sent': self.sent, 'dropped': self.dropped}
+
+    def close(self):
+        self.sock.close()
+
+
+# motor.fhth 세션 버스 서비스. 명령은 reply 를 받는 MotorClient 로 서버 루프에 넘김
+class MotorService(dbus.service.Object):
+    def __init__(self, bus_name, object_path, path=MOTOR_SOCKET):
+        dbus.service.Object.__init__(self, bus_name, object_path)
+        self.client = MotorClient(path, reply=True)
+
+    # I2C 가 끝나면 리턴. 기다리는 동안 막히는 건 D-Bus 스레드뿐
+    @dbus.service.method(MOTOR_SERVICE_IFACE, in_signature='s', out_signature='s')
+    def activate_motor(self, cmd):
+        log.debug("activate_motor called: %s", cmd)
+        cmd = str(cmd)
+        if cmd not in OP_CODES:
+            raise dbus.exceptions.DBusException("unknown motor command %r" % cmd,
+                                                name=DBUS_INVALID_ARGS)
+        seq = self.client.send(cmd)
+        if seq is None:
+            raise dbus.exceptions.DBusException("motor %s dropped" % cmd, name=DBUS_FAILED)
+        deadline = time.monotonic() + DBUS_REPLY_TIMEOUT
+        while True:
+            reply = self.client.read_reply(max(0, deadline - time.monotonic()))
+            if reply is None:
+                raise dbus.exceptions.DBusException("motor %s timed out" % cmd, name=DBUS_FAILED)
+            # 앞에서 timeout 난 명령의 늦은 reply 는 버림
+            if reply[0] == seq:
+                return 'motor'
+
+
+def serve_dbus(path):
+    DBusGMainLoop(set_as_default=True)
+    try:
+        name = dbus.service.BusName(MOTOR_SERVICE_DOMAIN, bus=dbus.SessionBus())
+    except dbus.exceptions.DBusException as e:
+        log.error("motor D-Bus service disabled: %s", e)
+        return
+    MotorService(name, MOTOR_SERVICE_PATH, path)
+    log.info("motor D-Bus service %s", MOTOR_SERVICE_DOMAIN)
+    GLib.MainLoop().run()
+
+
+# 모터 프로세스를 띄우고 소켓이 생길 때까지 기다림 (최대 wait 초)
+# D-Bus 이름은 그 뒤에 잡히므로 바로 부르는 쪽은 NameHasOwner 로 확인
+def start(channel=2, priority=50, path=MOTOR_SOCKET, dry_run=False, i2c_time=None,
+          wait=2.0, dbus_service=True):
+    args = [sys.executable, os.path.abspath(__file__), '--channel', str(channel),
+            '--priority', str(priority), '--socket', path,
+            '--parent', str(os.getpid())]
+    if dry_run:
+        args.append('--dry-run')
+    if not dbus_service:
+        args.append('--no-dbus')
+    if i2c_time is not None:
+        args += ['--i2c-ms', str(i2c_time * 1000)]
+    if os.path.exists(path):
+        os.unlink(path)
+    proc = subprocess.Popen(args)
+    deadline = time.monotonic() + wait
+    while not os.path.exists(path) and time.monotonic() < deadline:
+        if proc.poll() is not None:
+            log.error("motor process exited: %s", proc.returncode)
+            break
+        time.sleep(0.01)
+    return proc
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--channel', type=int, default=2)
+    parser.add_argument('--priority', type=int, default=50, help='SCHED_FIFO priority (1-99)')
+    parser.add_argument('--socket', default=MOTOR_SOCKET)
+    parser.add_argument('--parent', type=int, help='exit when this process exits')
+    parser.add_argument('--dry-run', action='store_true', help='no I2C, only sleep --i2c-ms')
+    parser.add_argument('--i2c-ms', type=float, default=1.0)
+    parser.add_argument('--no-dbus', dest='dbus', action='store_false',
+                        help='do not own the motor.fhth session bus name')
+    args = parser.parse_args()
+
+    logs.setup()
+    # SIGTERM 으로 끝나도 소켓 파일 정리
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    if args.dry_run:
+        motor = DryRunMotor(args.i2c_ms / 1000)
+    else:
+        import rpi_motor
+        motor = rpi_motor.MotorControl(args.channel)
+    server = MotorServer(motor, args.socket, args.parent)
+    # 스레드는 만들 때 스케줄링 정책을 물려받으므로 D-Bus 스레드는 set_realtime 전에 띄움
+    if args.dbus:
+        threading.Thread(target=serve_dbus, args=(args.socket,), name='motor-dbus',
+                         daemon=True).start()
+    set_realtime(args.priority)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# PropertiesChanged(notify) 이벤트 녹화/재생용 바이너리 trace 파일
+# 하루 종일 녹화해도 작게: char 경로/UUID 는 처음 한 번만 쓰고 이후엔 번호로,
+# 시간은 직전 이벤트와의 차이(us)로 저장
+#
+# 파일 형식 (little endian)
+#   헤더: b'FHTR' + 버전(B) + 시작 monotonic 시각(d)
+#   'D' + id(H) + 경로 길이(B) + 경로 + UUID 길이(B) + UUID    char 정의
+#   'E' + 시간 차이 us(I) + id(H) + 값 길이(B) + 값            이벤트
+#   'T' + 시간 차이 us(Q)                                     차이가 I 범위를 넘을 때 먼저 씀
+import struct
+import time
+
+MAGIC = b'FHTR'
+VERSION = 1
+
+HEADER = struct.Struct('<4sBd')
+DEFINE = struct.Struct('<cHB')
+EVENT = struct.Struct('<cIHB')
+GAP = struct.Struct('<cQ')
+MAX_DELTA = 0xFFFFFFFF
+
+
+class TraceError(Exception):
+    pass
+
+
+class TraceWriter:
+    def __init__(self, path, clock=time.monotonic, buffering=64 * 1024):
+        self.clock = clock
+        self.file = open(path, 'wb', buffering=buffering)
+        self.start = clock()
+        self.last_us = 0
+        self.ids = {}
+        self.events = 0
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.start))
+
+    def _define(self, path, uuid):
+        key = (path, uuid)
+        chrc_id = self.ids[key] = len(self.ids)
+        p = path.encode()
+        u = uuid.encode()
+        self.file.write(DEFINE.pack(b'D', chrc_id, len(p)) + p +
+                        bytes((len(u),)) + u)
+        return chrc_id
+
+    # value: bytes (또는 int 시퀀스), ts: monotonic 초 (없으면 지금)
+    def record(self, path, uuid, value, ts=None):
+        chrc_id = self.ids.get((path, uuid))
+        if chrc_id is None:
+            chrc_id = self._define(path, uuid)
+        now_us = int(((self.clock() if ts is None else ts) - self.start) * 1e6)
+        delta = max(0, now_us - self.last_us)
+        self.last_us = now_us
+        if delta > MAX_DELTA:
+            self.file.write(GAP.pack(b'T', delta))
+            delta = 0
+        value = bytes(value)[:255]
+        self.file.write(EVENT.pack(b'E', delta, chrc_id, len(value)) + value)
+        self.events += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# (monotonic 시각, char 경로, UUID, 값 bytes) 를 순서대로 돌려줌
+class TraceReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            head = f.read(HEADER.size)
+        if len(head) < HEADER.size:
+            raise TraceError('truncated header: ' + path)
+        magic, version, self.start = HEADER.unpack(head)
+        if magic != MAGIC or version != VERSION:
+            raise TraceError('not a trace file: ' + path)
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        pos = HEADER.size
+        now_us = 0
+        chrcs = []
+        end = len(data)
+        try:
+            while pos < end:
+                kind = data[pos:pos + 1]
+                if kind == b'E':
+                    _, delta, chrc_id, length = EVENT.unpack_from(data, pos)
+                    pos += EVENT.size
+                    now_us += delta
+                    path, uuid = chrcs[chrc_id]
+                    value = data[pos:pos + length]
+                    if len(value) < length:
+                        return
+                    pos += length
+                    yield self.start + now_us / 1e6, path, uuid, value
+                elif kind == b'D':
+                    _, chrc_id, length = DEFINE.unpack_from(data, pos)
+                    pos += DEFINE.size
+                    path = data[pos:pos + length].decode()
+                    pos += length
+                    length = data[pos]
+                    uuid = data[pos + 1:pos + 1 + length].decode()
+                    pos += 1 + length
+                    if chrc_id != len(chrcs):
+                        raise TraceError('bad chrc id %d at %d' % (chrc_id, pos))
+                    chrcs.append((path, uuid))
+                elif kind == b'T':
+                    _, delta = GAP.unpack_from(data, pos)
+                    pos += GAP.size
+                    now_us += delta
+                else:
+                    raise TraceError('bad record %r at %d' % (kind, pos))
+        except (struct.error, IndexError):
+            # 녹화 중 꺼져서 마지막 레코드가 잘린 경우: 거기까지만
+            return
@@ -2,6 +2,9 @@
 # http://raspberrypiwiki.com/images/a/ac/Raspi-MotorHAT-python3.zip
 from Raspi_MotorHAT import Raspi_MotorHAT, Raspi_DCMotor
 from Raspi_PWM_Servo_Driver import PWM
+import logs
+
+log = logs.get_logger('rpi_motor')
 
 # MotorControl 클래스를 통해서 동작시킬수 있음
 class MotorControl:
@@ -21,13 +24,13 @@ class MotorControl:
 
     # go 뒷바퀴 모터를 전방으로 회전시킵니다.
     def go(self, speed=100):
-        print(f"MOTOR GO : speed {speed}")
+        log.debug("MOTOR GO : speed %d", speed)
         self.myMotor.setSpeed(speed)
         self.myMotor.run(Raspi_MotorHAT.FORWARD)
 
     # back 뒷바퀴 모터를 후방으로 회전시킵니다.
     def back(self, speed=100):
-        print(f"MOTOR BACK : speed {speed}")
+        log.debug("MOTOR BACK : speed %d", speed)
         self.myMotor.run(Raspi_MotorHAT.BACKWARD)
 
     # stop 뒷바퀴 모터를 정지 시킵니다.
@@ -36,20 +39,21 @@ class MotorControl:
 
     # left 앞바퀴 좌측으로 조향, value 값을 같이 입력하면 원하는 만큼 조향 가능
     def left(self, value=300):
-        print(f"MOTOR LEFT : {value}")
+        log.debug("MOTOR LEFT : %d", value)
         self.pwm.setPWM(self.ch, 0, value)
 
     # right 앞바퀴 우측으로 조향, value 값을 같이 입력하면 원하는 만큼 조향 가능
     def right(self, value=430):
-        print(f"MOTOR RIGHT : {value}")
+        log.debug("MOTOR RIGHT : %d", value)
         self.pwm.setPWM(self.ch, 0, value)
 
     # left 앞바퀴 중앙으로 조향.
     def middle(self):
-        print("MOTOR MIDDLE")
+        log.debug("MOTOR MIDDLE")
         self.pwm.setPWM(self.ch, 0, 350)
 
 if __name__ == "__main__":
+    logs.setup()
     motor = MotorControl(2)
     try:
         while 1:
@@ -0,0 +1,149 @@
+# GLib 메인 루프 위에서 도는 급식 스케줄러
+# 타이머마다 스레드를 만들지 않고 monotonic 시간 기준 힙(heapq) 하나로 모든 작업을 관리
+# 메인 루프에는 가장 빠른 작업 시각에 맞춘 타이머 하나만 걸어둠 (작업이 수천 개여도 스레드 0개)
+#
+# 놓친 실행(Pi 가 멈췄다 깨어나거나 루프가 오래 막혔을 때) 처리 방법
+#  - CATCHUP_SKIP: 놓친 건 버리고 다음 주기부터
+#  - CATCHUP_ONCE: 놓친 게 몇 번이든 한 번만 바로 실행
+#  - CATCHUP_ALL: 놓친 횟수만큼 모두 실행
+import heapq
+import itertools
+import math
+import time
+
+import logs
+
+log = logs.get_logger('scheduler')
+
+CATCHUP_SKIP = 'skip'
+CATCHUP_ONCE = 'once'
+CATCHUP_ALL = 'all'
+
+# interval / delay 상한(초). 이보다 긴 예약은 설정 실수로 봄
+MAX_SECONDS = 366 * 24 * 3600
+# 메인 루프 타이머 한 번에 걸 수 있는 최대 ms (GLib.timeout_add 는 guint, int32 범위로 맞춤)
+# 더 먼 작업은 이만큼 기다렸다가 _on_timer 에서 다시 검
+TIMER_MAX_MS = 2 ** 31 - 1
+
+
+class Job:
+    def __init__(self, job_id, fn, args, when, interval, catchup, grace):
+        self.id = job_id
+        self.fn = fn
+        self.args = args
+        self.when = when            # 다음 실행 시각 (monotonic)
+        self.interval = interval    # None 이면 한 번만
+        self.catchup = catchup
+        self.grace = grace          # 이 시간(초) 안에 늦은 건 놓친 걸로 안 봄
+        self.cancelled = False
+        self.runs = 0
+        self.missed = 0
+
+
+class Scheduler:
+    # timer_add(ms, fn) -> source id, timer_remove(source id)
+    # 기본은 GLib.timeout_add / GLib.source_remove
+    def __init__(self, timer_add=None, timer_remove=None, clock=time.monotonic):
+        if timer_add is None or timer_remove is None:
+            from gi.repository import GLib
+            timer_add = GLib.timeout_add
+            timer_remove = GLib.source_remove
+        self.timer_add = timer_add
+        self.timer_remove = timer_remove
+        self.clock = clock
+
+        self.heap = []
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.counter = itertools.count()
+        self.source = None
+        self.source_when = None
+
+    # delay 초 뒤에 실행. interval 이 있으면 그 주기로 반복
+    # interval <= 0 은 ValueError (0 이면 놓친 횟수 계산에서 0 으로 나누고, 음수면 run_pending 이 끝나지 않음)
+    # inf/NaN 이나 MAX_SECONDS 넘는 interval/delay 도 작업을 만들기 전에 ValueError
+    def add(self, fn, *args, delay=0, interval=None, catchup=CATCHUP_ONCE,
+            grace=1.0):
+        if interval is not None and not 0 < interval <= MAX_SECONDS:
+            raise ValueError(f'interval must be > 0 and <= {MAX_SECONDS}: {interval}')
+        if not (math.isfinite(delay) and delay <= MAX_SECONDS):
+            raise ValueError(f'delay must be finite and <= {MAX_SECONDS}: {delay}')
+        job = Job(next(self.ids), fn, args, self.clock() + delay, interval,
+                  catchup, grace)
+        self.jobs[job.id] = job
+        self._push(job)
+        return job.id
+
+    def cancel(self, job_id):
+        job = self.jobs.pop(job_id, None)
+        if job is not None:
+            # 힙에서 바로 빼지 않고 꺼낼 때 버림
+            job.cancelled = True
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def _push(self, job):
+        heapq.heappush(self.heap, (job.when, next(self.counter), job))
+        self._arm()
+
+    # 가장 빠른 작업 시각에 맞춰 메인 루프 타이머 하나만 유지
+    def _arm(self):
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return
+        when = self.heap[0][0]
+        if self.source is not None:
+            if self.source_when <= when:
+                return
+            self.timer_remove(self.source)
+        delay_ms = min(TIMER_MAX_MS, max(0, int((when - self.clock()) * 1000)))
+        self.source = self.timer_add(delay_ms, self._on_timer)
+        self.source_when = when
+
+    def _on_timer(self):
+        self.source = None
+        self.run_pending()
+        self._arm()
+        # GLib 타이머는 매번 새로 걸기 때문에 False
+        return False
+
+    def run_pending(self):
+        now = self.clock()
+        while self.heap and self.heap[0][0] <= now:
+            when, _, job = heapq.heappop(self.heap)
+            if job.cancelled:
+                continue
+            self._run(job, now)
+
+    def _run(self, job, now):
+        late = now - job.when
+        times = 1
+        if job.interval is not None and late > job.grace:
+            missed = int(late // job.interval)
+            job.missed += missed
+            if job.catchup == CATCHUP_SKIP:
+                times = 0 if missed else 1
+            elif job.catchup == CATCHUP_ALL:
+                times = missed + 1
+
+        for _ in range(times):
+            job.runs += 1
+            try:
+                job.fn(*job.args)
+            except Exception as e:
+                log.error("scheduled job %d failed: %s", job.id, e)
+
+        if job.interval is None:
+            self.jobs.pop(job.id, None)
+            return
+        # 다음 실행 시각은 원래 주기 격자에 맞춤 (밀리지 않게)
+        job.when += job.interval * (int(late // job.interval) + 1)
+        self._push(job)
+
+    def stats(self):
+        return {'jobs': len(self.jobs),
+                'heap': len(self.heap),
+                'runs': sum(j.runs for j in self.jobs.values()),
+                'missed': sum(j.missed for j in self.jobs.values())}
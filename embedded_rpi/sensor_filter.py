@@ -0,0 +1,97 @@
+# notify 로 들어오는 센서 값에서 노이즈(1~2 단위 흔들림)를 걸러내는 필터
+# PropertiesChanged 콜백과 업로더 사이에서 characteristic UUID 별로 설정해서 사용
+#  - median: 최근 N 개 값의 중앙값으로 튀는 값 제거
+#  - deadband: 마지막으로 보고한 값과의 차이가 이 값 이상일 때만 보고
+#  - hysteresis: 직전 변화와 반대 방향으로 바뀔 때는 deadband + hysteresis 만큼 변해야 보고
+#  - min_interval: 보고 사이 최소 간격(초)
+#  - max_interval: 값이 안 바뀌어도 이 간격(초)마다 한 번은 보고 (None 이면 안 함)
+import collections
+import time
+
+
+class SensorFilter:
+    def __init__(self, deadband=0, hysteresis=0, median=1, min_interval=0,
+                 max_interval=None, clock=time.monotonic):
+        self.deadband = deadband
+        self.hysteresis = hysteresis
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.clock = clock
+        self.window = collections.deque(maxlen=max(1, median))
+
+        self.value = None       # 마지막으로 받은 값의 median (보고 여부와 상관없음)
+        self.last_value = None
+        self.last_time = None
+        self.direction = 0
+        self.received = 0
+        self.reported = 0
+
+    def _median(self):
+        values = sorted(self.window)
+        n = len(values)
+        if n % 2:
+            return values[n // 2]
+        return (values[n // 2 - 1] + values[n // 2]) / 2
+
+    # 보고해야 하면 (필터된) 값, 아니면 None 리턴
+    def update(self, value):
+        self.received += 1
+        self.window.append(value)
+        value = self._median() if len(self.window) > 1 else value
+        self.value = value
+        now = self.clock()
+
+        if self.last_value is None:
+            return self._report(value, now, 0)
+
+        elapsed = now - self.last_time
+        diff = value - self.last_value
+        direction = (diff > 0) - (diff < 0)
+
+        threshold = self.deadband
+        if direction and self.direction and direction != self.direction:
+            threshold += self.hysteresis
+
+        changed = direction != 0 and abs(diff) >= threshold
+        if changed and elapsed >= self.min_interval:
+            return self._report(value, now, direction)
+        if self.max_interval is not None and elapsed >= self.max_interval:
+            return self._report(value, now, self.direction)
+        return None
+
+    def _report(self, value, now, direction):
+        self.last_value = value
+        self.last_time = now
+        self.direction = direction
+        self.reported += 1
+        return value
+
+
+# UUID -> SensorFilter. 설정 없는 UUID 는 그대로 통과
+class FilterBank:
+    def __init__(self, config, clock=time.monotonic):
+        self.config = config
+        self.clock = clock
+        self.filters = {}
+
+    def update(self, uuid, value):
+        f = self.filters.get(uuid)
+        if f is None:
+            conf = self.config.get(uuid)
+            if conf is None:
+                return value
+            f = SensorFilter(clock=self.clock, **conf)
+            self.filters[uuid] = f
+        return f.update(value)
+
+    # 지금 median 값 (보고 안 된 값 포함). 설정 없는 UUID 거나 아직 값이 없으면 default
+    def current(self, uuid, default=None):
+        f = self.filters.get(uuid)
+        if f is None or f.value is None:
+            return default
+        return f.value
+
+    # uuid -> (받은 개수, 보고한 개수)
+    def stats(self):
+        return {uuid: (f.received, f.reported)
+                for uuid, f in self.filters.items()}
@@ -0,0 +1,121 @@
+# 서버(릴레이)가 죽어 있어도 이벤트를 잃지 않도록 디스크에 쌓아두는 spool
+# SQLite 테이블 하나를 append-only 로그처럼 사용함
+#  - append: 맨 뒤에 추가. commit(fsync)은 sync_every 개 / sync_interval 초마다 묶어서 함
+#    (SD 카드 수명 때문에 이벤트마다 fsync 하지 않음, 대신 crash 시 마지막 묶음은 잃을 수 있음)
+#  - peek/ack: 앞에서부터 순서대로 읽고 보낸 만큼 삭제
+#  - max_rows 를 넘으면 가장 오래된 것부터 버림
+# 알림(urgent=True)은 따로 된 urgent 테이블에 넣음
+#  - 일반 이벤트 뒤에 줄 서지 않고 업로더의 우선 lane 이 이 테이블만 먼저 비움
+#  - 보내기 전에 기록하므로 append/ack 는 묶지 않고 바로 commit (알림은 드물게만 옴)
+import json
+import sqlite3
+import threading
+import time
+
+
+class Spool:
+    def __init__(self, path, max_rows=50000, sync_every=50, sync_interval=2.0):
+        self.path = path
+        self.max_rows = max_rows
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS spool ('
+                        'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                        'api TEXT NOT NULL, '
+                        'data TEXT NOT NULL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS urgent ('
+                        'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                        'api TEXT NOT NULL, '
+                        'data TEXT NOT NULL)')
+
+        self.rows = self.db.execute('SELECT COUNT(*) FROM spool').fetchone()[0]
+        self.urgent_rows = self.db.execute('SELECT COUNT(*) FROM urgent').fetchone()[0]
+        self.evicted = 0
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.in_tx = False
+
+    def _begin(self):
+        if not self.in_tx:
+            self.db.execute('BEGIN')
+            self.in_tx = True
+
+    def _maybe_sync(self):
+        if self.pending >= self.sync_every or \
+                time.monotonic() - self.last_sync >= self.sync_interval:
+            self._sync()
+
+    def _sync(self):
+        if self.in_tx:
+            self.db.execute('COMMIT')
+            self.in_tx = False
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def append(self, api, data, urgent=False):
+        table = 'urgent' if urgent else 'spool'
+        with self.lock:
+            self._begin()
+            self.db.execute(f'INSERT INTO {table} (api, data) VALUES (?, ?)',
+                            (api, json.dumps(data)))
+            self.pending += 1
+            if urgent:
+                self.urgent_rows += 1
+                over = self.urgent_rows - self.max_rows
+            else:
+                self.rows += 1
+                over = self.rows - self.max_rows
+
+            if over > 0:
+                self.db.execute(f'DELETE FROM {table} WHERE id IN '
+                                f'(SELECT id FROM {table} ORDER BY id LIMIT ?)',
+                                (over,))
+                if urgent:
+                    self.urgent_rows -= over
+                else:
+                    self.rows -= over
+                self.evicted += over
+            if urgent:
+                self._sync()
+            else:
+                self._maybe_sync()
+
+    # 가장 오래된 것부터 limit 개 (id, api, data) 리턴. 삭제는 ack 에서
+    def peek(self, limit=50, urgent=False):
+        table = 'urgent' if urgent else 'spool'
+        with self.lock:
+            cur = self.db.execute(f'SELECT id, api, data FROM {table} '
+                                  'ORDER BY id LIMIT ?', (limit,))
+            return [(rid, api, json.loads(data)) for rid, api, data in cur]
+
+    # last_id 까지 전송 완료된 것으로 보고 삭제
+    def ack(self, last_id, urgent=False):
+        table = 'urgent' if urgent else 'spool'
+        with self.lock:
+            self._begin()
+            cur = self.db.execute(f'DELETE FROM {table} WHERE id <= ?', (last_id,))
+            self.pending += cur.rowcount
+            if urgent:
+                self.urgent_rows -= cur.rowcount
+                self._sync()
+            else:
+                self.rows -= cur.rowcount
+                self._maybe_sync()
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def __len__(self):
+        return self.rows + self.urgent_rows
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            self.db.close()
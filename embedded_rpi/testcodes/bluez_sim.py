@@ -0,0 +1,406 @@
+#!/usr/bin/python
+# 하드웨어 없이 BLE_Client 를 돌리기 위한 가짜 BlueZ (FHTH_FOOD / FHTH_DRINK)
+# 별도 D-Bus 버스(dbus-daemon 을 새로 띄움)에 org.bluez 이름으로
+# ObjectManager, Device1, GattService1, GattCharacteristic1 객체를 올림
+#  - UUID/이름/flag 는 ESP32 펌웨어와 같음 (0000222x / 0000223x)
+#  - notify 를 초당 rate 개로 만들거나(--rate) 파일에서 다시 보냄(--replay)
+#  - 받은 WriteValue 는 기록해 두고 종료할 때 요약 출력
+#  - ACTION 에 '1' 을 쓰면 펌웨어처럼 잠시 후 '0' 으로 바꾸고 notify (echo)
+#  - --stamp 를 주면 notify 에 SimSentAt(monotonic 초) 를 같이 넣음 (지연 측정용, BLE_Client 는 무시함)
+#
+# 사용법
+#   python3 testcodes/bluez_sim.py --food 2 --drink 2 --rate 500
+#   -> 출력된 주소를 FHTH_BLUEZ_BUS 로 주고 BLE_Client 실행
+#      FHTH_BLUEZ_BUS=unix:path=... python3 BLE_Client.py
+#   이미 떠 있는 버스를 쓰려면 --bus <주소>
+#
+# replay 파일 형식 (한 줄에 하나, # 은 주석)
+#   <시작 후 초>,<기기 번호>,<char UUID>,<값 문자열>
+import argparse
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+import dbus
+import dbus.service
+from dbus.mainloop.glib import DBusGMainLoop
+from gi.repository import GLib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import BLE_Client as client
+
+ADAPTER_PATH = '/org/bluez/hci0'
+# 실제 펌웨어는 write-without-response 가 없음 (PROPERTY_WRITE 만). 시뮬레이터는 command write 경로를 재려고 넣음
+FLAGS = ['read', 'write', 'write-without-response', 'notify']
+# 몇 ms 마다 notify 를 몰아서 보낼지 (rate 가 높을 때 타이머 호출 수를 줄임)
+TICK_MS = 5
+ACTION_DELAY = 0.05
+
+FOOD_CHRCS = (client.FOOD_CHR_LEFT_UUID, client.FOOD_CHR_EATEN_UUID,
+              client.FOOD_CHR_AMOUNT_UUID, client.FOOD_CHR_ACTION_UUID)
+DRINK_CHRCS = (client.DRINK_CHR_DRINK_UUID, client.DRINK_CHR_WATER_UUID)
+
+# 생성기가 notify 를 보내는 char (센서 값)
+SENSOR_CHRCS = (client.FOOD_CHR_LEFT_UUID, client.FOOD_CHR_EATEN_UUID,
+                client.DRINK_CHR_DRINK_UUID, client.DRINK_CHR_WATER_UUID)
+
+
+class InvalidArgs(dbus.exceptions.DBusException):
+    _dbus_error_name = 'org.freedesktop.DBus.Error.InvalidArgs'
+
+
+class NotSupported(dbus.exceptions.DBusException):
+    _dbus_error_name = 'org.bluez.Error.NotSupported'
+
+
+def byte_array(s):
+    return dbus.Array([dbus.Byte(b) for b in s.encode()], signature='y')
+
+
+# 새 dbus-daemon 을 띄우고 주소를 리턴
+def start_private_bus():
+    proc = subprocess.Popen(['dbus-daemon', '--session', '--nofork',
+                             '--print-address=1'],
+                            stdout=subprocess.PIPE, text=True)
+    address = proc.stdout.readline().strip()
+    if not address:
+        proc.kill()
+        sys.exit('dbus-daemon failed to start')
+    return proc, address
+
+
+class PropertiesObject(dbus.service.Object):
+    iface = None
+
+    def __init__(self, bus, path):
+        self.path = path
+        dbus.service.Object.__init__(self, bus, path)
+
+    def props(self):
+        raise NotImplementedError
+
+    @dbus.service.method(client.DBUS_PROP_IFACE, in_signature='ss',
+                         out_signature='v')
+    def Get(self, interface, name):
+        if interface != self.iface:
+            raise InvalidArgs()
+        return self.props()[name]
+
+    @dbus.service.method(client.DBUS_PROP_IFACE, in_signature='s',
+                         out_signature='a{sv}')
+    def GetAll(self, interface):
+        if interface != self.iface:
+            raise InvalidArgs()
+        return self.props()
+
+    @dbus.service.signal(client.DBUS_PROP_IFACE, signature='sa{sv}as')
+    def PropertiesChanged(self, interface, changed, invalidated):
+        pass
+
+
+class SimChrc(PropertiesObject):
+    iface = client.GATT_CHRC_IFACE
+
+    def __init__(self, bus, path, device, service, uuid):
+        PropertiesObject.__init__(self, bus, path)
+        self.device = device
+        self.service = service
+        self.uuid = uuid
+        self.value = byte_array('0')
+        self.notifying = False
+        self.writes = []    # (monotonic, 값 문자열, options)
+
+    def props(self):
+        return {'UUID': self.uuid,
+                'Service': dbus.ObjectPath(self.service.path),
+                'Flags': dbus.Array(FLAGS, signature='s'),
+                'Value': self.value,
+                'Notifying': dbus.Boolean(self.notifying)}
+
+    def notify(self, s, stamp=False):
+        self.value = byte_array(s)
+        if not self.notifying:
+            return False
+        changed = {'Value': self.value}
+        if stamp:
+            changed['SimSentAt'] = dbus.Double(time.monotonic())
+        self.PropertiesChanged(self.iface, changed, dbus.Array([], signature='s'))
+        return True
+
+    @dbus.service.method(client.GATT_CHRC_IFACE, in_signature='a{sv}',
+                         out_signature='ay')
+    def ReadValue(self, options):
+        return self.value
+
+    @dbus.service.method(client.GATT_CHRC_IFACE, in_signature='aya{sv}')
+    def WriteValue(self, value, options):
+        if not self.device.connected:
+            raise NotSupported('Not connected')
+        s = bytes(value).decode(errors='replace')
+        self.writes.append((time.monotonic(), s, dict(options)))
+        self.value = dbus.Array(value, signature='y')
+        self.device.sim.written(self, s)
+
+    @dbus.service.method(client.GATT_CHRC_IFACE)
+    def StartNotify(self):
+        self.notifying = True
+
+    @dbus.service.method(client.GATT_CHRC_IFACE)
+    def StopNotify(self):
+        self.notifying = False
+
+
+class SimService(PropertiesObject):
+    iface = client.GATT_SERVICE_IFACE
+
+    def __init__(self, bus, path, device, uuid):
+        PropertiesObject.__init__(self, bus, path)
+        self.device = device
+        self.uuid = uuid
+
+    def props(self):
+        return {'UUID': self.uuid,
+                'Device': dbus.ObjectPath(self.device.path),
+                'Primary': dbus.Boolean(True)}
+
+
+class SimDevice(PropertiesObject):
+    iface = client.DEVICE_IFACE
+
+    def __init__(self, sim, bus, index, kind):
+        self.sim = sim
+        self.index = index
+        self.kind = kind
+        self.address = 'F0:F0:00:00:%02X:%02X' % (index // 256, index % 256)
+        PropertiesObject.__init__(self, bus, ADAPTER_PATH + '/dev_' +
+                                  self.address.replace(':', '_'))
+        self.name = 'FHTH_FOOD' if kind == 'food' else 'FHTH_DRINK'
+        self.svc_uuid = client.FOOD_SVC_UUID if kind == 'food' else client.DRINK_SVC_UUID
+        self.connected = False
+
+        self.service = SimService(bus, self.path + '/service0001', self, self.svc_uuid)
+        self.chrcs = {}
+        for i, uuid in enumerate(FOOD_CHRCS if kind == 'food' else DRINK_CHRCS):
+            path = self.service.path + '/char%04x' % (i + 2)
+            self.chrcs[uuid] = SimChrc(bus, path, self, self.service, uuid)
+
+    def props(self):
+        return {'Address': self.address,
+                'Name': self.name,
+                'Alias': self.name,
+                'UUIDs': dbus.Array([self.svc_uuid], signature='s'),
+                'Connected': dbus.Boolean(self.connected),
+                'ServicesResolved': dbus.Boolean(self.connected),
+                'Adapter': dbus.ObjectPath(ADAPTER_PATH)}
+
+    def objects(self):
+        yield self.path, {self.iface: self.props()}
+        yield self.service.path, {self.service.iface: self.service.props()}
+        for chrc in self.chrcs.values():
+            yield chrc.path, {chrc.iface: chrc.props()}
+
+    def set_connected(self, connected):
+        if connected == self.connected:
+            return
+        self.connected = connected
+        if not connected:
+            for chrc in self.chrcs.values():
+                chrc.notifying = False
+        self.PropertiesChanged(self.iface,
+                               {'Connected': dbus.Boolean(connected),
+                                'ServicesResolved': dbus.Boolean(connected)},
+                               dbus.Array([], signature='s'))
+
+    @dbus.service.method(client.DEVICE_IFACE)
+    def Connect(self):
+        self.set_connected(True)
+
+    @dbus.service.method(client.DEVICE_IFACE)
+    def Disconnect(self):
+        self.set_connected(False)
+
+
+class SimObjectManager(dbus.service.Object):
+    def __init__(self, sim, bus):
+        self.sim = sim
+        dbus.service.Object.__init__(self, bus, '/')
+
+    @dbus.service.method(client.DBUS_OM_IFACE, out_signature='a{oa{sa{sv}}}')
+    def GetManagedObjects(self):
+        objects = {}
+        for device in self.sim.devices:
+            for path, interfaces in device.objects():
+                objects[dbus.ObjectPath(path)] = interfaces
+        return objects
+
+    @dbus.service.signal(client.DBUS_OM_IFACE, signature='oa{sa{sv}}')
+    def InterfacesAdded(self, path, interfaces):
+        pass
+
+    @dbus.service.signal(client.DBUS_OM_IFACE, signature='oas')
+    def InterfacesRemoved(self, path, interfaces):
+        pass
+
+
+# 센서 값 생성기: 기기마다 상태를 들고 조금씩 바꿈
+class Generator:
+    def __init__(self, seed=1):
+        self.rnd = random.Random(seed)
+        self.left = {}
+
+    def value(self, device, uuid):
+        if uuid == client.FOOD_CHR_LEFT_UUID:
+            left = self.left.get(device.index, 80)
+            left = min(100, max(0, left + self.rnd.choice((-3, -1, 0, 0, 1, 3))))
+            self.left[device.index] = left
+            return str(left)
+        # EATEN / DRINK / WATER: 대부분 '1', 가끔 '0'
+        return '0' if self.rnd.random() < 0.2 else '1'
+
+
+class Simulator:
+    def __init__(self, bus, food=1, drink=1, stamp=False, echo=True):
+        self.bus = bus
+        self.stamp = stamp
+        self.echo = echo
+        self.bus_name = dbus.service.BusName(client.BLUEZ_SERVICE_NAME, bus)
+        self.manager = SimObjectManager(self, bus)
+        self.devices = []
+        self.sent = 0
+        self.skipped = 0    # 구독 안 된 char 라서 못 보낸 notify
+        self.generator = Generator()
+        for _ in range(food):
+            self.add_device('food')
+        for _ in range(drink):
+            self.add_device('drink')
+
+    def add_device(self, kind):
+        device = SimDevice(self, self.bus, len(self.devices), kind)
+        self.devices.append(device)
+        for path, interfaces in device.objects():
+            self.manager.InterfacesAdded(dbus.ObjectPath(path), interfaces)
+        return device
+
+    def notify(self, device, uuid, s):
+        if device.chrcs[uuid].notify(s, self.stamp):
+            self.sent += 1
+        else:
+            self.skipped += 1
+
+    # 펌웨어 흉내: ACTION 에 '1' 이 오면 동작 후 '0' 으로 notify, AMOUNT 에 0 이 오면 '2' 로 notify
+    def written(self, chrc, s):
+        if not self.echo:
+            return
+        s = s.strip('\0')
+        number = int(s) if s.isdigit() else 0
+        if chrc.uuid == client.FOOD_CHR_ACTION_UUID and number:
+            GLib.timeout_add(int(ACTION_DELAY * 1000), self.action_done, chrc)
+        elif chrc.uuid == client.FOOD_CHR_AMOUNT_UUID and not number:
+            self.notify(chrc.device, chrc.uuid, '2')
+
+    def action_done(self, chrc):
+        self.notify(chrc.device, chrc.uuid, '0')
+        return False
+
+    # delay 초 뒤부터 rate(개/초) 로 모든 기기의 센서 char 에 돌아가면서 notify
+    def generate(self, rate, duration=None, delay=0):
+        targets = [(d, u) for d in self.devices for u in SENSOR_CHRCS if u in d.chrcs]
+        start = time.monotonic() + delay
+        state = {'due': 0.0, 'i': 0}
+
+        def tick():
+            now = time.monotonic()
+            if now < start:
+                return True
+            if duration is not None and now - start >= duration:
+                return False
+            state['due'] += rate * TICK_MS / 1000
+            n = int(state['due'])
+            state['due'] -= n
+            for _ in range(n):
+                device, uuid = targets[state['i'] % len(targets)]
+                state['i'] += 1
+                self.notify(device, uuid, self.generator.value(device, uuid))
+            return True
+        GLib.timeout_add(TICK_MS, tick)
+
+    def replay(self, path, speed=1.0):
+        events = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                offset, index, uuid, value = line.split(',', 3)
+                events.append((float(offset), int(index), uuid, value))
+        start = time.monotonic()
+        state = {'i': 0}
+
+        def step():
+            now = time.monotonic() - start
+            while state['i'] < len(events) and events[state['i']][0] / speed <= now:
+                offset, index, uuid, value = events[state['i']]
+                state['i'] += 1
+                self.notify(self.devices[index], uuid, value)
+            return state['i'] < len(events)
+        GLib.timeout_add(TICK_MS, step)
+
+    def write_summary(self):
+        lines = []
+        for device in self.devices:
+            for chrc in device.chrcs.values():
+                if chrc.writes:
+                    values = [w[1] for w in chrc.writes]
+                    lines.append('%s %s: %d writes, last %r' % (
+                        device.address, chrc.uuid[4:8], len(values), values[-1]))
+        return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='fake BlueZ for FHTH feeders')
+    parser.add_argument('--bus', help='existing bus address (default: start a private dbus-daemon)')
+    parser.add_argument('--food', type=int, default=1)
+    parser.add_argument('--drink', type=int, default=1)
+    parser.add_argument('--rate', type=float, default=0, help='generated notifies per second (all devices)')
+    parser.add_argument('--duration', type=float, help='stop generating after N seconds')
+    parser.add_argument('--delay', type=float, default=0, help='start generating after N seconds')
+    parser.add_argument('--replay', help='replay notify file')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed')
+    parser.add_argument('--stamp', action='store_true', help='add SimSentAt to notifies')
+    parser.add_argument('--no-echo', action='store_true', help='do not echo action/amount writes')
+    args = parser.parse_args()
+
+    DBusGMainLoop(set_as_default=True)
+    daemon = None
+    address = args.bus
+    if address is None:
+        daemon, address = start_private_bus()
+    bus = dbus.bus.BusConnection(address)
+    sim = Simulator(bus, args.food, args.drink, stamp=args.stamp,
+                    echo=not args.no_echo)
+    print('FHTH_BLUEZ_BUS=' + address, flush=True)
+
+    if args.rate:
+        sim.generate(args.rate, args.duration, args.delay)
+    if args.replay:
+        sim.replay(args.replay, args.speed)
+
+    loop = GLib.MainLoop()
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGTERM, loop.quit)
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print('sent %d notifies (%d not subscribed)' % (sim.sent, sim.skipped))
+        for line in sim.write_summary():
+            print(line)
+        if daemon is not None:
+            daemon.terminate()
+
+
+if __name__ == '__main__':
+    main()
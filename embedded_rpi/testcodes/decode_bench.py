@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# notify 값 디코딩 비용 비교
+#  - old: [bytes([v]).decode() for v in value] 두 번 + "".join / strr[0]
+#  - new: gatt_decoder.ascii_int / gatt_decoder.flag
+# dbus 모듈이 있으면 실제 콜백처럼 dbus.Array(dbus.Byte) 로 측정
+# 사용법: python3 testcodes/decode_bench.py [반복 수]
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import gatt_decoder
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+try:
+    import dbus
+
+    def make_value(s):
+        return dbus.Array([dbus.Byte(b) for b in s.encode()], signature='y')
+except ImportError:
+    def make_value(s):
+        return [b for b in s.encode()]
+
+LEFT = make_value('42')
+EATEN = make_value('1')
+
+
+def old_left():
+    [bytes([v]).decode() for v in LEFT]
+    strr = [bytes([v]).decode() for v in LEFT]
+    return int("".join(strr))
+
+
+def old_flag():
+    [bytes([v]).decode() for v in EATEN]
+    strr = [bytes([v]).decode() for v in EATEN]
+    if strr[0] == '0':
+        return False
+    elif strr[0] == '1':
+        return True
+
+
+def new_left():
+    return gatt_decoder.ascii_int(LEFT)
+
+
+def new_flag():
+    return gatt_decoder.flag(EATEN)
+
+
+def bench(name, fn):
+    t = timeit.timeit(fn, number=N)
+    print(f"{name:10s} {t / N * 1e9:8.1f} ns/call")
+    return t
+
+
+def main():
+    print(f"value type: {type(LEFT).__name__}, {N} calls")
+    assert old_left() == new_left() and old_flag() == new_flag()
+    a = bench("old_left", old_left)
+    b = bench("new_left", new_left)
+    print(f"left speedup x{a / b:.2f}")
+    a = bench("old_flag", old_flag)
+    b = bench("new_flag", new_flag)
+    print(f"flag speedup x{a / b:.2f}")
+
+
+if __name__ == '__main__':
+    main()
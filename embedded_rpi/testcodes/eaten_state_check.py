@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# 먹는 중 여부 상태 머신(eaten_state) 확인용
+# EATEN notify 열을 예전 로직(xor 트리거)과 새 상태 머신에 똑같이 넣고 pet/foodeat POST 수를 비교
+#  - trace 파일을 주면 (FHTH_TRACE 로 녹화한 것) 그 안의 EATEN notify 를 기기별로 사용
+#  - 없으면 하루치 가짜 데이터: 1초 간격, 하루 3번 5분씩 먹음 + 센서 깜빡임
+#    가짜 데이터는 정답(실제 먹은 횟수)을 알기 때문에 빠짐없이 잡는지도 확인함 (틀리면 exit 1)
+# 사용법: python3 testcodes/eaten_state_check.py [trace 파일 ...] [--on 5] [--off 15]
+import argparse
+import collections
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import eaten_state
+
+EATEN_UUID = '00002222-0000-1000-8000-00805f9b34fb'
+DAY = 24 * 3600
+MEALS = ((8 * 3600, 300), (13 * 3600, 240), (19 * 3600, 360))  # (시작 초, 길이 초)
+FLICKER = 0.03      # 샘플 하나가 반대로 튈 확률
+BURST = 0.0005      # 몇 초 동안 연속으로 튀기 시작할 확률
+
+
+def synthetic(seed=1):
+    rnd = random.Random(seed)
+    samples = []
+    burst = 0
+    for t in range(DAY):
+        eating = any(start <= t < start + length for start, length in MEALS)
+        value = eating
+        if burst:
+            burst -= 1
+            value = not eating
+        elif rnd.random() < BURST:
+            burst = rnd.randint(1, 3)
+        elif rnd.random() < FLICKER:
+            value = not eating
+        samples.append((float(t), value))
+    return {'synthetic': samples}
+
+
+def from_traces(paths):
+    import notify_trace
+    devices = collections.defaultdict(list)
+    for path in paths:
+        for ts, chrc_path, uuid, value in notify_trace.TraceReader(path):
+            if uuid == EATEN_UUID and value[:1] in (b'0', b'1'):
+                devices[chrc_path].append((ts, value[:1] == b'1'))
+    return devices
+
+
+# 예전 BLE_Client 로직: 트리거와 값이 다를 때마다 POST 하고 트리거를 뒤집음
+def old_posts(samples):
+    trg = False
+    posts = 0
+    for ts, value in samples:
+        if trg != value:
+            posts += 1
+            trg = not trg
+    return posts
+
+
+def new_transitions(samples, on_delay, off_delay):
+    sm = eaten_state.EatenStateMachine(on_delay, off_delay)
+    transitions = []
+    for ts, value in samples:
+        t = sm.update(value, ts)
+        if t is not None:
+            transitions.append(t)
+    return transitions, sm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('traces', nargs='*')
+    parser.add_argument('--on', type=float, default=5)
+    parser.add_argument('--off', type=float, default=15)
+    args = parser.parse_args()
+
+    devices = from_traces(args.traces) if args.traces else synthetic()
+    ok = True
+    for name, samples in devices.items():
+        old = old_posts(samples)
+        transitions, sm = new_transitions(samples, args.on, args.off)
+        new = len(transitions)
+        cut = (1 - new / old) * 100 if old else 0
+        print(f"{name}: {len(samples)} samples, old {old} posts, new {new} posts "
+              f"({cut:.1f}% fewer), {sm.glitches} glitches ignored")
+        for t in transitions[:10]:
+            print(f"    {t.previous!s:5} -> {t.state!s:5} at {t.at:9.1f} s "
+                  f"after {t.dwell:8.1f} s")
+
+        if not args.traces:
+            # 먹기 시작/끝마다 정확히 한 번씩, 실제 시각에서 delay 안에 잡아야 함
+            expected = []
+            for start, length in MEALS:
+                expected += [(True, start), (False, start + length)]
+            got = [(t.state, t.at) for t in transitions]
+            if len(got) != len(expected) or any(
+                    s != es or abs(at - eat) > max(args.on, args.off)
+                    for (s, at), (es, eat) in zip(got, expected)):
+                print("MISMATCH expected", expected)
+                ok = False
+            if new > old:
+                ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
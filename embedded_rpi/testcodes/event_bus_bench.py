@@ -0,0 +1,160 @@
+#!/usr/bin/python
+# 로컬 소비자에게 이벤트를 넘기는 두 경로 비교
+#  http: 지금까지 방식. post_data -> uploader.UploadQueue -> localhost HTTP POST (JSON)
+#  bus:  event_bus.EventBus.publish -> Unix 소켓 -> event_bus.Subscriber (binary frame)
+# 소비자는 별도 프로세스(이 스크립트를 --consume 으로 다시 실행). 이벤트를 다 받으면 자기 CPU 를 출력하고 끝남
+# 처리량 = 첫 이벤트 발행 -> 소비자가 마지막 이벤트를 받은 시각
+# CPU/event = 게이트웨이 쪽(이 프로세스, 업로더 스레드 포함) + 소비자 쪽, 각각 user+sys
+# 사용법: python3 testcodes/event_bus_bench.py [--events 20000] [--modes http,bus]
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http import server
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import event_bus
+import logs
+import uploader
+
+MODES = ('http', 'bus')
+ADDRESS = 'AA:BB:CC:DD:EE:01'
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+# 소비자: http 는 JSON POST 를 받는 서버, bus 는 구독자
+def consume_http(count):
+    done = threading.Event()
+    received = [0]
+
+    class Handler(server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            json.loads(self.rfile.read(length))
+            body = b'{}'
+            self.send_response(200)
+            self.send_header('Content-Length', len(body))
+            self.end_headers()
+            self.wfile.write(body)
+            received[0] += 1
+            if received[0] >= count:
+                done.set()
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    start = cpu_time()
+    print(httpd.server_address[1], flush=True)
+    done.wait()
+    return cpu_time() - start
+
+
+def consume_bus(count, path):
+    sub = event_bus.Subscriber(['food.*', 'drink.*'], path)
+    start = cpu_time()
+    print('ready', flush=True)
+    received = 0
+    while received < count:
+        if sub.recv() is None:
+            break
+        received += 1
+    return cpu_time() - start
+
+
+def spawn(mode, count, path):
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--consume', mode,
+                             '--events', str(count), '--socket', path],
+                            stdout=subprocess.PIPE, text=True)
+    return proc, proc.stdout.readline().strip()
+
+
+# 게이트웨이 콜백에서 나가는 것과 같은 모양: 남은 양 3, 먹음 1 비율
+def run_http(count, path):
+    proc, port = spawn('http', count, path)
+    queue = uploader.UploadQueue(uploader.HttpClient('127.0.0.1', int(port)), maxsize=count)
+    start_cpu = cpu_time()
+    start = time.monotonic()
+    for i in range(count):
+        now = time.strftime('%Y-%m-%d %H:%M:%S')
+        if i % 4:
+            queue.put({'LEFT': 120.5, 'DATE': now, 'ADDR': ADDRESS}, 'pet/foodleft')
+        else:
+            queue.put({'EATEN': True, 'DATE': now, 'ADDR': ADDRESS, 'DWELL': 5.0},
+                      'pet/foodeat')
+    queue.join()
+    consumer_cpu = float(proc.stdout.readline())
+    elapsed = time.monotonic() - start
+    gateway_cpu = cpu_time() - start_cpu
+    proc.wait()
+    queue.stop()
+    return elapsed, gateway_cpu, consumer_cpu, queue.stats()
+
+
+def run_bus(count, path):
+    bus = event_bus.EventBus(path)
+    bus.start()
+    proc, ready = spawn('bus', count, path)
+    # 구독 frame 이 서버 스레드에서 처리될 때까지
+    while not (bus.has_subscribers(event_bus.FOOD_LEFT) and
+               bus.has_subscribers(event_bus.FOOD_EATEN)):
+        time.sleep(0.001)
+    start_cpu = cpu_time()
+    start = time.monotonic()
+    for i in range(count):
+        if i % 4:
+            bus.publish(event_bus.FOOD_LEFT, ADDRESS, 120.5)
+        else:
+            bus.publish(event_bus.FOOD_EATEN, ADDRESS, True, 5.0)
+    consumer_cpu = float(proc.stdout.readline())
+    elapsed = time.monotonic() - start
+    gateway_cpu = cpu_time() - start_cpu
+    proc.wait()
+    stats = bus.stats()
+    bus.stop()
+    return elapsed, gateway_cpu, consumer_cpu, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--consume', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--socket', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logs.setup('WARNING')
+    if args.consume == 'http':
+        print(consume_http(args.events), flush=True)
+        return
+    if args.consume == 'bus':
+        print(consume_bus(args.events, args.socket), flush=True)
+        return
+
+    path = os.path.join(tempfile.mkdtemp(), 'events.sock')
+    print(f"{args.events} events per mode")
+    for mode in args.modes.split(','):
+        run = run_http if mode == 'http' else run_bus
+        elapsed, gateway_cpu, consumer_cpu, stats = run(args.events, path)
+        n = args.events
+        print(f"{mode:5s} {n / elapsed:9.0f} events/s  "
+              f"cpu/event gateway {gateway_cpu / n * 1e6:7.1f} us  "
+              f"consumer {consumer_cpu / n * 1e6:7.1f} us  "
+              f"total {(gateway_cpu + consumer_cpu) / n * 1e6:7.1f} us  {stats}")
+
+
+if __name__ == '__main__':
+    main()
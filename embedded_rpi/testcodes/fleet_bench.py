@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# 기기 수에 따른 notify 1건당 처리 비용 측정
+# 가짜 급식기/급수기를 N 대 등록하고 (BLE 연결 없음)
+# 기기/UUID 별 notify 콜백에 PropertiesChanged 값을 직접 넣어서 시간 측정
+# 업로드는 실제로 보내지 않고 개수만 셈
+# 사용법: python3 testcodes/fleet_bench.py [이벤트 수]
+import contextlib
+import os
+import random
+import sys
+import time
+
+import dbus
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import BLE_Client as client
+import feeder
+
+N_EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+FLEET_SIZES = (1, 2, 16, 64)
+
+
+class CountingQueue:
+    def __init__(self):
+        self.count = 0
+
+    def put(self, data, api, urgent=False):
+        self.count += 1
+
+    def stats(self):
+        return {'enqueued': self.count}
+
+
+def value(s):
+    return dbus.Array([dbus.Byte(b) for b in s.encode()], signature='y')
+
+
+def make_fleet(n):
+    client.feeders.clear()
+    client.feeder_paths.clear()
+    callbacks = []
+    for i in range(n):
+        kind = feeder.FOOD if i % 2 == 0 else feeder.DRINK
+        address = '00:00:00:00:%02X:%02X' % (i // 256, i % 256)
+        path = '/org/bluez/hci0/dev_' + address.replace(':', '_')
+        f = client.add_feeder(address, path, f'SIM_{kind}_{i}', kind)
+        for uuid, entry in client.CHRC_TABLE.items():
+            if entry.service == (client.FOOD_SVC_UUID if kind == feeder.FOOD
+                                 else client.DRINK_SVC_UUID):
+                callbacks.append((uuid, client.make_notify_cb(f, uuid)))
+    return callbacks
+
+
+def make_events(callbacks):
+    rnd = random.Random(1)
+    samples = {
+        client.FOOD_CHR_LEFT_UUID: [value(str(v)) for v in range(40, 60)],
+        client.FOOD_CHR_EATEN_UUID: [value('0'), value('1')],
+        client.FOOD_CHR_AMOUNT_UUID: [value('100')],
+        client.FOOD_CHR_ACTION_UUID: [value('0')],
+        client.DRINK_CHR_DRINK_UUID: [value('0'), value('1')],
+        client.DRINK_CHR_WATER_UUID: [value('0'), value('1'), value('1')],
+    }
+    events = []
+    for _ in range(N_EVENTS):
+        uuid, cb = rnd.choice(callbacks)
+        events.append((cb, {'Value': rnd.choice(samples[uuid])}))
+    return events
+
+
+def main():
+    sink = CountingQueue()
+    client.upload_queue = sink
+    with open(os.devnull, 'w') as devnull:
+        for n in FLEET_SIZES:
+            callbacks = make_fleet(n)
+            events = make_events(callbacks)
+            sink.count = 0
+            with contextlib.redirect_stdout(devnull):
+                t0 = time.perf_counter()
+                for cb, props in events:
+                    cb(client.GATT_CHRC_IFACE, props, [])
+                elapsed = time.perf_counter() - t0
+            print(f"{n:3d} devices  {N_EVENTS} events  "
+                  f"{elapsed / N_EVENTS * 1e6:7.2f} us/event  "
+                  f"uploads {sink.count}")
+
+
+if __name__ == '__main__':
+    main()
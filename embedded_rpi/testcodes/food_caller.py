@@ -15,5 +15,6 @@ print(proxy)
 print(iface)
 # print(props)
 
-iface.activate_action()
-iface.set_amount("300")
+# 빈 문자열: 모든 급식기
+iface.activate_action("")
+iface.set_amount("", "300")
@@ -0,0 +1,242 @@
+#!/usr/bin/python
+# 텔레메트리 부하 아래에서 모터 명령 -> I2C 완료 지연 측정
+#  inproc: 예전 구조. notify 를 처리하는 루프 스레드가 모터 명령도 받아서 I2C 까지 직접 함
+#  proc:   지금 구조. 웹(/control)처럼 motor.fhth activate_motor 를 D-Bus 로 부름
+#          서비스는 motor_proc 프로세스에 있어서 루프를 안 거치고, I2C 가 끝나면 리턴 (SCHED_FIFO)
+#  direct: D-Bus 없이 다른 로컬 프로세스가 motor_proc 소켓으로 바로 보내는 경우
+# proc 은 이 스크립트가 띄운 전용 세션 버스(dbus-daemon)를 씀 (돌고 있는 게이트웨이와 안 겹치게)
+# 부하: 루프 스레드가 초당 --rate 개 가짜 notify 처리 (디코딩 + 업로드 큐에 넣기)
+#       + uploader.UploadQueue 워커가 로컬 더미 서버로 HTTP POST (requests, 같은 프로세스 GIL)
+# 명령은 --cmd-rate 개/초, 지연 = 명령 발생 -> I2C 끝난 시각 (CLOCK_MONOTONIC, 프로세스 간 같은 시계)
+# proc 은 activate_motor 리턴 시각이라 D-Bus reply 한 번이 더 들어감
+# 기본은 I2C 없이 --i2c-ms 만큼 기다리는 DryRunMotor. Pi 에서는 --real 로 실제 모터 HAT 사용
+# 사용법: python3 testcodes/motor_latency_bench.py [--rate 2000] [--cmd-rate 20] [--duration 10] [--real]
+import argparse
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http import server
+
+import dbus
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import gatt_decoder
+import logs
+import motor_proc
+import uploader
+
+MODES = ('inproc', 'proc', 'direct')
+VALUE = b'42'
+
+
+class DummyHandler(server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Length', len(body))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# GLib 메인 루프 대신: notify 와 (inproc 에서는) 모터 명령이 한 큐에 도착하는 순서대로 처리됨
+def event_loop(events, upload_queue, motor, done):
+    while True:
+        event = events.get()
+        if event is None:
+            return
+        kind, at = event
+        if kind == 'notify':
+            left = gatt_decoder.ascii_int(VALUE)
+            upload_queue.put({'LEFT': left, 'DATE': at, 'ADDR': 'bench'}, 'pet/foodleft')
+        else:
+            motor.go()
+            done.append(time.monotonic() - at)
+
+
+# notify 를 초당 rate 개, 1ms 단위로 묶어서 루프에 넣음
+def telemetry(events, rate, stop):
+    per_tick = rate / 1000
+    owed = 0.0
+    next_tick = time.monotonic()
+    while not stop.is_set():
+        owed += per_tick
+        now = time.monotonic()
+        while owed >= 1:
+            events.put(('notify', now))
+            owed -= 1
+        next_tick += 0.001
+        delay = next_tick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+# send(명령 발생 시각) 은 모드별로 다름
+def commander(send, cmd_rate, stop):
+    while not stop.wait(1 / cmd_rate):
+        send(time.monotonic())
+
+
+def reply_reader(client, replies, stop):
+    while not stop.is_set():
+        reply = client.read_reply(0.1)
+        if reply is not None:
+            seq, received, finished = reply
+            replies[seq] = finished
+
+
+# 전용 세션 버스. (dbus-daemon 프로세스, 주소)
+def session_bus():
+    proc = subprocess.Popen(['dbus-daemon', '--session', '--nofork', '--print-address'],
+                            stdout=subprocess.PIPE, text=True)
+    return proc, proc.stdout.readline().strip()
+
+
+def motor_iface(address, wait=2.0):
+    bus = dbus.bus.BusConnection(address)
+    deadline = time.monotonic() + wait
+    while not bus.name_has_owner(motor_proc.MOTOR_SERVICE_DOMAIN):
+        if time.monotonic() > deadline:
+            raise RuntimeError("motor.fhth not on the session bus")
+        time.sleep(0.01)
+    proxy = bus.get_object(motor_proc.MOTOR_SERVICE_DOMAIN, motor_proc.MOTOR_SERVICE_PATH)
+    return dbus.Interface(proxy, dbus_interface=motor_proc.MOTOR_SERVICE_IFACE)
+
+
+def percentiles(values):
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(len(values) * p))] * 1000
+    return 'p50 %7.3f  p90 %7.3f  p99 %7.3f  max %7.3f ms' % (
+        pick(0.5), pick(0.9), pick(0.99), values[-1] * 1000)
+
+
+def run(mode, args, port, sock_path, bus_address):
+    upload_queue = uploader.UploadQueue(uploader.HttpClient('127.0.0.1', port),
+                                        maxsize=4096)
+    events = queue.Queue()
+    stop = threading.Event()
+    issued = {}
+    replies = {}
+    done = []
+    failed = [0]
+    reader = proc = motor = None
+
+    if mode != 'inproc':
+        proc = motor_proc.start(args.channel, args.priority, sock_path,
+                                dry_run=not args.real, i2c_time=args.i2c_ms / 1000,
+                                dbus_service=mode == 'proc')
+
+    if mode == 'inproc':
+        if args.real:
+            import rpi_motor
+            motor = rpi_motor.MotorControl(args.channel)
+        else:
+            motor = motor_proc.DryRunMotor(args.i2c_ms / 1000)
+
+        def send(at):
+            events.put(('cmd', at))
+    elif mode == 'proc':
+        iface = motor_iface(bus_address)
+
+        def send(at):
+            try:
+                iface.activate_motor('go')
+            except dbus.exceptions.DBusException:
+                failed[0] += 1
+                return
+            done.append(time.monotonic() - at)
+    else:
+        client = motor_proc.MotorClient(sock_path, reply=True)
+        reader_stop = threading.Event()
+        reader = threading.Thread(target=reply_reader, args=(client, replies, reader_stop))
+        reader.start()
+
+        def send(at):
+            seq = client.go()
+            if seq is not None:
+                issued[seq] = at
+
+    loop = threading.Thread(target=event_loop, args=(events, upload_queue, motor, done))
+    producers = [
+        threading.Thread(target=telemetry, args=(events, args.rate, stop)),
+        threading.Thread(target=commander, args=(send, args.cmd_rate, stop)),
+    ]
+    loop.start()
+    for t in producers:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in producers:
+        t.join()
+    # 루프에 밀린 명령까지 다 처리해야 느린 쪽 지연이 빠지지 않음
+    backlog = events.qsize()
+    events.put(None)
+    loop.join()
+    upload_queue.join()
+    upload_queue.stop()
+    if reader is not None:
+        time.sleep(0.2)
+        reader_stop.set()
+        reader.join()
+        done = [replies[seq] - at for seq, at in issued.items() if seq in replies]
+        failed[0] = len(issued) - len(done)
+    if proc is not None:
+        proc.terminate()
+        proc.wait()
+    return done, failed[0], backlog, upload_queue.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', type=float, default=2000, help='telemetry notifies per second')
+    parser.add_argument('--cmd-rate', type=float, default=20, help='motor commands per second')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per mode')
+    parser.add_argument('--i2c-ms', type=float, default=1.0, help='dry-run I2C time per command')
+    parser.add_argument('--real', action='store_true', help='drive the motor HAT over I2C')
+    parser.add_argument('--channel', type=int, default=2)
+    parser.add_argument('--priority', type=int, default=50)
+    parser.add_argument('--modes', default=','.join(MODES))
+    args = parser.parse_args()
+
+    logs.setup('WARNING')
+    # 모터 프로세스 로그도 조용히
+    os.environ.setdefault('FHTH_LOG_LEVEL', 'WARNING')
+    httpd = server.ThreadingHTTPServer(('127.0.0.1', 0), DummyHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    sock_path = os.path.join(tempfile.mkdtemp(), 'motor.sock')
+    modes = args.modes.split(',')
+    daemon = bus_address = None
+    if 'proc' in modes:
+        daemon, bus_address = session_bus()
+        # 모터 프로세스가 이 버스에 motor.fhth 를 잡음
+        os.environ['DBUS_SESSION_BUS_ADDRESS'] = bus_address
+
+    print(f"telemetry {args.rate:.0f}/s, commands {args.cmd_rate:.0f}/s, "
+          f"{args.duration:.0f} s per mode, {'real I2C' if args.real else f'dry-run I2C {args.i2c_ms} ms'}")
+    for mode in modes:
+        done, failed, backlog, stats = run(mode, args, httpd.server_address[1], sock_path,
+                                           bus_address)
+        if not done:
+            print(f"{mode:7s} no commands completed")
+            continue
+        print(f"{mode:7s} n={len(done):5d}  {percentiles(done)}  failed {failed}  "
+              f"(loop backlog {backlog}, uploads sent {stats['sent']} overflow {stats['overflow']})")
+    httpd.shutdown()
+    if daemon is not None:
+        daemon.terminate()
+        daemon.wait()
+
+
+if __name__ == '__main__':
+    main()
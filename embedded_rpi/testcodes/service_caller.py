@@ -21,8 +21,9 @@ print(iface)
 # print(proxy.foo(dbus_interface=SERVICE_IFACE))
 # print(proxy.action_activate(dbus_interface=SERVICE_IFACE))
 
-iface.activate_action()
-iface.set_amount("300")
+# 빈 문자열: 모든 급식기
+iface.activate_action("")
+iface.set_amount("", "300")
 
 # """Invoke a method that throws an exception and catch it."""
 # try:
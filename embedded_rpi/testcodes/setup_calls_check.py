@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# 연결 직후 서비스/char resolve 에 드는 D-Bus 호출 수 비교 (하드웨어, D-Bus 데몬 없이)
+# 가짜 bus 가 get_object(introspect) / GetAll / StartNotify 호출을 세기만 함
+#  legacy:  user-009 이전 방식. 서비스/char 마다 get_object(Introspect 포함) + GetAll
+#  current: BLE_Client.start_device. props 는 GetManagedObjects 스냅샷(object_index)에서 꺼냄
+# 객체 구성은 bluez_sim.py 와 같음 (FHTH_FOOD: 서비스 1 + char 4, FHTH_DRINK: 서비스 1 + char 2)
+# 사용법: python3 testcodes/setup_calls_check.py [--devices 16]
+import argparse
+import collections
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import BLE_Client as client
+import logs
+
+ADAPTER_PATH = '/org/bluez/hci0'
+FOOD_CHRCS = (client.FOOD_CHR_LEFT_UUID, client.FOOD_CHR_EATEN_UUID,
+              client.FOOD_CHR_AMOUNT_UUID, client.FOOD_CHR_ACTION_UUID)
+DRINK_CHRCS = (client.DRINK_CHR_DRINK_UUID, client.DRINK_CHR_WATER_UUID)
+FLAGS = ['read', 'write', 'notify']
+
+
+class CountingProxy:
+    def __init__(self, bus, path):
+        self.bus = bus
+        self.object_path = path
+
+    def GetAll(self, iface, dbus_interface=None):
+        self.bus.calls['GetAll'] += 1
+        return self.bus.objects[self.object_path][iface]
+
+    def StartNotify(self, reply_handler=None, error_handler=None, dbus_interface=None):
+        self.bus.calls['StartNotify'] += 1
+
+    def connect_to_signal(self, signal_name, handler, **kwargs):
+        self.bus.calls['match'] += 1
+        return self
+
+
+class CountingBus:
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = collections.Counter()
+
+    # dbus-python 기본값은 introspect=True (프록시 만들 때 Introspect 왕복)
+    def get_object(self, bus_name, path, introspect=True):
+        self.calls['get_object'] += 1
+        if introspect:
+            self.calls['Introspect'] += 1
+        return CountingProxy(self, str(path))
+
+
+def make_objects(devices):
+    objects = {}
+    for i in range(devices):
+        food = i % 2 == 0
+        address = 'F0:F0:00:00:%02X:%02X' % (i // 256, i % 256)
+        dev_path = ADAPTER_PATH + '/dev_' + address.replace(':', '_')
+        svc_uuid = client.FOOD_SVC_UUID if food else client.DRINK_SVC_UUID
+        objects[dev_path] = {client.DEVICE_IFACE: {
+            'Address': address, 'Name': 'FHTH_FOOD' if food else 'FHTH_DRINK',
+            'UUIDs': [svc_uuid], 'Connected': True}}
+        svc_path = dev_path + '/service0001'
+        objects[svc_path] = {client.GATT_SERVICE_IFACE: {'UUID': svc_uuid, 'Primary': True}}
+        for n, uuid in enumerate(FOOD_CHRCS if food else DRINK_CHRCS):
+            objects[svc_path + '/char%04x' % (n + 2)] = {client.GATT_CHRC_IFACE: {
+                'UUID': uuid, 'Flags': FLAGS, 'Value': b'0'}}
+    return objects
+
+
+# user-009 이전 process_service / process_chrc 와 같은 호출 순서
+def legacy_resolve(bus, f):
+    for svc_path in client.object_index.children(f.path, client.GATT_SERVICE_IFACE):
+        service = bus.get_object(client.BLUEZ_SERVICE_NAME, svc_path)
+        svc_props = service.GetAll(client.GATT_SERVICE_IFACE, dbus_interface=client.DBUS_PROP_IFACE)
+        if svc_props['UUID'] not in client.SERVICE_UUIDS:
+            continue
+        for chrc_path in client.object_index.children(svc_path, client.GATT_CHRC_IFACE):
+            chrc = bus.get_object(client.BLUEZ_SERVICE_NAME, chrc_path)
+            chrc_props = chrc.GetAll(client.GATT_CHRC_IFACE, dbus_interface=client.DBUS_PROP_IFACE)
+            if chrc_props['UUID'] in client.CHRC_TABLE:
+                f.chrcs[chrc_props['UUID']] = (chrc, chrc_props)
+    for uuid in list(f.chrcs):
+        client.subscribe_chrc(f, uuid)
+
+
+def run(mode, devices):
+    objects = make_objects(devices)
+    bus = CountingBus(objects)
+    client.backend = client.DbusBackend(bus)
+    client.feeders.clear()
+    client.feeder_paths.clear()
+    client.chrc_owner.clear()
+    client.object_index = client.gatt_index.ObjectIndex()
+    client.object_index.load(objects)
+
+    for path in client.object_index.find(client.DEVICE_IFACE):
+        dd = client.object_index.props(path, client.DEVICE_IFACE)
+        f = client.add_feeder(dd['Address'], path, dd['Name'], client.match_device(dd))
+        f.supervisor.set_state(client.RESOLVING)
+        if mode == 'legacy':
+            legacy_resolve(bus, f)
+        else:
+            client.start_device(f)
+
+    subscribed = sum(len(f.chrcs) for f in client.feeders.values())
+    return bus.calls, subscribed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=16, help='half food, half drink')
+    args = parser.parse_args()
+
+    logs.setup('WARNING')
+    print(f"{args.devices} devices ({(args.devices + 1) // 2} food, {args.devices // 2} drink)")
+    for mode in ('legacy', 'current'):
+        calls, subscribed = run(mode, args.devices)
+        print(f"{mode:8s} chrcs {subscribed:3d}  Introspect {calls['Introspect']:4d}  "
+              f"GetAll {calls['GetAll']:4d}  get_object {calls['get_object']:4d}  "
+              f"StartNotify {calls['StartNotify']:4d}  "
+              f"round trips/device {(calls['Introspect'] + calls['GetAll']) / args.devices:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/python
+# 가짜 BlueZ(bluez_sim.py) 로 notify -> 콜백 -> 업로드 처리량/지연 측정
+#  1. 새 dbus-daemon 을 띄우고 bluez_sim.py 를 별도 프로세스로 실행 (실제 bluetoothd 자리)
+#  2. 이 프로세스에서 BLE_Client 의 연결/구독/디코딩/필터/업로드 큐를 그대로 돌림
+#  3. HTTP 대신 TimingClient 가 업로드를 받아서 시간만 잼
+# 시뮬레이터가 notify 에 넣은 SimSentAt(monotonic) 기준으로
+#  - transport: 시뮬레이터 전송 -> 콜백 시작 (D-Bus)
+#  - callback:  콜백 시작 -> 끝 (디코딩, 필터, 큐에 넣기)
+#  - upload:    시뮬레이터 전송 -> 업로드 워커가 보냄 (batch 로 나중에 나가는 LEFT 는 제외)
+# --aio 를 주면 같은 측정을 aio_gateway(asyncio + dbus-next) 런타임으로 함
+# 두 번 돌려서 GLib 버전과 지연/CPU(이 프로세스의 user+sys, 시뮬레이터 제외) 비교
+# 사용법: python3 testcodes/sim_bench.py [--rate 2000] [--devices 16] [--duration 10] [--spool] [--aio]
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import dbus
+from dbus.mainloop.glib import DBusGMainLoop
+from gi.repository import GLib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import BLE_Client as client
+import logs
+import scheduler
+import spool
+import uploader
+import bluez_sim
+
+SETTLE = 2.0    # 구독이 끝날 때까지 기다리는 시간(초)
+
+current = {'sent': None}
+transport = []
+callback = []
+upload = []
+
+
+class TimingClient:
+    def post(self, api, data):
+        sent = data.pop('_SIM_SENT', None)
+        if sent is not None:
+            upload.append(time.monotonic() - sent)
+        return 200
+
+    def close(self):
+        pass
+
+
+class AsyncTimingClient(TimingClient):
+    async def post(self, api, data):
+        return TimingClient.post(self, api, data)
+
+
+# 콜백 안에서 들어온 업로드에만 notify 전송 시각을 붙임
+class Stamping:
+    def put(self, data, api, urgent=False):
+        if current['sent'] is not None:
+            data['_SIM_SENT'] = current['sent']
+        super().put(data, api, urgent)
+
+
+class StampingQueue(Stamping, uploader.UploadQueue):
+    pass
+
+
+def timed_make_notify_cb(make_notify_cb):
+    def make(f, uuid):
+        cb = make_notify_cb(f, uuid)
+
+        def notify_cb(iface, changed_props, invalidated_props):
+            sent = changed_props.get('SimSentAt')
+            if sent is None:
+                return cb(iface, changed_props, invalidated_props)
+            received = time.monotonic()
+            current['sent'] = float(sent)
+            cb(iface, changed_props, invalidated_props)
+            current['sent'] = None
+            transport.append(received - sent)
+            callback.append(time.monotonic() - received)
+        return notify_cb
+    return make
+
+
+def percentiles(values):
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(len(values) * p))] * 1000
+    return 'p50 %8.3f  p90 %8.3f  p99 %8.3f  max %8.3f ms' % (
+        pick(0.5), pick(0.9), pick(0.99), values[-1] * 1000)
+
+
+def run_glib(args, address, upload_spool):
+    DBusGMainLoop(set_as_default=True)
+    client.backend = client.DbusBackend(dbus.bus.BusConnection(address))
+    client.upload_queue = StampingQueue(TimingClient(), spool=upload_spool)
+    client.feeding_scheduler = scheduler.Scheduler(GLib.timeout_add, GLib.source_remove)
+
+    loop = GLib.MainLoop()
+    GLib.timeout_add_seconds(1, client.poll_batches)
+    GLib.timeout_add(int((SETTLE + args.duration + 1) * 1000), loop.quit)
+    client.watch_bluez()
+    client.connect_devices()
+    loop.run()
+    if upload_spool is None:
+        client.upload_queue.join()
+    else:
+        time.sleep(1)
+
+
+async def run_aio(args, address, upload_spool):
+    import aio_gateway
+    import aio_uploader
+
+    class AsyncStampingQueue(Stamping, aio_uploader.AsyncUploadQueue):
+        pass
+
+    timers = aio_gateway.LoopTimers(asyncio.get_running_loop())
+    client.backend = aio_gateway.Backend(timers)
+    aio_gateway.bus = await aio_gateway.connect_bus(address)
+    client.upload_queue = AsyncStampingQueue(AsyncTimingClient(), spool=upload_spool)
+    client.upload_queue.start()
+    client.feeding_scheduler = scheduler.Scheduler(timers.add, timers.remove)
+
+    timers.add(1000, client.poll_batches)
+    await aio_gateway.watch_bluez()
+    client.connect_devices()
+    await asyncio.sleep(SETTLE + args.duration + 1)
+    if upload_spool is None:
+        await client.upload_queue.join()
+    else:
+        await asyncio.sleep(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', type=float, default=2000, help='notifies per second')
+    parser.add_argument('--devices', type=int, default=16, help='half food, half drink')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--spool', action='store_true', help='upload through the sqlite spool')
+    parser.add_argument('--aio', action='store_true', help='run the asyncio gateway instead of GLib')
+    args = parser.parse_args()
+
+    logs.setup('WARNING')
+    daemon, address = bluez_sim.start_private_bus()
+    food = (args.devices + 1) // 2
+    sim = subprocess.Popen([sys.executable, bluez_sim.__file__, '--bus', address,
+                            '--food', str(food), '--drink', str(args.devices - food),
+                            '--rate', str(args.rate), '--duration', str(args.duration),
+                            '--delay', str(SETTLE), '--stamp'],
+                           stdout=subprocess.PIPE, text=True)
+    sim.stdout.readline()   # 시뮬레이터가 org.bluez 이름을 잡을 때까지 대기
+
+    tmp = tempfile.mkdtemp()
+    upload_spool = spool.Spool(os.path.join(tmp, 'spool.db')) if args.spool else None
+    client.make_notify_cb = timed_make_notify_cb(client.make_notify_cb)
+
+    cpu_start = time.process_time()
+    if args.aio:
+        asyncio.run(run_aio(args, address, upload_spool))
+    else:
+        run_glib(args, address, upload_spool)
+    cpu = time.process_time() - cpu_start
+
+    sim.terminate()
+    sim_out = sim.communicate()[0]
+    daemon.terminate()
+
+    subscribed = sum(f.supervisor.state == client.SUBSCRIBED for f in client.feeders.values())
+    print(f"runtime {'aio' if args.aio else 'glib'}: devices {subscribed}/{args.devices} subscribed, "
+          f"target {args.rate:.0f}/s, received {len(transport)} "
+          f"({len(transport) / args.duration:.0f}/s)")
+    print(f"cpu {cpu:.2f} s ({cpu / len(transport) * 1e6 if transport else 0:.1f} us/notify)")
+    for name, values in (('transport', transport), ('callback', callback),
+                         ('upload', upload)):
+        if values:
+            print(f"{name:9s} n={len(values):7d}  {percentiles(values)}")
+    print("upload stats:", client.upload_queue.stats())
+    for line in sim_out.strip().splitlines():
+        print("sim:", line)
+
+
+if __name__ == '__main__':
+    main()
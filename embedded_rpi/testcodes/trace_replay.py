@@ -0,0 +1,155 @@
+#!/usr/bin/python
+# 녹화한 notify trace(FHTH_TRACE=파일 로 BLE_Client 실행) 를 같은 콜백 경로로 다시 돌림
+# BLE 연결 없이 기기/UUID 별 make_notify_cb 콜백에 녹화된 값을 그대로 넣음
+#  --speed 1   녹화된 시간 간격 그대로
+#  --speed 10  10배 빠르게
+#  --speed 0   기다리지 않고 최대 속도 (처리량 회귀 비교용)
+# 업로드는 기본으로 개수만 셈. --upload 를 주면 실제 uploader 로 localhost 서버에 보냄
+# --profile 을 주면 cProfile 로 콜백(food_eaten_changed_cb 등) 비용 상위 20개 출력
+# 기기 상태(필터, 먹음 debounce, batcher 창, 물 부족 알림)는 trace 시각을 따라가는 가짜 시계로 돌림
+# 그래서 몇 배속으로 재생해도 상태 전이/묶이는 양은 녹화 당시와 같음
+# 사용법: python3 testcodes/trace_replay.py <trace 파일> [--speed N] [--upload] [--profile]
+import argparse
+import collections
+import contextlib
+import cProfile
+import os
+import pstats
+import sys
+import time
+
+import dbus
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import BLE_Client as client
+import logs
+import notify_trace
+import uploader
+
+POLL_INTERVAL = 1.0
+
+
+# 재생 중인 record 의 trace 시각 (초)
+class TraceClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingQueue:
+    def __init__(self):
+        self.apis = collections.Counter()
+
+    def put(self, data, api, urgent=False):
+        self.apis[api] += 1
+
+    def join(self):
+        pass
+
+    def stats(self):
+        return dict(self.apis)
+
+
+def device_path(chrc_path):
+    return chrc_path.split('/service')[0]
+
+
+def address_of(dev_path):
+    name = dev_path.rsplit('/', 1)[-1]
+    return name[4:].replace('_', ':') if name.startswith('dev_') else name
+
+
+# trace 에 나오는 char 마다 가짜 기기 + notify 콜백을 만듦
+def make_callbacks(reader, clock):
+    callbacks = {}
+    for ts, path, uuid, value in reader:
+        if (path, uuid) in callbacks:
+            continue
+        entry = client.CHRC_TABLE.get(uuid)
+        if entry is None:
+            callbacks[(path, uuid)] = None
+            continue
+        dev_path = device_path(path)
+        f = client.feeder_paths.get(dev_path)
+        if f is None:
+            kind = 'food' if entry.service == client.FOOD_SVC_UUID else 'drink'
+            f = client.add_feeder(address_of(dev_path), dev_path,
+                                  'TRACE_' + kind.upper(), kind, clock=clock)
+        callbacks[(path, uuid)] = client.make_notify_cb(f, uuid)
+    return callbacks
+
+
+def replay(reader, callbacks, speed, clock):
+    iface = client.GATT_CHRC_IFACE
+    start = None
+    wall_start = time.monotonic()
+    next_poll = None
+    events = 0
+    for ts, path, uuid, value in reader:
+        cb = callbacks[(path, uuid)]
+        if cb is None:
+            continue
+        if start is None:
+            start = ts
+            next_poll = ts + POLL_INTERVAL
+        if speed:
+            due = wall_start + (ts - start) / speed
+            now = time.monotonic()
+            if due > now:
+                time.sleep(due - now)
+        # 게이트웨이의 1초 poll_batches 타이머도 trace 시각 기준으로
+        while next_poll <= ts:
+            clock.now = next_poll
+            client.poll_batches()
+            next_poll += POLL_INTERVAL
+        clock.now = ts
+        props = {'Value': dbus.Array([dbus.Byte(b) for b in value], signature='y')}
+        cb(iface, props, [])
+        events += 1
+    client.poll_batches()
+    return events, time.monotonic() - wall_start, (ts - start) if start is not None else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trace')
+    parser.add_argument('--speed', type=float, default=0, help='0 = as fast as possible')
+    parser.add_argument('--upload', action='store_true', help='send to the local relay')
+    parser.add_argument('--profile', action='store_true')
+    args = parser.parse_args()
+
+    logs.setup('WARNING')
+    reader = notify_trace.TraceReader(args.trace)
+    clock = TraceClock()
+    callbacks = make_callbacks(reader, clock)
+    if args.upload:
+        client.upload_queue = uploader.UploadQueue()
+    else:
+        client.upload_queue = CountingQueue()
+
+    profiler = cProfile.Profile() if args.profile else None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if profiler is not None:
+            profiler.enable()
+        events, elapsed, span = replay(reader, callbacks, args.speed, clock)
+        if profiler is not None:
+            profiler.disable()
+    client.upload_queue.join()
+
+    print(f"{events} events from {len(client.feeders)} devices, "
+          f"trace span {span:.1f} s, replayed in {elapsed:.2f} s "
+          f"({events / elapsed if elapsed else 0:.0f} events/s, "
+          f"{elapsed / events * 1e6 if events else 0:.2f} us/event)")
+    print("uploads:", client.upload_queue.stats())
+    for f in client.feeders.values():
+        print("filters:", f, f.filters.stats())
+        if f.kind == 'food':
+            print("eaten:", f, f.eaten_state.stats())
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+
+
+if __name__ == '__main__':
+    main()
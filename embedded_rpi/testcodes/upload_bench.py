@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# 이벤트 1개당 업로드 비용 비교
+#  - old: 매번 requests.post (이벤트마다 새 TCP 연결)
+#  - pooled: uploader.HttpClient (keep-alive 커넥션 재사용)
+# 로컬에 keep-alive 되는 더미 서버를 띄워서 측정함
+# 사용법: python3 testcodes/upload_bench.py [이벤트 수]
+import os
+import sys
+import threading
+import time
+from http import server
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import uploader
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+API = 'pet/foodleft'
+DATA = {'LEFT': '42', 'DATE': '20211001 12:00:00'}
+
+
+class DummyHandler(server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 헤더/바디를 따로 write 하므로 Nagle 끄지 않으면 delayed ACK 때문에 40ms씩 걸림
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', len(body))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(name, send):
+    t0 = time.perf_counter()
+    c0 = time.process_time()
+    for _ in range(N):
+        send()
+    wall = time.perf_counter() - t0
+    cpu = time.process_time() - c0
+    print(f"{name:8s} {N} events  wall {wall / N * 1e3:7.3f} ms/event"
+          f"  cpu {cpu / N * 1e3:7.3f} ms/event")
+    return wall
+
+
+def main():
+    srv = server.ThreadingHTTPServer(('127.0.0.1', 0), DummyHandler)
+    srv.daemon_threads = True
+    port = srv.server_address[1]
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+
+    url = f'http://127.0.0.1:{port}/{API}'
+    client = uploader.HttpClient(host='127.0.0.1', port=port, pool_size=1)
+
+    old = run("old", lambda: requests.post(url, json=DATA, headers={}))
+    new = run("pooled", lambda: client.post(API, DATA))
+    print(f"speedup x{old / new:.2f}")
+
+    client.close()
+    srv.shutdown()
+
+
+if __name__ == '__main__':
+    main()
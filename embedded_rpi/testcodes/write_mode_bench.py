@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# write 방식별 지연 비교 (실제 급식기 필요, 이미 연결된 상태여야 함)
+#  - request: 응답 있는 write. WriteValue reply 까지
+#  - command: write-without-response. WriteValue reply(큐에 들어감) 까지 / notify echo 까지
+# 기본은 AMOUNT char 에 '100' 을 씀 (ACTION 은 실제로 사료가 나가므로 주의)
+# 사용법: python3 testcodes/write_mode_bench.py <BLE 주소> [횟수] [char UUID] [값]
+import os
+import statistics
+import sys
+import time
+
+import dbus
+from dbus.mainloop.glib import DBusGMainLoop
+from gi.repository import GLib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import BLE_Client as client
+
+ADDRESS = sys.argv[1]
+N = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+UUID = sys.argv[3] if len(sys.argv) > 3 else client.FOOD_CHR_AMOUNT_UUID
+VALUE = dbus.Array([dbus.Byte(b) for b in
+                    (sys.argv[4] if len(sys.argv) > 4 else '100').encode()],
+                   signature='y')
+TIMEOUT = 2.0
+
+
+def find_chrc(bus):
+    om = dbus.Interface(bus.get_object(client.BLUEZ_SERVICE_NAME, '/'),
+                        client.DBUS_OM_IFACE)
+    dev_path = None
+    objects = om.GetManagedObjects()
+    for path, interfaces in objects.items():
+        dd = interfaces.get(client.DEVICE_IFACE)
+        if dd is not None and dd['Address'] == ADDRESS:
+            dev_path = path
+    if dev_path is None:
+        sys.exit('device not found: ' + ADDRESS)
+    for path, interfaces in objects.items():
+        props = interfaces.get(client.GATT_CHRC_IFACE)
+        if props is not None and path.startswith(dev_path + '/') \
+                and props['UUID'] == UUID:
+            return bus.get_object(client.BLUEZ_SERVICE_NAME, path)
+    sys.exit('characteristic not found: ' + UUID)
+
+
+class Bench:
+    def __init__(self, chrc, mode):
+        self.chrc = chrc
+        self.mode = mode
+        self.options = {'type': 'command'} if mode == 'command' else {}
+        self.reply = []
+        self.echo = []
+        self.lost = 0
+        self.count = 0
+        self.sent_at = None
+        self.replied = False
+        self.echoed = False
+        self.timeout = None
+
+    def start(self):
+        if self.count == N:
+            loop.quit()
+            return False
+        self.count += 1
+        self.replied = False
+        self.echoed = False
+        self.sent_at = time.perf_counter()
+        self.chrc.WriteValue(VALUE, self.options,
+                             reply_handler=self.reply_cb,
+                             error_handler=self.error_cb,
+                             dbus_interface=client.GATT_CHRC_IFACE)
+        self.timeout = GLib.timeout_add(int(TIMEOUT * 1000), self.timeout_cb)
+        return False
+
+    def reply_cb(self):
+        self.reply.append(time.perf_counter() - self.sent_at)
+        self.replied = True
+        self.maybe_next()
+
+    def notify_cb(self, iface, changed_props, invalidated_props):
+        if 'Value' not in changed_props or self.sent_at is None or self.echoed:
+            return
+        self.echo.append(time.perf_counter() - self.sent_at)
+        self.echoed = True
+        self.maybe_next()
+
+    def error_cb(self, error):
+        print(self.mode, 'write failed:', error)
+        self.lost += 1
+        self.next()
+
+    def timeout_cb(self):
+        self.timeout = None
+        self.lost += 1
+        self.next()
+        return False
+
+    # 두 방식 모두 reply 와 echo 를 다 받은 뒤 다음 write (TIMEOUT 안에 echo 가 없으면 lost)
+    def maybe_next(self):
+        if self.replied and self.echoed:
+            self.next()
+
+    def next(self):
+        if self.timeout is not None:
+            GLib.source_remove(self.timeout)
+            self.timeout = None
+        self.sent_at = None
+        GLib.idle_add(self.start)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+def report(b):
+    for name, values in (('reply', b.reply), ('echo', b.echo)):
+        if not values:
+            continue
+        print(f"{b.mode:8s} {name:5s} n={len(values):4d}  "
+              f"mean {statistics.mean(values) * 1000:7.2f} ms  "
+              f"p50 {percentile(values, 0.5):7.2f} ms  "
+              f"p95 {percentile(values, 0.95):7.2f} ms")
+    print(f"{b.mode:8s} lost {b.lost}")
+
+
+def main():
+    global loop
+    DBusGMainLoop(set_as_default=True)
+    bus = dbus.SystemBus()
+    chrc = find_chrc(bus)
+    loop = GLib.MainLoop()
+
+    chrc.StartNotify(dbus_interface=client.GATT_CHRC_IFACE)
+    prop_iface = dbus.Interface(chrc, client.DBUS_PROP_IFACE)
+    for mode in ('request', 'command'):
+        b = Bench(chrc, mode)
+        match = prop_iface.connect_to_signal('PropertiesChanged', b.notify_cb)
+        GLib.idle_add(b.start)
+        loop.run()
+        match.remove()
+        report(b)
+
+
+if __name__ == '__main__':
+    main()
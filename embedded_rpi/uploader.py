@@ -0,0 +1,390 @@
+# BLE 콜백(GLib 메인 루프)에서 바로 HTTP POST 하지 않도록
+# 업로드 요청을 큐에 넣고 백그라운드 워커 스레드가 처리함
+import queue
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+import logs
+import metrics
+
+log = logs.get_logger('uploader')
+# 서버가 죽어 있으면 이벤트마다 에러가 나므로 10초에 1번만
+LOG_ERROR_RATE = logs.rate(1, 10)
+
+UPLOAD_LATENCY = metrics.REGISTRY.histogram(
+    'fhth_upload_latency_seconds', 'HTTP upload request latency', ('api',))
+UPLOAD_STATUS = metrics.REGISTRY.counter(
+    'fhth_upload_http_status_total', 'HTTP upload responses by status code '
+    '(error = no response)', ('api', 'code'))
+
+UPLOAD_PORT = 3000
+
+
+# 응답은 왔지만 2xx 가 아님. 연결 실패와 똑같이 실패로 처리 (spool 에서 지우지 않고 재시도)
+class UploadError(Exception):
+    def __init__(self, status):
+        super().__init__(f'HTTP {status}')
+        self.status = status
+
+
+def check_status(status):
+    if not 200 <= status < 300:
+        raise UploadError(status)
+    return status
+
+
+# keep-alive 커넥션 풀을 쓰는 HTTP 클라이언트
+# 이벤트마다 TCP 연결을 새로 만들지 않도록 업로더들이 하나를 같이 씀
+class HttpClient:
+    def __init__(self, host='localhost', port=UPLOAD_PORT, pool_size=4,
+                 connect_timeout=2.0, read_timeout=5.0):
+        self.base_url = f'http://{host}:{port}/'
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              pool_block=False)
+        self.session.mount('http://', adapter)
+
+    def post(self, api, data):
+        res = self.session.post(self.base_url + api, json=data,
+                                timeout=self.timeout)
+        return res.status_code
+
+    def close(self):
+        self.session.close()
+
+
+# UploadQueue(워커 스레드) 와 aio_uploader.AsyncUploadQueue(코루틴) 가 같이 쓰는 업로드 정책
+# 성공 판정(2xx), 실패한 이벤트 처리(버림 / 재시도 / spool 에 남김), backoff, replay 속도,
+# 통계/메트릭은 여기 한 곳에만 둠. 런타임별 클래스에는 큐, 스레드/코루틴, 기다리는 방법만 남김
+#
+# spool 을 주면 모든 이벤트가 디스크 spool 을 거쳐서 나감
+#  - 워커 1개가 큐 -> spool 로 옮기고, sender 1개가 spool 앞에서부터 순서대로 전송
+#  - 전송 실패(2xx 가 아닌 응답 포함) 시 spool 에 남겨두고 backoff 후 재시도
+#  - 재연결 후 밀린 이벤트는 replay_rate(개/초) 로 제한해서 다시 보냄
+# spool 이 없으면 일반 이벤트는 한 번만 보내보고 실패하면 버림
+# urgent=True 로 넣은 이벤트(알림)는 따로 된 우선 lane 으로 나감
+#  - 전용 큐 + 전용 워커라서 밀린 일반 이벤트/spool 뒤에 줄 서지 않음
+#  - spool 이 있으면 보내기 전에 spool 의 urgent 테이블에 먼저 기록(commit)하고,
+#    그 테이블을 앞에서부터 보내서 2xx 를 받은 것만 지움. 실패하면 backoff 후 다시 (알림끼리 순서 유지)
+#    전송 중에 꺼지거나 전원이 나가도 알림은 남아 있다가 다음 실행 때 제일 먼저 나감
+#  - spool 이 없으면 메모리에서 backoff 후 재시도하고 종료할 때 못 보낸 알림은 버림
+class UploadPolicy:
+    def __init__(self, client, spool, replay_batch, replay_rate, max_backoff):
+        self.client = client
+        self.spool = spool
+        self.replay_batch = replay_batch
+        self.replay_rate = replay_rate
+        self.max_backoff = max_backoff
+        self.replaying = False
+        self.lock = threading.Lock()
+
+        # 통계 값
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0    # 전송 실패로 버려진 이벤트 수
+        self.overflow = 0   # 큐가 가득 차서 버려진 가장 오래된 이벤트 수
+        self.retries = 0    # spool 전송 실패 후 재시도 횟수
+        self.urgent_sent = 0
+        self.urgent_retries = 0
+        self.urgent_backoff = 1
+
+    def _count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def depth(self):
+        return self.q.qsize()
+
+    def stats(self):
+        with self.lock:
+            stats = {'depth': self.q.qsize(),
+                     'enqueued': self.enqueued,
+                     'sent': self.sent,
+                     'dropped': self.dropped,
+                     'overflow': self.overflow,
+                     'urgent_depth': self.urgent.qsize(),
+                     'urgent_sent': self.urgent_sent,
+                     'urgent_retries': self.urgent_retries}
+        if self.spool is not None:
+            stats['spooled'] = len(self.spool)
+            stats['urgent_spooled'] = self.spool.urgent_rows
+            stats['evicted'] = self.spool.evicted
+            stats['retries'] = self.retries
+            stats['replaying'] = self.replaying
+        return stats
+
+    def _next_backoff(self, backoff):
+        return min(backoff * 2, self.max_backoff)
+
+    # client.post 전후. 메트릭 기록 + 2xx 가 아니면 UploadError
+    def _sent(self, api, start, status):
+        UPLOAD_LATENCY.labels(api).observe(time.perf_counter() - start)
+        UPLOAD_STATUS.labels(api, status).inc()
+        return check_status(status)
+
+    def _send_failed(self, api):
+        UPLOAD_STATUS.labels(api, 'error').inc()
+
+    # spool 없는 일반 이벤트: 실패하면 버림
+    def _bulk_done(self, status, error=None):
+        if error is None:
+            log.debug("server status: %s", status)
+            self._count('sent')
+        else:
+            log.warning("server error: %s", error, extra=LOG_ERROR_RATE)
+            self._count('dropped')
+
+    def _urgent_done(self, status):
+        log.debug("server status (urgent): %s", status)
+        self._count('urgent_sent')
+
+    def _urgent_failed(self, error):
+        log.warning("server error (urgent): %s", error, extra=LOG_ERROR_RATE)
+        self._count('urgent_retries')
+
+    # spool 의 urgent 테이블을 다 보냈으면(ok) None, 실패했으면 다음에 다시 보낼 시각(monotonic)
+    def _urgent_next(self, ok):
+        if ok:
+            self.urgent_backoff = 1
+            return None
+        retry_at = time.monotonic() + self.urgent_backoff
+        self.urgent_backoff = self._next_backoff(self.urgent_backoff)
+        return retry_at
+
+    # spool 에서 읽은 묶음. 한 번에 다 못 읽을 만큼 밀려 있으면 replay 상태
+    def _replay_rows(self, rows):
+        if not rows:
+            self.replaying = False
+        elif len(rows) >= self.replay_batch:
+            self.replaying = True
+
+    # spool 에서 하나 보냈을 때. replay 중이면 다음 전송까지 기다릴 시간(초)
+    def _replay_sent(self, status):
+        log.debug("server status: %s", status)
+        self._count('sent')
+        return 1 / self.replay_rate if self.replaying else 0
+
+    def _replay_failed(self, error):
+        log.warning("server error: %s", error, extra=LOG_ERROR_RATE)
+        self.replaying = True
+        self._count('retries')
+
+
+class UploadQueue(UploadPolicy):
+    def __init__(self, client=None, spool=None, maxsize=256, workers=2,
+                 replay_batch=50, replay_rate=20, max_backoff=60,
+                 urgent_maxsize=64):
+        if spool is not None:
+            # 순서 유지를 위해 spool 에 쓰는 워커는 하나만
+            workers = 1
+        if client is None:
+            # 일반 워커 + 우선 lane 이 각자 커넥션을 씀
+            client = HttpClient(pool_size=workers + 1)
+        UploadPolicy.__init__(self, client, spool, replay_batch, replay_rate, max_backoff)
+        self.q = queue.Queue(maxsize)
+        self.urgent = queue.Queue(urgent_maxsize)
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+
+        self.workers = []
+        for i in range(workers):
+            t = threading.Thread(target=self._worker, name=f"uploader-{i}",
+                                 daemon=True)
+            t.start()
+            self.workers.append(t)
+
+        self.urgent_worker = threading.Thread(target=self._urgent_worker,
+                                              name="uploader-urgent", daemon=True)
+        self.urgent_worker.start()
+
+        self.sender = None
+        if spool is not None:
+            self.sender = threading.Thread(target=self._spool_sender,
+                                           name="uploader-spool", daemon=True)
+            self.sender.start()
+
+    # 콜백에서 호출. 절대 블록되지 않음
+    # 큐가 가득 찼으면 가장 오래된 이벤트를 버리고 새 이벤트를 넣음
+    def put(self, data, api, urgent=False):
+        q = self.urgent if urgent else self.q
+        item = (data, api)
+        while True:
+            try:
+                q.put_nowait(item)
+                break
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                    q.task_done()
+                except queue.Empty:
+                    continue
+                self._count('overflow')
+        self._count('enqueued')
+
+    # 큐에 남은 이벤트를 모두 보낼 때까지 대기
+    def join(self):
+        self.urgent.join()
+        self.q.join()
+
+    # 남은 이벤트/알림은 spool 로 옮김 (spool 이 없으면 알림은 한 번씩 더 보내보고 안 되면 버림)
+    # timeout(초) 을 주면 그 안에 안 끝난 스레드는 기다리지 않음 (daemon 스레드라 프로세스와 같이 끝남)
+    def stop(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def left():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        try:
+            for _ in self.workers:
+                self.q.put(None, timeout=left())
+            for t in self.workers:
+                t.join(left())
+            self.stopped.set()
+            self.urgent.put(None, timeout=left())
+            self.urgent_worker.join(left())
+        except queue.Full:
+            self.stopped.set()
+        if self.sender is not None:
+            self.wakeup.set()
+            self.sender.join(left())
+        threads = self.workers + [self.urgent_worker, self.sender]
+        if any(t is not None and t.is_alive() for t in threads):
+            log.warning("upload queue stop timed out (%d queued, %d urgent)",
+                        self.q.qsize(), self.urgent.qsize())
+            if self.spool is not None:
+                self.spool.sync()
+        elif self.spool is not None:
+            self.spool.close()
+
+    def _send(self, data, api):
+        start = time.perf_counter()
+        try:
+            status = self.client.post(api, data)
+        except Exception:
+            self._send_failed(api)
+            raise
+        return self._sent(api, start, status)
+
+    def _worker(self):
+        while True:
+            item = self.q.get()
+            try:
+                if item is None:
+                    return
+                data, api = item
+                if self.spool is not None:
+                    self.spool.append(api, data)
+                    self.wakeup.set()
+                    continue
+                try:
+                    self._bulk_done(self._send(data, api))
+                except Exception as e:
+                    self._bulk_done(None, e)
+            finally:
+                self.q.task_done()
+
+    def _urgent_worker(self):
+        if self.spool is not None:
+            self._urgent_spool_worker()
+            return
+        while True:
+            item = self.urgent.get()
+            try:
+                if item is None:
+                    return
+                data, api = item
+                backoff = 1
+                while True:
+                    try:
+                        self._urgent_done(self._send(data, api))
+                        break
+                    except Exception as e:
+                        self._urgent_failed(e)
+                    if self.stopped.wait(backoff):
+                        self._count('dropped')
+                        break
+                    backoff = self._next_backoff(backoff)
+            finally:
+                self.urgent.task_done()
+
+    # 새 알림은 urgent 테이블에 기록만 하고, 보내는 건 테이블 앞에서부터
+    # retry_at: 다음 전송 시각 (None 이면 보낼 게 없어서 새 알림이 올 때까지 대기)
+    def _urgent_spool_worker(self):
+        # 지난 실행에서 못 보낸 알림부터
+        retry_at = 0 if self.spool.urgent_rows else None
+        while True:
+            timeout = None if retry_at is None else max(0.0, retry_at - time.monotonic())
+            try:
+                item = self.urgent.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                self.urgent.task_done()
+                return
+            if item:
+                data, api = item
+                try:
+                    self.spool.append(api, data, urgent=True)
+                finally:
+                    self.urgent.task_done()
+                if retry_at is None:
+                    retry_at = 0
+            if retry_at is not None and time.monotonic() >= retry_at:
+                retry_at = self._urgent_next(self._send_urgent_rows())
+
+    # 실패하면 거기서 멈추고 False (남은 건 다음 시도 때 그 자리부터)
+    def _send_urgent_rows(self):
+        while True:
+            rows = self.spool.peek(self.replay_batch, urgent=True)
+            if not rows:
+                return True
+            for rid, api, data in rows:
+                try:
+                    status = self._send(data, api)
+                except Exception as e:
+                    self._urgent_failed(e)
+                    return False
+                self.spool.ack(rid, urgent=True)
+                self._urgent_done(status)
+
+    def _spool_sender(self):
+        backoff = 1
+        while not self.stopped.is_set():
+            rows = self.spool.peek(self.replay_batch)
+            self._replay_rows(rows)
+            if not rows:
+                self.spool.sync()
+                self.wakeup.wait(1)
+                self.wakeup.clear()
+                continue
+
+            acked = None
+            failed = False
+            for rid, api, data in rows:
+                if self.stopped.is_set():
+                    break
+                try:
+                    status = self._send(data, api)
+                except Exception as e:
+                    self._replay_failed(e)
+                    failed = True
+                    break
+                acked = rid
+                delay = self._replay_sent(status)
+                if delay:
+                    time.sleep(delay)
+
+            if acked is not None:
+                self.spool.ack(acked)
+
+            if failed:
+                # 새 이벤트가 들어와도 backoff 동안은 기다림
+                self.stopped.wait(backoff)
+                backoff = self._next_backoff(backoff)
+            else:
+                backoff = 1
+        self.spool.sync()
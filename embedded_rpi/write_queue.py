@@ -0,0 +1,159 @@
+# GATT WriteValue 큐
+# BLE(ATT)는 연결 하나에 응답 기다리는 요청을 하나만 보낼 수 있으므로 기기마다 큐 하나로 write 를 직렬화함
+#  - 한 번에 하나만 전송(in-flight 1개), 응답이 오면 다음 것 전송
+#  - coalesce=True 인 char 는 아직 안 보낸 write 가 있으면 값만 바꿈 (마지막 값이 이김)
+#  - 실패하면 backoff 후 max_retries 번까지 다시 보냄
+#    단 Unconfirmed(보냈지만 결과 확인 못 함)는 재시도하지 않음
+#  - retry=False 로 넣은 write 는 어떤 에러든 재시도하지 않음 (급식 명령처럼 두 번 가면 안 되는 write)
+#    WriteValue 에러(NoReply, 연결 끊김 등)는 기기에 이미 갔는지 알 수 없으므로
+#  - submit() 은 WriteRequest 를 리턴, 끝나면 add_done_callback 으로 등록한 함수 호출
+import collections
+import time
+
+from device_supervisor import Backoff
+import logs
+
+log = logs.get_logger('write_queue')
+
+
+# 기기에 보낸 건 맞지만 동작했는지 확인 못 함 (예: command write 의 notify echo 가 안 옴)
+# 기기가 이미 동작 중일 수 있으므로 재시도하지 않고 그대로 끝냄
+class Unconfirmed(Exception):
+    pass
+
+
+class WriteRequest:
+    def __init__(self, key, value, retry, clock):
+        self.key = key
+        self.value = value
+        self.retry = retry
+        self.submitted_at = clock()
+        self.attempts = 0
+        self.done = False
+        self.error = None
+        self.latency = None
+        self.callbacks = []
+
+    def add_done_callback(self, fn):
+        if self.done:
+            fn(self)
+        else:
+            self.callbacks.append(fn)
+
+    def _finish(self, now, error=None):
+        self.done = True
+        self.error = error
+        self.latency = now - self.submitted_at
+        for fn in self.callbacks:
+            try:
+                fn(self)
+            except Exception as e:
+                log.error("write callback failed: %s", e)
+        self.callbacks = []
+
+
+class WriteQueue:
+    # issue(key, value, reply_handler, error_handler): 실제 WriteValue 호출
+    # timer_add(ms, fn): 재시도 예약 (GLib.timeout_add)
+    def __init__(self, name, issue, timer_add, max_retries=3, backoff=None,
+                 clock=time.monotonic):
+        self.name = name
+        self.issue = issue
+        self.timer_add = timer_add
+        self.max_retries = max_retries
+        self.backoff = backoff if backoff is not None else Backoff(base=0.2, cap=5.0)
+        self.clock = clock
+
+        self.pending = collections.deque()
+        self.inflight = None
+        self.waiting_retry = False
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.unconfirmed = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.latency = collections.deque(maxlen=64)
+
+    def submit(self, key, value, coalesce=False, retry=True, callback=None):
+        if coalesce:
+            for req in self.pending:
+                if req.key == key:
+                    req.value = value
+                    self.coalesced += 1
+                    if callback is not None:
+                        req.add_done_callback(callback)
+                    return req
+
+        req = WriteRequest(key, value, retry, self.clock)
+        if callback is not None:
+            req.add_done_callback(callback)
+        self.pending.append(req)
+        self.submitted += 1
+        self._kick()
+        return req
+
+    def __len__(self):
+        return len(self.pending) + (self.inflight is not None)
+
+    def _kick(self):
+        if self.inflight is not None or self.waiting_retry or not self.pending:
+            return
+        req = self.inflight = self.pending.popleft()
+        req.attempts += 1
+        try:
+            self.issue(req.key, req.value,
+                       lambda *args: self._on_reply(req),
+                       lambda error: self._on_error(req, error))
+        except Exception as e:
+            self._on_error(req, e)
+
+    def _on_reply(self, req):
+        now = self.clock()
+        self.inflight = None
+        self.completed += 1
+        self.backoff.reset()
+        req._finish(now)
+        self.latency.append(req.latency)
+        self._kick()
+
+    def _on_error(self, req, error):
+        self.inflight = None
+        unconfirmed = isinstance(error, Unconfirmed)
+        if req.retry and not unconfirmed and req.attempts <= self.max_retries:
+            self.retries += 1
+            delay = self.backoff.next()
+            log.warning("%s write %s failed (%s), retry in %.2f s",
+                        self.name, req.key, error, delay)
+            # 재시도할 요청을 맨 앞에 다시 넣고 backoff 동안은 다음 것도 보내지 않음 (순서 유지)
+            self.pending.appendleft(req)
+            self.waiting_retry = True
+            self.timer_add(int(delay * 1000), self._retry)
+            return
+
+        if unconfirmed:
+            self.unconfirmed += 1
+        else:
+            self.failed += 1
+        self.backoff.reset()
+        req._finish(self.clock(), error)
+        self._kick()
+
+    def _retry(self):
+        self.waiting_retry = False
+        self._kick()
+        return False
+
+    def stats(self):
+        latency = list(self.latency)
+        return {'queued': len(self),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'unconfirmed': self.unconfirmed,
+                'retries': self.retries,
+                'coalesced': self.coalesced,
+                'last_latency': latency[-1] if latency else None,
+                'avg_latency': sum(latency) / len(latency) if latency else None,
+                'max_latency': max(latency) if latency else None}